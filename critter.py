@@ -19,12 +19,97 @@ PARTY = 12345
 HEAL = 54321
 
 DAMAGE_ATTACKED = 25
+
+
+class UniformPolicy():
+    """
+    A class-level stand-in for getMove or interact, for critters that
+    don't look at their info at all and just pick uniformly at random from
+    a few choices. Declaring one lets the model draw the choices for every
+    critter of that class in one batch instead of calling each of them.
+
+    e.g. MOVE_POLICY = critter.UniformPolicy(critter.NORTH, critter.SOUTH)
+    """
+    def __init__(self, *choices):
+        if not choices:
+            raise ValueError("A policy needs at least one choice.")
+        self.choices = choices
+
+    # @param rng A critter_random.CritterRandom.
+    # @param n How many choices to draw.
+    # @returns A list of n choices.
+    def draw(self, rng, n):
+        choices = self.choices
+        return [choices[i] for i in rng.indexes(len(choices), n)]
+
+    def __repr__(self):
+        return '%s%r' % (self.__class__.__name__, self.choices)
+
+
+class ConstantPolicy(UniformPolicy):
+    """
+    A policy that always picks the same thing, e.g.
+    INTERACT_POLICY = critter.ConstantPolicy(critter.ROAR)
+    """
+    def __init__(self, choice):
+        UniformPolicy.__init__(self, choice)
+
+    def draw(self, rng, n):
+        return [self.choices[0]] * n
+
+
+def get_policy(critter_class, policy_name, method_name):
+    """
+    Returns the policy critter_class declares under policy_name, or None
+    if it doesn't have one. A subclass that overrides the method itself
+    (say getMove) doesn't inherit its parent's policy for it.
+    """
+    for klass in critter_class.__mro__:
+        if policy_name in vars(klass):
+            return vars(klass)[policy_name]
+        if method_name in vars(klass):
+            return None
+    return None
+
     
 class Critter():
     """
     The base Critter class.
     """
 
+    # _cell is where the list backend keeps the critter's position, as
+    # x * height + y (see critter_model.CellPositions).
+    #
+    # These are slots rather than __dict__ entries, since a big world has
+    # hundreds of thousands of critters. Subclasses still get a __dict__
+    # for their own attributes unless they declare __slots__ too, e.g.
+    # __slots__ = () for a critter that doesn't keep anything.
+    __slots__ = ('health', 'karma', '_cell')
+
+    # Optional batch policies standing in for getMove and interact, for
+    # critters whose choice doesn't depend on anything they see or keep
+    # (see UniformPolicy). The model then draws the whole class's moves or
+    # actions in one batch per tick instead of calling each critter, so
+    # the methods only need to agree with the policy for anyone calling
+    # them directly. Leave them as None to have your methods called as
+    # usual.
+    MOVE_POLICY = None
+    INTERACT_POLICY = None
+
+    # Set this to False in a class body to keep critter_discovery from
+    # listing that class (its subclasses still get listed), for bases
+    # that are machinery rather than something anybody plays.
+    DISCOVERABLE = True
+
+    def __new__(cls, *args, **kwargs):
+        # Set up here rather than in __init__, so subclasses that never
+        # call Critter.__init__ still work.
+        self = object.__new__(cls)
+        self.health = 100
+        self.karma = 0
+        self._cell = -1
+        return self
+
     def __init__(self):
         self.health = 100
         self.karma = 0
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmarks for the Critter simulation engine.
+
+Runs a set of standard scenarios on a fixed seed and reports ticks per
+second, microseconds per critter-step and peak memory for each. Use
+--json to get the numbers in a form you can diff against an earlier run.
+
+    python critter_bench.py
+    python critter_bench.py --scenario dense --json > after.json
+
+--memory breaks each scenario's memory down by component instead (see
+CritterModel.memory), after a few ticks.
+
+    python critter_bench.py --scenario crowd --memory
+
+--imports checks startup instead: each headless module has to import in a
+fresh interpreter within IMPORT_BUDGET seconds without dragging in the
+GUI, and the exit status says whether it did. test_imports.py runs the
+same check with the rest of the tests.
+
+    python critter_bench.py --imports
+"""
+import argparse
+import collections
+import critter_model
+import healer
+import json
+import os
+import partier
+import platform
+import pouncer
+import randomizer
+import roarer
+import scratcher
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+ALL_SPECIES = (pouncer.Pouncer, roarer.Roarer, scratcher.Scratcher,
+               healer.Healer, partier.Partier, randomizer.Randomizer)
+
+# A benchmark setup: world size, how many of each species, and how long
+# to run it for.
+Scenario = collections.namedtuple('Scenario', ['name', 'width', 'height', 'species', 'count', 'ticks', 'backend'])
+
+SCENARIOS = (
+    # What critter_main.quickfight does.
+    Scenario('quickfight', 50, 40, (pouncer.Pouncer, roarer.Roarer), 25, 1000, 'list'),
+    # What the interactive GUI does with every species in the directory.
+    Scenario('gui', 70, 40, ALL_SPECIES, 25, 500, 'list'),
+    Scenario('gui-crowded', 70, 40, ALL_SPECIES, 100, 500, 'list'),
+    Scenario('dense', 500, 500, ALL_SPECIES, 10000, 20, 'list'),
+    Scenario('dense-duel', 500, 500, (pouncer.Pouncer, roarer.Roarer), 30000, 20, 'list'),
+    Scenario('sparse', 5000, 5000, ALL_SPECIES, 500, 100, 'list'),
+    # 400k critters on the object engine, for keeping an eye on memory.
+    Scenario('crowd', 1000, 1000, ALL_SPECIES[:4], 100000, 3, 'list'),
+    # 100k x 100k with 20k critters; only the sparse backend can hold it.
+    Scenario('huge-sparse', 100000, 100000, ALL_SPECIES, 3334, 10, 'sparse'),
+)
+
+# How many ticks the memory pass runs for.
+MEMORY_TICKS = 5
+
+# Modules that have to stay importable without Tk, for headless runs.
+HEADLESS_MODULES = ('critter_main', 'critter_model', 'critter_tournament', 'critter_checkpoint')
+
+# What none of them is allowed to import.
+GUI_MODULES = ('tkinter', '_tkinter', 'critter_gui')
+
+# Seconds a headless module gets to import in a fresh interpreter. They
+# take 20-45ms here, so this is room for a slow machine, not for numpy
+# or multiprocessing sneaking back into critter_main.
+IMPORT_BUDGET = 0.1
+
+# Fresh interpreters to try per module; the fastest one counts.
+IMPORT_RUNS = 3
+
+IMPORT_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import %s
+print(json.dumps([time.perf_counter() - start, [m for m in %r if m in sys.modules]]))
+'''
+
+# Result of one scenario.
+Measurement = collections.namedtuple('Measurement', ['scenario', 'critters', 'ticks', 'seconds',
+                                                     'ticks_per_sec', 'us_per_critter_step',
+                                                     'peak_bytes'])
+
+
+def build(scenario, seed):
+    "Makes and populates the model for a scenario."
+    model = critter_model.CritterModel(scenario.width, scenario.height, threading.Lock(),
+                                       backend=scenario.backend, seed=seed)
+    for species in scenario.species:
+        model.add(species, scenario.count)
+    return model
+
+
+def peak_memory(scenario, seed):
+    """
+    Returns the peak bytes allocated building a scenario's model and
+    running it for a few ticks. This is a separate pass because tracing
+    allocations slows everything way down.
+    """
+    tracemalloc.start()
+    try:
+        model = build(scenario, seed)
+        for i in range(min(scenario.ticks, MEMORY_TICKS)):
+            model.update()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def breakdown(scenario, seed):
+    "Returns a scenario's model.memory() after running it for a few ticks."
+    model = build(scenario, seed)
+    for i in range(min(scenario.ticks, MEMORY_TICKS)):
+        model.update()
+    return model.memory()
+
+
+def run(scenario, seed=0, domains=None):
+    """
+    Runs a single scenario, returning a Measurement. With domains, the
+    world gets split across that many processes (see critter_domains),
+    and peak memory isn't measured since it's spread over the workers.
+    """
+    model = build(scenario, seed)
+    if domains:
+        import critter_domains
+        model = critter_domains.DomainModel(model, domains)
+    steps = 0
+    start = time.perf_counter()
+    for i in range(scenario.ticks):
+        steps += sum(state.alive for state in model.critter_class_states.values())
+        model.update()
+    seconds = time.perf_counter() - start
+    if domains:
+        model.close()
+        peak = 0
+    else:
+        del model
+        peak = peak_memory(scenario, seed)
+    return Measurement(scenario.name, len(scenario.species) * scenario.count, scenario.ticks,
+                       seconds, scenario.ticks / seconds if seconds else float('inf'),
+                       1e6 * seconds / steps if steps else 0.0, peak)
+
+
+def import_cost(module):
+    """
+    Returns how long module takes to import in a fresh interpreter, and
+    which GUI modules came along with it.
+    """
+    best = None
+    for i in range(IMPORT_RUNS):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT % (module, GUI_MODULES)],
+                                check=True, stdout=subprocess.PIPE, universal_newlines=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        seconds, loaded = json.loads(output)
+        if best is None or seconds < best[0]:
+            best = (seconds, loaded)
+    return best
+
+
+def check_imports():
+    """
+    Prints the import cost of every headless module. Returns False if one
+    went over budget or loaded the GUI.
+    """
+    ok = True
+    for module in HEADLESS_MODULES:
+        seconds, loaded = import_cost(module)
+        problems = []
+        if seconds > IMPORT_BUDGET:
+            problems.append('over the %.2fs budget' % IMPORT_BUDGET)
+        if loaded:
+            problems.append('loads ' + ', '.join(loaded))
+        print('%-20s %8.1f ms  %s' % (module, 1000 * seconds, '; '.join(problems) or 'ok'))
+        ok = ok and not problems
+    return ok
+
+
+def format_measurement(m):
+    "Returns one result in a nice format."
+    return '%-12s %7d critters %6d ticks %10.1f ticks/s %8.2f us/step %10.1f KB peak' % (
+        m.scenario, m.critters, m.ticks, m.ticks_per_sec, m.us_per_critter_step, m.peak_bytes / 2 ** 10)
+
+
+def format_breakdown(name, report):
+    "Returns a scenario's memory breakdown, a line per component."
+    total = sum(report.values())
+    lines = ['%-12s %10.1f KB' % (name, total / 2 ** 10)]
+    for component, size in report.items():
+        lines.append('  %-14s %10.1f KB %5.1f%%' % (component, size / 2 ** 10, 100.0 * size / max(total, 1)))
+    return '\n'.join(lines)
+
+
+def compare(baseline, results):
+    """
+    Returns a line per scenario comparing results with a baseline loaded
+    from an earlier --json run: speedup in ticks/s and change in memory.
+    """
+    old = {r['scenario']: r for r in baseline['results']}
+    lines = []
+    for m in results:
+        before = old.get(m.scenario)
+        if before is None:
+            continue
+        lines.append('%-12s %6.2fx speed %+8.1f%% memory' % (
+            m.scenario, m.ticks_per_sec / before['ticks_per_sec'],
+            100.0 * (m.peak_bytes - before['peak_bytes']) / max(before['peak_bytes'], 1)))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=[s.name for s in SCENARIOS],
+                        help='scenario to run (can be repeated; default: all of them)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ticks', type=int, default=None, help='override every scenario\'s tick count')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--compare', metavar='FILE', default=None,
+                        help='compare against the JSON output of an earlier run')
+    parser.add_argument('--domains', type=int, metavar='N', default=None,
+                        help='split each world across N processes (list and sparse scenarios)')
+    parser.add_argument('--imports', action='store_true',
+                        help='check headless import time and that the GUI stays out of it')
+    parser.add_argument('--memory', action='store_true',
+                        help='break down each scenario\'s memory by component instead of timing it')
+    args = parser.parse_args()
+    if args.imports:
+        sys.exit(0 if check_imports() else 1)
+    scenarios = [s for s in SCENARIOS if not args.scenario or s.name in args.scenario]
+    if args.memory:
+        reports = {}
+        for scenario in scenarios:
+            reports[scenario.name] = breakdown(scenario, args.seed)
+            if not args.json:
+                print(format_breakdown(scenario.name, reports[scenario.name]))
+                sys.stdout.flush()
+        if args.json:
+            print(json.dumps({'seed': args.seed, 'python': platform.python_version(), 'memory': reports},
+                             indent=2))
+        return
+    results = []
+    for scenario in scenarios:
+        if args.ticks:
+            scenario = scenario._replace(ticks=args.ticks)
+        try:
+            m = run(scenario, args.seed, args.domains)
+        except ValueError as e:
+            # e.g. a world too narrow to split into domains
+            print('%-12s skipped: %s' % (scenario.name, e), file=sys.stderr)
+            continue
+        results.append(m)
+        if not args.json:
+            print(format_measurement(m))
+            sys.stdout.flush()
+    if args.json:
+        print(json.dumps({'seed': args.seed,
+                          'python': platform.python_version(),
+                          'results': [m._asdict() for m in results]}, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(json.load(f), results), file=sys.stderr if args.json else sys.stdout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+Saving a CritterModel to disk and picking it back up later.
+
+A checkpoint is one binary file:
+
+    magic, version, header length     (struct, 16 bytes)
+    header                            (JSON: sizes, classes, class states,
+                                       move count, rules)
+    species, health, karma, x, y      (one int32 array each, one entry per
+                                       critter, in model.critters order)
+    extras                            (pickle: RNG state, pre-drawn policy
+                                       actions, critter instance state)
+
+The per-critter arrays are read straight out of a memory-mapped file, and
+critters get put back exactly where they were instead of going through
+add() and random_location(), so loading costs about one pass over the
+critters. Everything the engine knows about a critter lives in those
+arrays; whatever else a critter keeps on itself is opaque to us and goes
+through a StateCodec (by default, its __dict__ gets pickled).
+"""
+import array
+import critter_model
+import critter_rules
+import importlib
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+
+MAGIC = b'CRTRCKPT'
+VERSION = 1
+# magic, version, header length
+PREAMBLE = struct.Struct('<8sII')
+FIELDS = ('species', 'health', 'karma', 'x', 'y')
+
+# Attributes the engine manages itself, which are stored in the arrays.
+ENGINE_ATTRIBUTES = ('health', 'karma', '_cell')
+
+# Rules attributes that go into the checkpoint.
+RULE_NAMES = ('attack_damage', 'heal_restore', 'defend_karma', 'party_karma', 'heal_karma',
+              'attack_party_karma', 'attack_heal_karma', 'max_health')
+
+
+class CheckpointException(Exception):
+    pass
+
+
+class StateCodec():
+    """
+    Saves and restores whatever a critter keeps on itself beyond health,
+    karma and position. The default just pickles each critter's
+    __dict__ and whatever slots its class adds, and brings critters back
+    without calling their constructor. Subclass this for critters that
+    need something smarter.
+    """
+
+    def dump(self, critters):
+        "Returns one picklable state per critter."
+        return [self.state(c) for c in critters]
+
+    def state(self, c):
+        state = {k: v for k, v in getattr(c, '__dict__', {}).items() if k not in ENGINE_ATTRIBUTES}
+        for name in slot_names(c.__class__):
+            if hasattr(c, name):
+                state[name] = getattr(c, name)
+        return state or None
+
+    def load(self, critter_class, state):
+        "Makes a critter of critter_class from a state dump() returned."
+        c = critter_class.__new__(critter_class)
+        if state:
+            for name, value in state.items():
+                setattr(c, name, value)
+        return c
+
+
+def slot_names(critter_class):
+    "Returns the slots critter_class has on top of the engine's, as attribute names."
+    names = []
+    for klass in critter_class.__mro__:
+        slots = vars(klass).get('__slots__', ())
+        for name in [slots] if isinstance(slots, str) else slots:
+            if name.startswith('__') and not name.endswith('__'):
+                # Private names get mangled, same as anywhere else.
+                name = '_%s%s' % (klass.__name__.lstrip('_'), name)
+            if name not in ENGINE_ATTRIBUTES and name not in ('__dict__', '__weakref__'):
+                names.append(name)
+    return names
+
+
+def class_spec(critter_class):
+    return [critter_class.__module__, critter_class.__qualname__]
+
+
+def find_class(spec):
+    module_name, name = spec
+    return getattr(importlib.import_module(module_name), name)
+
+
+def save(model, path, codec=None):
+    """
+    Writes model to path. The file gets written next to path first and
+    then moved into place, so a crash halfway never leaves a broken
+    checkpoint behind.
+    """
+    codec = codec or StateCodec()
+    classes = list(model.critter_class_states)
+    class_ids = {c: i for i, c in enumerate(classes)}
+    critters = list(model.critters)
+    columns = {field: array.array('i') for field in FIELDS}
+    positions = model.critter_positions
+    for c in critters:
+        pos = positions[c]
+        columns['species'].append(class_ids[c.__class__])
+        columns['health'].append(c.health)
+        columns['karma'].append(c.karma)
+        columns['x'].append(pos.x)
+        columns['y'].append(pos.y)
+
+    # Pre-drawn actions belong to policies, which belong to classes.
+    buffers = []
+    for policy, buffer in model.action_buffers.items():
+        for c in classes:
+            if model.traits(c).interact is policy:
+                buffers.append((class_ids[c], list(buffer)))
+                break
+    extras = pickle.dumps({'random': model.random.getstate(),
+                           'rolls': list(model.rolls),
+                           'buffers': buffers,
+                           'states': codec.dump(critters)}, protocol=pickle.HIGHEST_PROTOCOL)
+
+    rules = model.rules
+    header = {'width': model.width, 'height': model.height,
+              'backend': model.backend, 'move_count': model.move_count,
+              'byteorder': sys.byteorder, 'count': len(critters),
+              'classes': [class_spec(c) for c in classes],
+              'class_states': [[s.wins, s.alive, s.count, s.health, s.karma]
+                               for s in model.critter_class_states.values()],
+              'rules': {name: getattr(rules, name) for name in RULE_NAMES},
+              'extras_length': len(extras)}
+    header_bytes = json.dumps(header).encode('utf-8')
+    # Keep the arrays 8-byte aligned so they can be viewed in place.
+    header_bytes += b' ' * (-(PREAMBLE.size + len(header_bytes)) % 8)
+
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for field in FIELDS:
+            columns[field].tofile(f)
+        f.write(extras)
+    os.replace(temp, path)
+
+
+def load(path, list_lock, codec=None):
+    "Reads a checkpoint back into a brand new CritterModel."
+    codec = codec or StateCodec()
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            view = memoryview(data)
+            try:
+                return restore(view, list_lock, codec)
+            finally:
+                view.release()
+
+
+def restore(view, list_lock, codec):
+    magic, version, header_length = PREAMBLE.unpack_from(view)
+    if magic != MAGIC:
+        raise CheckpointException("That isn't a critter checkpoint.")
+    if version != VERSION:
+        raise CheckpointException("Can't read checkpoint version %s." % version)
+    offset = PREAMBLE.size
+    header = json.loads(bytes(view[offset:offset + header_length]))
+    offset += header_length
+    if header['backend'] not in critter_model.BACKENDS:
+        raise CheckpointException("Can't load a checkpoint from the %r backend." % header['backend'])
+    columns = {}
+    try:
+        return fill(view, offset, header, columns, list_lock, codec)
+    finally:
+        # Views into the file have to go before the file can close,
+        # error or not.
+        for column in columns.values():
+            if isinstance(column, memoryview):
+                column.release()
+
+
+def fill(view, offset, header, columns, list_lock, codec):
+    count = header['count']
+    for field in FIELDS:
+        column = view[offset:offset + 4 * count].cast('i')
+        if header['byteorder'] != sys.byteorder:
+            column = array.array('i', column)
+            column.byteswap()
+        columns[field] = column
+        offset += 4 * count
+    extras = pickle.loads(view[offset:offset + header['extras_length']])
+
+    model = critter_model.CritterModel(header['width'], header['height'], list_lock,
+                                       backend=header['backend'],
+                                       rules=critter_rules.Rules(**header['rules']))
+    classes = [find_class(spec) for spec in header['classes']]
+    for critter_class, (wins, alive, initial, health, karma) in zip(classes, header['class_states']):
+        state = critter_model.ClassInfo(wins, alive, initial, karma)
+        state.health = health
+        model.critter_class_states[critter_class] = state
+    model.move_count = header['move_count']
+
+    species = columns['species']
+    health = columns['health']
+    karma = columns['karma']
+    xs = columns['x']
+    ys = columns['y']
+    states = extras['states']
+    Point = critter_model.Point
+    grid = model.grid
+    positions = model.critter_positions
+    critters = model.critters
+    for i in range(count):
+        c = codec.load(classes[species[i]], states[i])
+        c.health = health[i]
+        c.karma = karma[i]
+        x = xs[i]
+        y = ys[i]
+        positions[c] = Point(x, y)
+        grid[x][y] = c
+        critters.append(c)
+
+    model.random.setstate(extras['random'])
+    model.rolls = array.array('d', extras['rolls'])
+    for class_id, buffer in extras['buffers']:
+        model.action_buffers[model.traits(classes[class_id]).interact] = buffer
+    return model
@@ -0,0 +1,202 @@
+"""
+Finding critters without importing everything in sight.
+
+Every .py file in a directory gets parsed with ast (not imported) to see
+which classes it defines and what they inherit from. A class is a critter
+if it inherits from critter.Critter, directly or through other critters,
+unless its own body says DISCOVERABLE = False (see critter.Critter).
+Only modules that turn out to have the critters somebody asked for get
+imported, so a directory full of student files (or the GUI) costs next
+to nothing until it's used.
+
+What each file defines is cached in CACHE_FILE next to the files, keyed
+on modification time and size, with a content hash to fall back on, so
+after the first run only files that changed get parsed again.
+"""
+import ast
+import collections
+import hashlib
+import importlib
+import json
+import os
+import sys
+
+CACHE_FILE = '.critter_cache.json'
+CACHE_VERSION = 3
+
+# Where the base of every critter comes from.
+ROOT = 'critter.Critter'
+
+# A critter found in the source: the module it's in and its class name.
+CritterSpec = collections.namedtuple('CritterSpec', ['module', 'name'])
+
+
+def class_bases(source, module):
+    """
+    Returns a list of (class name, [base, ...], discoverable) for every
+    top-level class in source, with each base spelled out as 'module.Name'
+    as far as the module's own imports tell us. A bare name that could
+    have come from a * import gets listed once for each place it might
+    be from. discoverable is False for a class whose body sets
+    DISCOVERABLE = False.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+    # Local name -> what it really is, from the imports.
+    names = {}
+    # Modules imported with *, any of which a name we can't place might
+    # have come from.
+    stars = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname:
+                    names[alias.asname] = alias.name
+                else:
+                    top = alias.name.split('.')[0]
+                    names[top] = top
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            for alias in node.names:
+                if alias.name == '*':
+                    stars.append(node.module)
+                else:
+                    names[alias.asname or alias.name] = node.module + '.' + alias.name
+
+    classes = []
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        bases = []
+        for base in node.bases:
+            dotted = dotted_name(base)
+            if dotted is None:
+                continue
+            head, _, rest = dotted.partition('.')
+            if head in names:
+                bases.append(names[head] + ('.' + rest if rest else ''))
+            elif not rest:
+                bases.append(module + '.' + head)
+                # It could just as well be one of the names a * brought in.
+                bases.extend(star + '.' + head for star in stars)
+            else:
+                bases.append(dotted)
+        classes.append((node.name, bases, discoverable(node)))
+        # Later classes with the same base names refer to this one.
+        names[node.name] = module + '.' + node.name
+    return classes
+
+
+def discoverable(node):
+    "Whether a class body leaves DISCOVERABLE alone (or sets it to something true)."
+    for statement in node.body:
+        if (isinstance(statement, ast.Assign) and isinstance(statement.value, ast.Constant)
+                and any(isinstance(t, ast.Name) and t.id == 'DISCOVERABLE' for t in statement.targets)):
+            return bool(statement.value.value)
+    return True
+
+
+def dotted_name(node):
+    "Returns 'a.b.C' for an expression like a.b.C, or None for anything else."
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    parts.append(node.id)
+    return '.'.join(reversed(parts))
+
+
+def load_cache(path):
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('version') != CACHE_VERSION:
+        return {}
+    return cache.get('files', {})
+
+
+def save_cache(path, files):
+    "Writes the cache, if we can. Not being able to is no big deal."
+    temp = path + '.tmp'
+    try:
+        with open(temp, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'files': files}, f)
+        os.replace(temp, path)
+    except OSError:
+        pass
+
+
+def scan(directory='.'):
+    """
+    Returns a map of module name to its class_bases() list for
+    every .py file in directory, parsing only files that changed since
+    the cache was written.
+    """
+    cache_path = os.path.join(directory, CACHE_FILE)
+    cached = load_cache(cache_path)
+    files = {}
+    modules = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.py'):
+            continue
+        module = filename[:-3]
+        path = os.path.join(directory, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entry = cached.get(filename)
+        if entry is None or entry['mtime'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+            with open(path, 'rb') as f:
+                source = f.read()
+            digest = hashlib.sha1(source).hexdigest()
+            if entry is None or entry['hash'] != digest:
+                entry = {'hash': digest, 'classes': class_bases(source, module)}
+            entry = dict(entry, mtime=stat.st_mtime_ns, size=stat.st_size)
+        files[filename] = entry
+        modules[module] = entry['classes']
+    if files != cached:
+        save_cache(cache_path, files)
+    return modules
+
+
+def find_critters(directory='.'):
+    """
+    Returns a CritterSpec for every Critter subclass defined in a .py file
+    in directory, without importing any of them.
+    """
+    modules = scan(directory)
+    known = {ROOT}
+    found = []
+    # Critters can inherit from critters in other files, so keep going
+    # until a pass turns up nothing new.
+    changed = True
+    while changed:
+        changed = False
+        for module, classes in modules.items():
+            for name, bases, shown in classes:
+                full = module + '.' + name
+                if full not in known and any(base in known for base in bases):
+                    known.add(full)
+                    if shown:
+                        found.append(CritterSpec(module, name))
+                    changed = True
+    order = {}
+    for module, classes in modules.items():
+        for name, bases, shown in classes:
+            order[(module, name)] = len(order)
+    found.sort(key=lambda spec: order[spec])
+    return found
+
+
+def load(specs, directory='.'):
+    "Imports the modules for specs, returning their classes in the same order."
+    path = os.path.abspath(directory)
+    if path not in (os.path.abspath(p) for p in sys.path):
+        sys.path.insert(0, path)
+    return [getattr(importlib.import_module(spec.module), spec.name) for spec in specs]
@@ -0,0 +1,327 @@
+"""
+One big world, split across worker processes.
+
+The torus gets cut into 2 * processes vertical strips, at least
+MIN_STRIP columns wide, numbered left to right. Worker k owns strips 2k
+(its even strip) and 2k + 1 (its odd strip), and keeps their critters
+in a sparse CritterModel of its own, so all the usual move, interact
+and getNeighbor code runs unchanged. A tick goes:
+
+  phase A  every worker runs its even strip, all at once
+  phase B  every worker runs its odd strip, all at once
+
+While a strip runs, both of its neighbors are frozen. A critter can step
+one column past its strip, and what interact gets to see around its
+opponent reaches one column further, so each running strip gets a halo
+two columns deep on each side. The nearer column, which critters can
+step into, fight in and get pushed into, is lent to the running worker
+for the phase and handed back afterwards. The farther one only needs to
+be seen, so the running worker gets a copy of it that it throws away
+after the phase. Since strips are at least three columns wide, no column
+is ever lent to two workers at the same time, and no column one running
+strip can see is one another running strip can change.
+
+The rules, which differ a little from a single CritterModel:
+
+  - A critter gets its turn in the phase of the strip it's in when that
+    phase starts. Within a strip, turns go in a shuffled order drawn
+    from the owning worker's random stream.
+  - Every critter gets at most one turn a tick. A critter that moves
+    into a strip that hasn't had its phase yet doesn't go again there; a
+    critter that gets pushed (by losing a fight and swapping places)
+    into a strip that's running or has already run misses its turn.
+  - Critters in a lent column don't take turns, but can be fought,
+    killed, or pushed just like anybody else.
+
+Each worker's random stream is seeded from the model's seed and the
+worker's number, so the same seed and the same number of processes
+always give the same run. A different number of processes cuts the
+world differently, and gives a different (equally valid) run.
+"""
+import critter_model
+import multiprocessing
+import os
+import threading
+import traceback
+
+# Narrowest a strip can be. Three columns keeps what a strip lends to one
+# neighbor apart from what it shows the other, and both apart from each
+# other.
+MIN_STRIP = 3
+
+
+class DomainException(Exception):
+    pass
+
+
+def strip_bounds(width, processes):
+    "Returns the left edge of each of the 2 * processes strips, plus width at the end."
+    strips = 2 * processes
+    return [width * i // strips for i in range(strips + 1)]
+
+
+class Domain():
+    """
+    A worker's share of the world: its even strip [even, odd) and its odd
+    strip [odd, end), in a sparse model the size of the whole world that
+    only has these strips' critters in it (plus whatever halo it's
+    borrowing). Only the model's grid and critter_positions get used;
+    turn order comes from critter_positions, which keeps insertion order.
+    """
+
+    def __init__(self, width, height, even, odd, end, classes, rules, seed):
+        self.model = critter_model.CritterModel(width, height, threading.Lock(), backend='sparse',
+                                                rules=rules, seed=seed)
+        # Class states here only count what happened here, starting from
+        # zero, so the coordinator can just add them up.
+        for critter_class in classes:
+            self.model.critter_class_states[critter_class] = critter_model.ClassInfo()
+        self.classes = classes
+        self.width = width
+        self.even = even
+        self.odd = odd
+        self.end = end
+        # Critters that have had their turn this tick.
+        self.moved = set()
+
+    def take(self, x, items):
+        "Puts critters at column x: items is a list of (y, critter, moved)."
+        model = self.model
+        column = model.grid[x]
+        for y, c, moved in items:
+            model.critter_positions[c] = critter_model.Point(x, y)
+            column[y] = c
+            if moved:
+                self.moved.add(c)
+
+    def lend(self, x):
+        "Takes every critter at column x out, and returns them as (y, critter, moved) items."
+        model = self.model
+        column = model.grid[x]
+        items = []
+        for y in range(model.height):
+            c = column[y]
+            if c is not None:
+                items.append((y, c, c in self.moved))
+                del model.critter_positions[c]
+                column[y] = None
+                self.moved.discard(c)
+        return items
+
+    def show(self, x, items):
+        """
+        Puts copies of a neighbor's critters at column x, as (y, critter)
+        items, for critters here to see but not touch. Does nothing if
+        column x is ours (when there's only one worker), since the real
+        ones are already there.
+        """
+        if self.even <= x < self.end:
+            return
+        column = self.model.grid[x]
+        for y, c in items:
+            column[y] = c
+
+    def hide(self, x):
+        "Throws away the copies show() put at column x."
+        if self.even <= x < self.end:
+            return
+        column = self.model.grid[x]
+        for y in range(self.model.height):
+            column[y] = None
+
+    def view(self, x):
+        "Returns the critters at column x as (y, critter) items, leaving them there."
+        column = self.model.grid[x]
+        return [(y, column[y]) for y in range(self.model.height) if column[y] is not None]
+
+    def run(self, start, stop):
+        "Gives every critter in columns [start, stop) that hasn't moved yet its turn."
+        model = self.model
+        turns = [c for c, pos in model.critter_positions.items() if start <= pos.x < stop and c not in self.moved]
+        turns = [turns[i] for i in model.random.permutation(len(turns))]
+        # The same turns a CritterModel gives; the dead come off the board
+        # (and out of critter_positions) as they go.
+        model.play(turns, model.plan_moves(turns))
+        self.moved.update(turns)
+
+    def tally(self):
+        "Returns (wins, alive, health, karma) per class, for what happened here."
+        states = self.model.critter_class_states
+        return [(states[c].wins, states[c].alive, states[c].health, states[c].karma)
+                for c in self.classes]
+
+    # One method per step of a tick; see DomainModel.update. What goes
+    # between workers is (lent items, shown items) one way, and the lent
+    # items coming back the other.
+
+    def begin(self):
+        self.moved.clear()
+        return self.lend((self.end - 1) % self.width), self.view((self.end - 2) % self.width)
+
+    def phase_a(self, borrowed):
+        lent, shown = borrowed
+        halo = (self.even - 1) % self.width
+        self.take(halo, lent)
+        self.show((self.even - 2) % self.width, shown)
+        self.run(self.even, self.odd)
+        self.hide((self.even - 2) % self.width)
+        return self.lend(halo)
+
+    def between(self, returned):
+        self.take((self.end - 1) % self.width, returned)
+        return self.lend(self.even), self.view(self.even + 1)
+
+    def phase_b(self, borrowed):
+        lent, shown = borrowed
+        halo = self.end % self.width
+        self.take(halo, lent)
+        self.show((self.end + 1) % self.width, shown)
+        self.run(self.odd, self.end)
+        self.hide((self.end + 1) % self.width)
+        return self.lend(halo)
+
+    def finish(self, returned):
+        self.take(self.even, returned)
+        return self.tally()
+
+
+def worker(conn, args):
+    "Worker process main loop: call Domain methods until told to stop with None."
+    try:
+        domain = Domain(*args)
+    except Exception:
+        conn.send((False, traceback.format_exc()))
+        return
+    conn.send((True, None))
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        name, task_args = task
+        try:
+            conn.send((True, getattr(domain, name)(*task_args)))
+        except Exception:
+            conn.send((False, traceback.format_exc()))
+    conn.close()
+
+
+class DomainModel():
+    """
+    Runs a populated CritterModel's world across processes worker
+    processes (one per core by default). It takes over the model's
+    critters; use this instead of the model from then on. It has the
+    same update, stats, stream and results as a CritterModel. Call
+    close() when done.
+    """
+
+    def __init__(self, model, processes=None):
+        width = model.width
+        processes = min(processes or os.cpu_count() or 1, width // (2 * MIN_STRIP))
+        if processes < 1:
+            raise ValueError("A world %d wide is too narrow to split." % width)
+        self.width = width
+        self.height = model.height
+        self.move_count = model.move_count
+        self.processes = processes
+        self.classes = list(model.critter_class_states)
+        # Where every class stood before the split; the workers report
+        # what happened since.
+        self.start = [(s.wins, s.alive, s.health, s.karma) for s in model.critter_class_states.values()]
+        self.critter_class_states = {}
+        for critter_class, (wins, alive, health, karma) in zip(self.classes, self.start):
+            state = critter_model.ClassInfo(wins, alive, model.critter_class_states[critter_class].count, karma)
+            state.health = health
+            self.critter_class_states[critter_class] = state
+
+        bounds = strip_bounds(width, processes)
+        seed = model.random.initial_seed
+        self.conns = []
+        self.workers = []
+        for k in range(processes):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            args = (width, model.height, bounds[2 * k], bounds[2 * k + 1], bounds[2 * k + 2],
+                    self.classes, model.rules, (seed * 1000003 + k) % 2 ** 63)
+            process = multiprocessing.Process(target=worker, args=(child_conn, args), daemon=True)
+            process.start()
+            child_conn.close()
+            self.conns.append(parent_conn)
+            self.workers.append(process)
+        self.receive()
+
+        # Hand every critter to whoever owns its column, a column at a time.
+        owner = [0] * width
+        for k in range(processes):
+            for x in range(bounds[2 * k], bounds[2 * k + 2]):
+                owner[x] = k
+        columns = {}
+        for c in model.critters:
+            pos = model.critter_positions[c]
+            columns.setdefault(pos.x, []).append((pos.y, c, False))
+        for x in sorted(columns):
+            self.conns[owner[x]].send(('take', (x, sorted(columns[x], key=lambda item: item[0]))))
+            self.receive([self.conns[owner[x]]])
+
+    def receive(self, conns=None):
+        "Collects one reply from each of conns (default: every worker)."
+        replies = []
+        for conn in conns or self.conns:
+            try:
+                ok, value = conn.recv()
+            except (EOFError, OSError):
+                raise DomainException("A domain worker died.")
+            if not ok:
+                raise DomainException("A domain worker failed:\n" + value)
+            replies.append(value)
+        return replies
+
+    def call(self, name, args):
+        "Calls name(*args[k]) on worker k, for every worker at once."
+        for conn, task_args in zip(self.conns, args):
+            conn.send((name, task_args))
+        return self.receive()
+
+    def update(self):
+        "Runs one tick: phase A, then phase B, with halos traded around them."
+        n = self.processes
+        self.move_count += 1
+        lent = self.call('begin', [()] * n)
+        # Worker k borrows its left neighbor's odd-strip edge (and sees
+        # the column before it)...
+        back = self.call('phase_a', [(lent[k - 1],) for k in range(n)])
+        # ...gives it back, and lends out its even-strip edge (and shows
+        # the column after it)...
+        lent = self.call('between', [(back[(k + 1) % n],) for k in range(n)])
+        # ...to its left neighbor, which runs its odd strip against them.
+        back = self.call('phase_b', [(lent[(k + 1) % n],) for k in range(n)])
+        tallies = self.call('finish', [(back[k - 1],) for k in range(n)])
+        for i, critter_class in enumerate(self.classes):
+            wins, alive, health, karma = self.start[i]
+            for tally in tallies:
+                wins += tally[i][0]
+                alive += tally[i][1]
+                health += tally[i][2]
+                karma += tally[i][3]
+            state = self.critter_class_states[critter_class]
+            state.wins = wins
+            state.alive = alive
+            state.health = health
+            state.karma = karma
+
+    # These only need move_count, critter_class_states and update(),
+    # which we keep the same way a CritterModel does.
+    stats = critter_model.CritterModel.stats
+    stream = critter_model.CritterModel.stream
+    results = critter_model.CritterModel.results
+
+    def close(self):
+        "Stops the workers."
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for process, conn in zip(self.workers, self.conns):
+            process.join()
+            conn.close()
+        self.conns = []
+        self.workers = []
@@ -1,21 +1,59 @@
 #!/usr/bin/env python3
 import tkinter as tk
-import threading
-import critter_model
-import critter_main
+import array
+import critter_profile
+import critter_runner
 import color
+import functools
 
 EMPTY_CHAR = '.'
 
+# Pixels per cell when each cell is drawn as a character.
+CELL_SIZE = 15
+
+# Worlds with more cells than this get drawn as a bitmap, since one canvas
+# item per cell stops being workable somewhere past here.
+BITMAP_CELLS = 100 * 100
+
+# About how many pixels across the bitmap gets to be. Worlds wider than
+# this get several cells to a pixel.
+BITMAP_PIXELS = 1000
+
+# What empty cells look like in a bitmap.
+EMPTY_COLOR = color.Color(255, 255, 255)
+
+# How often the board gets redrawn, in milliseconds.
+FRAME_MS = 33
+
+# Ticks per second for each speed on the slider. The top speed is as fast
+# as the model can go.
+TICK_RATES = (1, 2, 5, 10, 20, 50, 100, 200, 500, None)
+
 
 class CritterGUI():
-    def __init__(self, model):
+    def __init__(self, model, bitmap_above=BITMAP_CELLS, runner=None):
+        """
+        Worlds with more than bitmap_above cells get the bitmap renderer
+        instead of a character per cell. runner is what to draw frames
+        from, if not a critter_runner.Runner on model (a
+        critter_replay.Player, say).
+        """
         # Keep track of whether the simulation is currently running or not.
         self.is_running = False
         
         self.model = model
-        self.width = 15*self.model.width
-        self.height = 15*self.model.height
+        self.bitmap = model.width * model.height > bitmap_above
+        # Cells per pixel across (and down), for worlds too big to give
+        # every cell a pixel of its own.
+        self.cells_per_pixel = 1
+        if self.bitmap:
+            longest = max(model.width, model.height)
+            self.cell_size = max(1, BITMAP_PIXELS // longest)
+            self.cells_per_pixel = -(-longest // BITMAP_PIXELS)
+        else:
+            self.cell_size = CELL_SIZE
+        self.width = self.cell_size * -(-self.model.width // self.cells_per_pixel)
+        self.height = self.cell_size * -(-self.model.height // self.cells_per_pixel)
 
         self.root = tk.Tk()
         self.root.grid()
@@ -45,7 +83,8 @@ class CritterGUI():
         self.speed_var = tk.IntVar()
         self.speed_var.set(10)
         self.scale = tk.Scale(self.root, variable = self.speed_var, orient='horizontal',
-                              length = 100, sliderlength = 10, from_=1, to=10)
+                              length = 100, sliderlength = 10, from_=1, to=10,
+                              command = self.changeSpeed)
         self.scale.grid(column = 1, row = 10)
 
         # Move count.
@@ -73,100 +112,236 @@ class CritterGUI():
                                       width = 6, command = self.reset)
         self.reset_button.grid(column = 11, row = 10)
 
-        # Representation of the critter world.
-        self.chars = [[self.canvas.create_text((x*15 + 7.5, y*15+7.5), text='', font=('Courier New', -15))
-                       for y in range(self.model.height)]
-                      for x in range(self.model.width)]
+        # Representation of the critter world. This sits on top of the
+        # background rectangle since it's made after it.
+        if self.bitmap:
+            self.renderer = BitmapRenderer(self.canvas, self.model.width, self.model.height,
+                                           self.cell_size, self.cells_per_pixel)
+        else:
+            self.renderer = TextRenderer(self.canvas, self.model.width, self.model.height)
+
+        # The simulation runs on its own thread, and we draw whatever
+        # it's gotten to every FRAME_MS.
+        if runner is None:
+            runner = critter_runner.Runner(self.model, TICK_RATES[self.speed_var.get() - 1])
+        else:
+            runner.tick_rate = TICK_RATES[self.speed_var.get() - 1]
+        self.runner = runner
+        self.root.protocol('WM_DELETE_WINDOW', self.close)
 
         # Display current critter model.
-        self.display()
+        self.update()
         self.start()
 
-    def draw_char(self, char, color, x, y):
-        """
-        Displays a single char at position (x, y) on the canvas.
-        """
-        self.canvas.itemconfig(self.chars[x][y], text=char, fill=color_to_hex(color), font='Courier 13 bold')
-        self.canvas.tag_raise(self.chars[x][y])
-
     def display(self):
         """
-        Draw all characters representing critters or empty spots.
+        Draws the newest frame from the runner, if there is one. Only cells
+        in the frame get touched.
         """
-        # Clear screen
-        self.canvas.tag_raise(self.rectangle)
-        # Draw all critters
-        for x in range(self.model.width):
-            for y in range(self.model.height):
-                critter = self.model.grid[x][y]
-                if critter:
-                    self.draw_char(critter.getChar(), critter.getColor(), x, y)
-                else:
-                    self.draw_char(EMPTY_CHAR, color.BLACK, x, y)
-    
+        frame = self.runner.take_frame()
+        if frame is None:
+            return
+        profiler = self.model.profiler
+        if profiler is not None:
+            start = critter_profile.clock()
+        self.renderer.draw(frame)
+        self.showMoveCount(frame.tick)
+        self.changeClassState(frame.states)
+        if profiler is not None:
+            profiler.add('render', None, critter_profile.clock() - start)
+
     def update(self):
         """
-        Repeatedly updates the GUI with the appropriate characters and colors from
-        the critter simulation, until stop button is pressed to pause simulation. 
+        Redraws at a fixed frame rate for as long as the window is open.
+        The simulation itself runs on the runner's thread, at whatever
+        speed the slider says.
         """
-        if self.is_running == True:
-            self.model.update()
-            self.display()
-            self.incrementMove()
-            self.changeClassState()
-            self.root.after(int(500/self.speed_var.get()), self.update)
-
-    def incrementMove(self):
+        self.display()
+        self.root.after(FRAME_MS, self.update)
+
+    def showMoveCount(self, move_count):
         """
-        Increment move count by one and display.
+        Display the move count.
         """
-        self.move_count=self.move_count+1
-        self.move_count_label.config(text=str(self.move_count)+' moves')
+        if move_count != self.move_count:
+            self.move_count = move_count
+            self.move_count_label.config(text=str(self.move_count)+' moves')
 
-    def changeClassState(self):
+    def changeClassState(self, states):
         """
         Change the display of states of all critter classes.
         """
-        for x in range(self.num_classes):
-            alive=self.model.critter_class_states[self.critter_classes[x]].alive
-            wins=self.model.critter_class_states[self.critter_classes[x]].wins
-            karma=self.model.critter_class_states[self.critter_classes[x]].karma
-            health=self.model.critter_class_states[self.critter_classes[x]].health
+        for name, (alive, wins, health, karma) in states.items():
+            label = self.class_state_labels.get(name)
+            if label is None:
+                continue
             total=alive+wins
-            self.class_state_labels[self.critter_classes[x].__name__].config(text=self.critter_classes[x].__name__+": "+
+            label.config(text=name+": "+
 			    str(alive)+" + "+str(wins)+" = "+ str(total) + "\nKarma: " + str(karma) + " Health: " + str(health))
-                                                                                 
+
+    def changeSpeed(self, value):
+        "Sets the target tick rate from the speed slider."
+        self.runner.tick_rate = TICK_RATES[int(value) - 1]
+
     def go(self):
         "Actually runs the GUI. Pretty straightforward."
         self.is_running = True
-        self.update()
+        self.runner.go()
      
     def stop(self):
         "Pause updating."
         self.is_running = False
+        self.runner.stop()
 
     def tick(self):
         "Move all critters by 1 step."
         self.is_running = False
-        self.model.update()
-        self.display()
-        self.incrementMove()
-        self.changeClassState()
+        self.runner.step()
 
     def reset(self):
         "Stop simulation, reset critter model."
         self.is_running = False
-        self.model.reset(25)
-        self.display()
-        self.move_count = 0
-        self.move_count_label.config(text='0 moves')
+        self.runner.reset(25)
+
+    def close(self):
+        "Shut down the runner along with the window."
+        self.runner.close()
+        self.root.destroy()
 
     def start(self):
         self.root.mainloop()
 
+class TextRenderer():
+    """
+    Draws each cell as a character in the critter's color, one canvas
+    text item per cell.
+    """
+
+    def __init__(self, canvas, width, height):
+        self.canvas = canvas
+        self.width = width
+        self.height = height
+        self.chars = [[canvas.create_text((x*CELL_SIZE + CELL_SIZE/2, y*CELL_SIZE + CELL_SIZE/2),
+                                          text='', font='Courier 13 bold')
+                       for y in range(height)]
+                      for x in range(width)]
+        # What's currently drawn in each cell, as (char, hex color), so
+        # cells that haven't changed don't get touched.
+        self.drawn = [[None for y in range(height)]
+                      for x in range(width)]
+
+    def draw_char(self, char, color, x, y):
+        """
+        Displays a single char at position (x, y) on the canvas, unless
+        it's already showing.
+        """
+        glyph = (char, color_to_hex(color))
+        if self.drawn[x][y] != glyph:
+            self.drawn[x][y] = glyph
+            self.canvas.itemconfig(self.chars[x][y], text=char, fill=glyph[1])
+
+    def draw(self, frame):
+        "Draws the cells in a frame."
+        glyphs = frame.glyphs
+        if frame.full:
+            cells = ((x, y) for x in range(self.width) for y in range(self.height))
+        else:
+            cells = glyphs
+        for x, y in cells:
+            glyph = glyphs.get((x, y))
+            if glyph:
+                self.draw_char(glyph[0], glyph[1], x, y)
+            else:
+                self.draw_char(EMPTY_CHAR, color.BLACK, x, y)
+
+
+class BitmapRenderer():
+    """
+    Draws each cell as a cell_size square of the critter's color into one
+    image, which goes to the canvas in one piece per frame. That's a
+    single canvas item however big the world is.
+
+    With cells_per_pixel above 1, each square covers a block of that many
+    cells across and down instead, and shows the color of the last
+    critter drawn into the block until the block is empty again.
+    """
+
+    def __init__(self, canvas, width, height, cell_size, cells_per_pixel=1):
+        self.cell_size = cell_size
+        self.step = cells_per_pixel
+        # The image's size, in squares.
+        self.columns = -(-width // cells_per_pixel)
+        self.rows = -(-height // cells_per_pixel)
+        self.row_bytes = 3 * self.columns * cell_size
+        self.header = b'P6 %d %d 255\n' % (self.columns * cell_size, self.rows * cell_size)
+        self.blank = color_to_rgb(EMPTY_COLOR) * (self.columns * cell_size * self.rows * cell_size)
+        self.pixels = bytearray(self.blank)
+        if cells_per_pixel > 1:
+            # Which cells have a critter in them, and how many of those
+            # each block has, so a block goes blank once its last one leaves.
+            self.occupied = set()
+            self.counts = array.array('l', bytes(array.array('l').itemsize * self.columns * self.rows))
+        self.image = tk.PhotoImage(width=self.columns * cell_size, height=self.rows * cell_size)
+        self.item = canvas.create_image(0, 0, anchor='nw', image=self.image)
+
+    def fill(self, x, y, rgb):
+        "Paints square (x, y) the color rgb."
+        run = rgb * self.cell_size
+        start = y * self.cell_size * self.row_bytes + 3 * x * self.cell_size
+        for i in range(self.cell_size):
+            self.pixels[start:start + len(run)] = run
+            start += self.row_bytes
+
+    def shrink(self, glyphs):
+        """
+        Draws glyphs a block at a time, keeping track of which cells are
+        taken so a block goes blank once its last critter is gone.
+        """
+        step = self.step
+        occupied = self.occupied
+        counts = self.counts
+        empty = color_to_rgb(EMPTY_COLOR)
+        for cell, glyph in glyphs.items():
+            x = cell[0] // step
+            y = cell[1] // step
+            block = y * self.columns + x
+            if glyph:
+                if cell not in occupied:
+                    occupied.add(cell)
+                    counts[block] += 1
+                self.fill(x, y, color_to_rgb(glyph[1]))
+            elif cell in occupied:
+                occupied.discard(cell)
+                counts[block] -= 1
+                if not counts[block]:
+                    self.fill(x, y, empty)
+
+    def draw(self, frame):
+        "Draws the cells in a frame, then sends the image over."
+        if frame.full:
+            self.pixels[:] = self.blank
+            if self.step > 1:
+                self.occupied.clear()
+                self.counts = array.array('l', bytes(len(self.counts) * self.counts.itemsize))
+        if self.step > 1:
+            self.shrink(frame.glyphs)
+        else:
+            empty = color_to_rgb(EMPTY_COLOR)
+            for (x, y), glyph in frame.glyphs.items():
+                self.fill(x, y, color_to_rgb(glyph[1]) if glyph else empty)
+        self.image.configure(data=self.header + bytes(self.pixels), format='ppm')
+
+
+@functools.lru_cache(maxsize=None)
 def color_to_hex(color):
     """
     Converts RGB colors to hex string, because tkinter thought that
     passing numeric types as strings was an AWESOME idea.
     """
     return '#%02x%02x%02x'.upper() % (color.r, color.g, color.b)
+
+
+@functools.lru_cache(maxsize=None)
+def color_to_rgb(color):
+    "Converts a color to the 3 bytes a PPM image wants for it."
+    return bytes((color.r, color.g, color.b))
@@ -0,0 +1,133 @@
+"""
+Per-class population curves that don't grow with the length of a run.
+
+A History keeps alive, wins, health and karma for every class, every
+tick, in two fixed-size NumPy stores:
+
+  - recent: the last capacity ticks at full resolution, in a ring buffer.
+    Each sample gets written twice, capacity apart, so the newest
+    capacity ticks are always one contiguous slice and recent() can hand
+    back a view instead of a copy.
+  - summary: the whole run, in at most buckets buckets of min, max and
+    mean. Each bucket starts out covering one tick; when they run out,
+    neighbors get merged pairwise and each bucket covers twice as many
+    ticks from then on.
+
+Appending is O(1) (amortized, for the merges), and memory is set once up
+front, so a ten-million-tick run costs the same as a thousand-tick one.
+Turn it on with model.record_history().
+"""
+import collections
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FIELDS = ('alive', 'wins', 'health', 'karma')
+
+# Ticks kept at full resolution.
+DEFAULT_CAPACITY = 4096
+
+# Buckets in the whole-run summary.
+DEFAULT_BUCKETS = 1024
+
+# The whole-run summary. Each bucket starts at ticks[i]; min, max and
+# mean are (bucket, class, field) arrays.
+Summary = collections.namedtuple('Summary', ['ticks', 'min', 'max', 'mean'])
+
+
+class History():
+    """
+    Time series for a fixed set of classes, in the order given.
+    """
+
+    def __init__(self, class_names, capacity=DEFAULT_CAPACITY, buckets=DEFAULT_BUCKETS):
+        if np is None:
+            raise ImportError("Recording history needs numpy installed.")
+        if buckets < 2 or buckets % 2:
+            raise ValueError("buckets has to be an even number, at least 2.")
+        self.class_names = list(class_names)
+        self.capacity = capacity
+        shape = (len(self.class_names), len(FIELDS))
+        self.ticks = np.zeros(2 * capacity, dtype=np.int64)
+        self.values = np.zeros((2 * capacity,) + shape, dtype=np.int64)
+        # Samples written so far.
+        self.count = 0
+
+        self.buckets = buckets
+        # Samples per bucket.
+        self.span = 1
+        self.bucket_ticks = np.zeros(buckets, dtype=np.int64)
+        self.low = np.zeros((buckets,) + shape, dtype=np.int64)
+        self.high = np.zeros((buckets,) + shape, dtype=np.int64)
+        self.total = np.zeros((buckets,) + shape, dtype=np.float64)
+        self.samples = np.zeros(buckets, dtype=np.int64)
+        # Buckets in use, counting the one being filled.
+        self.used = 0
+
+    def append(self, tick, values):
+        "Adds one tick's worth of values, a (class, field) array or nested list."
+        values = np.asarray(values, dtype=np.int64)
+        i = self.count % self.capacity
+        self.ticks[i] = self.ticks[i + self.capacity] = tick
+        self.values[i] = self.values[i + self.capacity] = values
+        self.count += 1
+
+        b = self.used - 1
+        if b < 0 or self.samples[b] == self.span:
+            if self.used == self.buckets:
+                self.merge()
+            b = self.used
+            self.used += 1
+            self.bucket_ticks[b] = tick
+            self.low[b] = values
+            self.high[b] = values
+            self.total[b] = values
+            self.samples[b] = 1
+        else:
+            np.minimum(self.low[b], values, out=self.low[b])
+            np.maximum(self.high[b], values, out=self.high[b])
+            self.total[b] += values
+            self.samples[b] += 1
+
+    def merge(self):
+        "Halves the resolution of the summary, freeing up half the buckets."
+        half = self.buckets // 2
+        self.bucket_ticks[:half] = self.bucket_ticks[0::2]
+        self.low[:half] = np.minimum(self.low[0::2], self.low[1::2])
+        self.high[:half] = np.maximum(self.high[0::2], self.high[1::2])
+        self.total[:half] = self.total[0::2] + self.total[1::2]
+        self.samples[:half] = self.samples[0::2] + self.samples[1::2]
+        self.used = half
+        self.span *= 2
+
+    def recent(self):
+        """
+        Returns (ticks, values) for the last capacity ticks, oldest first,
+        as views into the buffer. values is a (tick, class, field) array.
+        They're only good until the next append.
+        """
+        n = min(self.count, self.capacity)
+        start = self.count % self.capacity if self.count > self.capacity else 0
+        return self.ticks[start:start + n], self.values[start:start + n]
+
+    def series(self, class_name, field):
+        "Returns (ticks, values) of one class's field over the recent ticks, as views."
+        ticks, values = self.recent()
+        return ticks, values[:, self.class_names.index(class_name), FIELDS.index(field)]
+
+    def summary(self):
+        """
+        Returns a Summary of the whole run. ticks, min and max are views;
+        mean gets worked out fresh.
+        """
+        used = self.used
+        counts = self.samples[:used].reshape(-1, 1, 1)
+        return Summary(self.bucket_ticks[:used], self.low[:used], self.high[:used],
+                       self.total[:used] / counts)
+
+    def nbytes(self):
+        "How much memory the stores take, which never changes."
+        return sum(a.nbytes for a in (self.ticks, self.values, self.bucket_ticks, self.low,
+                                      self.high, self.total, self.samples))
@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
 
 import argparse
-import critter
+import critter_discovery
 import critter_model
-import critter_gui
-import inspect
-import os
+import json
+import sys
 import threading
 
 #import tiger, elephant, stone, mouse, chameleon
@@ -13,25 +12,18 @@ import threading
 STANDARD_CRITTERS = ()
 
 
-def get_critters(directory='.'):
+def get_critters(directory='.', names=None):
     """
     Finds all critter definitions in the given directory and returns them
     as a list of class objects. Only classes which subclass our Critter
-    will be included.
-    """
-    files = filter(lambda x: x.endswith('.py'), os.listdir(directory))
-    modules = map(lambda x: x[:-3], files)
-    critters = []
-    for module in modules:
-        exec('import %s' % module)
-        for name, obj in inspect.getmembers(eval(module)):
-            # This should use issubclass(obj, Critter), but that doesn't work
-            # for reasons I don't understand. Provided nobody decides to create
-            # a non-Critter class which has a getMove method, we're fine.
-            if inspect.isclass(obj) and hasattr(obj, 'getMove'):
-                critters.append(obj)
-    critters.remove(critter.Critter)
-    return critters
+    will be included. The files are only read, not imported, to find
+    them, and then only the modules with the critters we want get
+    imported: the ones called names, if given, or else all of them.
+    """
+    specs = critter_discovery.find_critters(directory)
+    if names is not None:
+        specs = [spec for spec in specs if spec.name in names]
+    return critter_discovery.load(specs, directory)
 
 def populate_model(model):
     for standard in STANDARD_CRITTERS:
@@ -42,31 +34,175 @@ def format_results(results):
     return '\n'.join(['%s:%20s wins %3s alive %3s total %3s health %3s karma' % (critter.__name__, state.wins, state.alive, state.wins + state.alive, state.health, state.karma)
                       for critter, state in results])
 
-def quickfight(critter1, critter2, iterations=1000):
+def quickfight(critter1, critter2, iterations=1000, seed=None, profile=False,
+               call_budget=None, tick_budget=0.25):
     """
     Fight critter1 and critter2 with the standard classes,
-    without showing a GUI. Prints the results at the end.
+    without showing a GUI. Prints the results at the end, and where the
+    time went if profile is set. With a call_budget, the two of them run
+    sandboxed on that budget (see critter_sandbox), and anybody that went
+    over gets listed.
     """
-    c = critter_model.CritterModel(50, 40, threading.Lock())
-    populate_model(c)
-    c.add(critter1, 25)
-    c.add(critter2, 25)
-    for i in range(iterations):
-        c.update()
+    c = critter_model.CritterModel(50, 40, threading.Lock(), seed=seed)
+    if profile:
+        c.enable_profiling()
+    sandbox = None
+    if call_budget is not None:
+        # Like the tournament and checkpoint code below, the sandbox (and
+        # multiprocessing) only gets loaded by the modes that use it.
+        import critter_sandbox
+        sandbox = critter_sandbox.Sandbox(call_budget, tick_budget, c.width, c.height,
+                                          c.random.initial_seed)
+    try:
+        if sandbox is not None:
+            critter1 = sandbox.wrap(critter1)
+            critter2 = sandbox.wrap(critter2)
+        populate_model(c)
+        c.add(critter1, 25)
+        c.add(critter2, 25)
+        for i in range(iterations):
+            c.update()
+    finally:
+        if sandbox is not None:
+            sandbox.close()
     print(format_results(c.results()))
+    if profile:
+        print()
+        print(c.profiler.report())
+    if sandbox is not None and sandbox.report():
+        print()
+        print('Over budget:')
+        print(sandbox.report())
+
+def tournament(critters, seeds, processes=None, first_seed=0, profile=False,
+               call_budget=None, tick_budget=0.25):
+    """
+    Plays every pairing of critters against each other (with the
+    standard classes) once per seed, in parallel. Prints the standings,
+    and where the time went over all matches if profile is set. With a
+    call_budget, the critters run sandboxed, as in quickfight.
+    """
+    import critter_tournament
+    settings = critter_tournament.Settings(standards=STANDARD_CRITTERS, profile=profile,
+                                           call_budget=call_budget, tick_budget=tick_budget)
+    results = critter_tournament.run_tournament(critters, seeds, processes, settings, first_seed)
+    names = [c.__name__ for c in critters]
+    print(critter_tournament.format_standings(critter_tournament.standings(results), names))
+    if profile:
+        print(critter_tournament.merged_profile(results).report())
+        print()
+    flags = critter_tournament.format_flags(results)
+    if flags:
+        print('Over budget:')
+        print(flags)
+        print()
+    errors = critter_tournament.format_errors(results)
+    if errors:
+        print('Errors:')
+        print(errors)
+
+def evaluate(critter1, critter2, target_width=0.2, max_replicates=200, first_seed=0):
+    """
+    Plays critter1 against critter2 (with the standard classes) over
+    and over until their win rate and karma share are known to within
+    target_width, or max_replicates matches have been played. Prints the
+    estimate.
+    """
+    import critter_matchup
+    import critter_tournament
+    settings = critter_tournament.Settings(standards=STANDARD_CRITTERS)
+    result, replicates = critter_matchup.evaluate(critter1, critter2, settings, target_width,
+                                                  max_replicates=max_replicates, first_seed=first_seed)
+    print(critter_matchup.format_estimate(result, settings))
+
+def replay(path, every=None, ticks=None, out=sys.stdout):
+    """
+    Plays back a replay file: in the GUI, or if every is set, as JSON
+    stats every `every` ticks (for `ticks` ticks, or all of it) to out,
+    the same as stream() would have printed.
+    """
+    import critter_replay
+    recording = critter_replay.Replay(path)
+    try:
+        if every is None:
+            import critter_gui
+            gui = critter_gui.CritterGUI(critter_replay.View(recording),
+                                         runner=critter_replay.Player(recording))
+            gui.start()
+            return
+        stop = None if ticks is None else recording.first + ticks
+        for stats in recording.stats(stop=stop):
+            tick = stats['tick'] - recording.first
+            if tick and (tick % every == 0 or stats['tick'] in (stop, recording.last)):
+                out.write(json.dumps(stats) + '\n')
+        out.flush()
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    finally:
+        recording.close()
 
-def showfight(critter1, critter2):
+def stream(model, every, ticks=None, out=sys.stdout, checkpoint=None, checkpoint_every=None):
+    """
+    Runs model headless, writing its stats every `every` ticks to out as
+    one flushed JSON object per line. Runs for `ticks` ticks, or until
+    interrupted (or whoever is reading goes away) if that's None. If
+    checkpoint is a path, the model gets saved there every
+    checkpoint_every ticks and once more when the run stops.
+    """
+    if checkpoint:
+        import critter_checkpoint
+    last_saved = model.move_count
+    try:
+        for stats in model.stream(every, ticks):
+            out.write(json.dumps(stats) + '\n')
+            out.flush()
+            if checkpoint and checkpoint_every and model.move_count - last_saved >= checkpoint_every:
+                critter_checkpoint.save(model, checkpoint)
+                last_saved = model.move_count
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    if checkpoint:
+        critter_checkpoint.save(model, checkpoint)
+
+def showfight(critter1, critter2, seed=None):
     """
     Fight critter1 and critter2 with the standard classes, with a
     GUI. Prints the results at the end.
     """
-    c = critter_model.CritterModel(50, 40, threading.Lock())
+    c = critter_model.CritterModel(50, 40, threading.Lock(), seed=seed)
     populate_model(c)
     c.add(critter1, 25)
     c.add(critter2, 25)
+    # The GUI (and tkinter) only gets loaded when there's a window to show.
+    import critter_gui
     gui = critter_gui.CritterGUI(c)
     gui.start()
 
+def headless_model(args, critters):
+    """
+    Builds the model for a --stream or --serve run: picked back up from
+    --resume, or else a fresh one with the --quickfight pair (and the
+    standard classes) or every critter.
+    """
+    if args.resume:
+        import critter_checkpoint
+        return critter_checkpoint.load(args.resume, threading.Lock())
+    width, height = (50, 40) if args.quickfight else (70, 40)
+    if args.size:
+        width, height = (int(n) for n in args.size.lower().split('x'))
+    model = critter_model.CritterModel(width, height, threading.Lock(), backend=args.backend,
+                                       seed=args.seed)
+    if args.quickfight:
+        populate_model(model)
+        for name in args.quickfight:
+            model.add(get_class(name, critters), 25)
+    else:
+        for critter in critters:
+            model.add(critter, 25)
+    if args.record:
+        model.record_replay(args.record)
+    return model
+
 def get_class(crittername, critterlist):
     """
     Returns the string name of a critter into the actual class
@@ -77,25 +213,123 @@ def get_class(crittername, critterlist):
             return c
     return None
 
+def positive_int(text):
+    "An argparse type for counts that have to be at least 1."
+    try:
+        n = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("%r isn't a whole number" % text)
+    if n < 1:
+        raise argparse.ArgumentTypeError("has to be at least 1, not %d" % n)
+    return n
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--quickfight', nargs=2, required=False)
     parser.add_argument('--fight', nargs=2, required=False)
+    parser.add_argument('--evaluate', nargs=2, required=False,
+                        help='play a pair over and over until their odds are known (see critter_matchup)')
+    parser.add_argument('--ci-width', type=float, default=0.2,
+                        help='how wide the 95%% intervals of an --evaluate can be (default: 0.2)')
+    parser.add_argument('--max-replicates', type=int, default=200,
+                        help='most matches an --evaluate plays (default: 200)')
+    parser.add_argument('--tournament', action='store_true',
+                        help='fight every pair of critters against each other')
+    parser.add_argument('--seeds', type=int, default=5,
+                        help='matches per pairing in a tournament')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes for a tournament (default: one per core)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the run (first seed, for a tournament)')
+    parser.add_argument('--stream', type=positive_int, metavar='K', default=None,
+                        help='run headless, printing JSON stats every K ticks '
+                             '(for the --quickfight pair, or every critter)')
+    parser.add_argument('--ticks', type=int, default=None,
+                        help='how many ticks to --stream for (default: forever)')
+    parser.add_argument('--checkpoint', metavar='FILE', default=None,
+                        help='save the --stream run to FILE as it goes')
+    parser.add_argument('--checkpoint-every', type=int, metavar='N', default=5000,
+                        help='ticks between checkpoints (default: 5000)')
+    parser.add_argument('--resume', metavar='FILE', default=None,
+                        help='pick a --stream or --serve run back up from a checkpoint')
+    parser.add_argument('--record', metavar='FILE', default=None,
+                        help='record the --stream or --serve run to a replay FILE (see critter_replay)')
+    parser.add_argument('--replay', metavar='FILE', default=None,
+                        help='play back a replay FILE in the GUI, or with --stream K as JSON stats')
+    parser.add_argument('--size', metavar='WxH', default=None,
+                        help='world size for --stream and --serve (default: 50x40 for a quickfight, else 70x40)')
+    parser.add_argument('--backend', choices=critter_model.BACKENDS, default='list',
+                        help="where --stream and --serve keep the world ('sparse' for huge, mostly empty ones)")
+    parser.add_argument('--domains', type=int, metavar='N', default=None,
+                        help='split the --stream world across N processes (see critter_domains)')
+    parser.add_argument('--serve', type=int, metavar='PORT', default=None,
+                        help='run headless and serve the run to browsers on localhost:PORT '
+                             '(for the --quickfight pair, or every critter; see critter_server)')
+    parser.add_argument('--tick-rate', type=float, default=10,
+                        help='ticks per second for --serve (default: 10, 0 for flat out)')
+    parser.add_argument('--profile', action='store_true',
+                        help='report where the time went (quickfight and tournament)')
+    parser.add_argument('--budget', type=float, metavar='MS', default=None,
+                        help='run the critters sandboxed, with MS milliseconds per call '
+                             '(quickfight and tournament; see critter_sandbox)')
+    parser.add_argument('--tick-budget', type=float, metavar='MS', default=250,
+                        help='milliseconds per tick for each sandboxed class (default: 250)')
     args = parser.parse_args()
-    critters = get_critters()
-    if args.quickfight:
+    call_budget = args.budget / 1000 if args.budget is not None else None
+    tick_budget = args.tick_budget / 1000
+    # Only import the critters we're going to use.
+    if (args.stream is not None or args.serve) and args.resume or args.replay:
+        wanted = ()
+    else:
+        wanted = args.quickfight or args.fight or args.evaluate
+    critters = get_critters(names=wanted)
+    if args.replay:
+        replay(args.replay, args.stream, args.ticks)
+    elif args.tournament:
+        tournament(critters, args.seeds, args.processes, args.seed or 0, args.profile,
+                   call_budget, tick_budget)
+    elif args.stream is not None:
+        model = headless_model(args, critters)
+        if args.domains:
+            if args.checkpoint or args.record:
+                parser.error("--checkpoint and --record don't work with --domains")
+            import critter_domains
+            model = critter_domains.DomainModel(model, args.domains)
+            try:
+                stream(model, args.stream, args.ticks)
+            finally:
+                model.close()
+        else:
+            stream(model, args.stream, args.ticks,
+                   checkpoint=args.checkpoint, checkpoint_every=args.checkpoint_every)
+            model.stop_replay()
+    elif args.serve:
+        # asyncio only gets loaded when there's something to serve.
+        import critter_server
+        server = critter_server.Server(headless_model(args, critters), port=args.serve,
+                                       tick_rate=args.tick_rate or None)
+        print('Serving on http://%s:%d/' % (server.host, server.port))
+        server.run()
+        server.model.stop_replay()
+    elif args.evaluate:
+        critter1 = get_class(args.evaluate[0], critters)
+        critter2 = get_class(args.evaluate[1], critters)
+        evaluate(critter1, critter2, args.ci_width, args.max_replicates, args.seed or 0)
+    elif args.quickfight:
         critter1 = get_class(args.quickfight[0], critters)
         critter2 = get_class(args.quickfight[1], critters)
-        quickfight(critter1, critter2)
+        quickfight(critter1, critter2, seed=args.seed, profile=args.profile,
+                   call_budget=call_budget, tick_budget=tick_budget)
     elif args.fight:
         critter1 = get_class(args.fight[0], critters)
         critter2 = get_class(args.fight[1], critters)
-        showfight(critter1, critter2)
+        showfight(critter1, critter2, seed=args.seed)
     else:
-        model = critter_model.CritterModel(70, 40, threading.Lock())
+        model = critter_model.CritterModel(70, 40, threading.Lock(), seed=args.seed)
         #populate_model(c)
         for critter in critters:
             model.add(critter, 25)
+        import critter_gui
         c = critter_gui.CritterGUI(model)
         input()
     
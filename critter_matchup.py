@@ -0,0 +1,134 @@
+"""
+How good is one critter class against another, to within a margin?
+
+A single quickfight is one noisy sample. evaluate() plays replicate
+matches of the pair, one seed after another, until the confidence
+intervals on critter1's win rate and karma share are both narrower than
+asked for, or it hits its replicate cap, whichever comes first.
+
+Each replicate is a tournament-style match (see critter_tournament.Settings)
+that stops early once either class is extinct, and gets scored as it
+stands then. The win rate counts a match critter1 finishes with more
+karma as a win and a tie as half. The karma share is critter1's karma
+over both classes' karma added up, counting negative karma as none (a
+half if that leaves nothing). The win rate
+interval is a Wilson score interval, so a pair that always goes the same
+way still needs a fair number of matches to converge; the karma share
+interval is a normal one off the sample variance.
+"""
+import collections
+import critter_model
+import critter_tournament
+import math
+import statistics
+import threading
+
+# How one replicate went: its seed, how many ticks it ran, and each
+# contender's (alive, karma) when it stopped.
+Replicate = collections.namedtuple('Replicate', ['seed', 'ticks', 'state1', 'state2'])
+
+# Where an evaluation ended up. The intervals are (low, high). converged
+# says whether both got narrow enough before max_replicates ran out.
+Estimate = collections.namedtuple('Estimate', ['critter1', 'critter2', 'replicates', 'ticks',
+                                               'win_rate', 'win_interval',
+                                               'karma_share', 'karma_interval', 'converged'])
+
+
+def play_replicate(model, critter1, critter2, settings, seed):
+    """
+    Plays one match of critter1 against critter2 on model (reusing it),
+    stopping early if either dies out. Returns a Replicate.
+    """
+    model.reseed(seed)
+    model.reset(settings.count, list(settings.standards) + [critter1, critter2])
+    states = model.critter_class_states
+    ticks = 0
+    while ticks < settings.iterations:
+        model.update()
+        ticks += 1
+        if states[critter1].alive == 0 or states[critter2].alive == 0:
+            break
+    return Replicate(seed, ticks, (states[critter1].alive, states[critter1].karma),
+                     (states[critter2].alive, states[critter2].karma))
+
+
+def score(replicate):
+    "Returns (win, karma share) for critter1 in a replicate."
+    karma1 = replicate.state1[1]
+    karma2 = replicate.state2[1]
+    win = 1.0 if karma1 > karma2 else 0.5 if karma1 == karma2 else 0.0
+    karma1 = max(karma1, 0)
+    total = karma1 + max(karma2, 0)
+    return win, karma1 / total if total else 0.5
+
+
+def z_score(confidence):
+    "The two-sided normal critical value for confidence, e.g. 1.96 for 0.95."
+    return statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def wilson(successes, n, z):
+    "The Wilson score interval for successes out of n, as (low, high)."
+    p = successes / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return (max(0.0, center - half), min(1.0, center + half))
+
+
+def normal(values, z):
+    "The normal interval on the mean of values, as (low, high)."
+    mean = statistics.fmean(values)
+    if len(values) < 2:
+        return (mean, mean)
+    half = z * statistics.stdev(values) / math.sqrt(len(values))
+    return (mean - half, mean + half)
+
+
+def estimate(critter1, critter2, replicates, confidence, target_width):
+    "Works out an Estimate from the replicates played so far."
+    z = z_score(confidence)
+    scores = [score(r) for r in replicates]
+    wins = [win for win, share in scores]
+    shares = [share for win, share in scores]
+    win_interval = wilson(sum(wins), len(wins), z)
+    karma_interval = normal(shares, z)
+    converged = (win_interval[1] - win_interval[0] <= target_width and
+                 karma_interval[1] - karma_interval[0] <= target_width)
+    return Estimate(critter1.__name__, critter2.__name__, len(replicates),
+                    sum(r.ticks for r in replicates),
+                    statistics.fmean(wins), win_interval,
+                    statistics.fmean(shares), karma_interval, converged)
+
+
+def evaluate(critter1, critter2, settings=None, target_width=0.2, confidence=0.95,
+             min_replicates=10, max_replicates=200, first_seed=0):
+    """
+    Plays critter1 against critter2 on seeds first_seed, first_seed + 1,
+    ... until both confidence intervals (at confidence) are at most
+    target_width wide, with at least min_replicates and at most
+    max_replicates matches. Returns (Estimate, list of Replicates).
+    """
+    settings = settings or critter_tournament.Settings()
+    model = critter_model.CritterModel(settings.width, settings.height, threading.Lock())
+    replicates = []
+    for seed in range(first_seed, first_seed + max(max_replicates, 1)):
+        replicates.append(play_replicate(model, critter1, critter2, settings, seed))
+        if (len(replicates) >= min_replicates and
+                estimate(critter1, critter2, replicates, confidence, target_width).converged):
+            break
+    return estimate(critter1, critter2, replicates, confidence, target_width), replicates
+
+
+def format_estimate(result, settings=None):
+    "Returns an Estimate as a few readable lines."
+    settings = settings or critter_tournament.Settings()
+    budget = result.replicates * settings.iterations
+    return '\n'.join([
+        '%s vs %s, %d matches (%s):' % (result.critter1, result.critter2, result.replicates,
+                                        'converged' if result.converged else 'hit the cap'),
+        '  win rate     %.3f  [%.3f, %.3f]' % ((result.win_rate,) + result.win_interval),
+        '  karma share  %.3f  [%.3f, %.3f]' % ((result.karma_share,) + result.karma_interval),
+        '  %d ticks, %.0f%% of %d matches at %d ticks each' % (
+            result.ticks, 100.0 * result.ticks / budget, result.replicates, settings.iterations),
+    ])
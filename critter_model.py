@@ -1,26 +1,234 @@
+import array
 import critter
-import critter_main
+import critter_profile
+import critter_rules
 import collections
+import collections.abc
 import color
-import inspect
-import random
-import os
-import pprint
-
-# some constants to help us
-ATTACK_DAMAGE = 25
-HEAL_RESTORE = 50
-DEFEND_KARMA = 1
-PARTY_KARMA = 3
-HEAL_KARMA = 5
-ATTACK_PARTY_KARMA = -PARTY_KARMA
-ATTACK_HEAL_KARMA = -HEAL_KARMA
+import critter_random
+import sys
+
+# Where a model can keep its world state.
+BACKENDS = ('list', 'sparse')
 
 # Just an (x, y) pair, but more readable.
 Point = collections.namedtuple('Point', ['x', 'y'])
 
-# Again, we don't really need a whole class just to store this info.
-CritterInfo = collections.namedtuple('CritterInfo', ['x', 'y', 'width', 'height', 'char', 'color', 'getNeighbor', 'getNeighborHealth'])
+# make_point(Point, (x, y)) is Point(x, y) without the trip through
+# namedtuple's __new__, which counts in the hot loops.
+make_point = tuple.__new__
+
+# Which way each direction steps, as (dx, dy). (0, 0) is the top-left.
+# SOUTHWEST and SOUTHEAST are mirrored, same as they've always been.
+OFFSETS = {critter.NORTH: (0, -1), critter.SOUTH: (0, 1),
+           critter.EAST: (1, 0), critter.WEST: (-1, 0),
+           critter.NORTHEAST: (1, -1), critter.NORTHWEST: (-1, -1),
+           critter.SOUTHWEST: (1, 1), critter.SOUTHEAST: (-1, 1),
+           critter.CENTER: (0, 0)}
+
+# Step tables per world size, shared between models.
+_step_tables = {}
+
+# Axes longer than this get their steps worked out on the fly instead of
+# looked up, so a huge world doesn't cost a huge table.
+MAX_TABLE = 1 << 14
+
+
+class Wrap():
+    "A step table row that's computed instead of stored: wrap[i] is (i + step) % size."
+    __slots__ = ('step', 'size')
+
+    def __init__(self, step, size):
+        self.step = step
+        self.size = size
+
+    def __getitem__(self, i):
+        return (i + self.step) % self.size
+
+
+def step_row(step, size):
+    if size > MAX_TABLE:
+        return Wrap(step, size)
+    return [(i + step) % size for i in range(size)]
+
+def step_tables(width, height):
+    """
+    Returns a map of direction to (xs, ys), where xs[x] and ys[y] are
+    where a step that way from (x, y) lands, wraparound and all. The world
+    wraps each axis on its own, so one row per axis does the job of a
+    whole per-cell table. Built once per world size.
+    """
+    tables = _step_tables.get((width, height))
+    if tables is None:
+        xs = {dx: step_row(dx, width) for dx in (-1, 0, 1)}
+        ys = {dy: step_row(dy, height) for dy in (-1, 0, 1)}
+        tables = {direction: (xs[dx], ys[dy]) for direction, (dx, dy) in OFFSETS.items()}
+        _step_tables[(width, height)] = tables
+    return tables
+
+
+class CritterInfo():
+    """
+    What a critter gets told about a spot in the world: where it is, how
+    big the world is, who's there, and what's around it.
+
+    The model keeps one of these and re-points it at each new spot
+    instead of building a fresh one for every call, so critters shouldn't
+    hang on to it past the call they got it in.
+    """
+    __slots__ = ('model', 'steps', 'x', 'y', 'width', 'height', 'char', 'color', 'random')
+
+    def __init__(self, model):
+        self.model = model
+        self.steps = step_tables(model.width, model.height)
+        self.x = 0
+        self.y = 0
+        self.width = model.width
+        self.height = model.height
+        self.char = None
+        self.color = None
+        # The model's random stream, for critters that want to be
+        # reproducible.
+        self.random = model.random
+
+    def point_at(self, pos, char, color):
+        "Re-points this info at pos, with the given char and color."
+        self.x = pos.x
+        self.y = pos.y
+        self.char = char
+        self.color = color
+        return self
+
+    def getNeighbor(self, direction):
+        "Returns the class name of the neighbor that way, or '.' if empty."
+        xs, ys = self.steps.get(direction) or self.steps[critter.CENTER]
+        neighbor = self.model.grid[xs[self.x]][ys[self.y]]
+        return neighbor.__class__.__name__ if neighbor else '.'
+
+    def getNeighborHealth(self, direction):
+        "Returns the health of the neighbor that way, or 0 if empty."
+        xs, ys = self.steps.get(direction) or self.steps[critter.CENTER]
+        neighbor = self.model.grid[xs[self.x]][ys[self.y]]
+        return neighbor.health if neighbor else 0
+
+    def __repr__(self):
+        return 'CritterInfo(x=%s, y=%s, width=%s, height=%s, char=%r, color=%r)' % (
+            self.x, self.y, self.width, self.height, self.char, self.color)
+
+# What the model needs to know about a critter class to skip calling it:
+# its batch policies (if any), whether it overrides interactionOver, and
+# the critter_sandbox.Sandbox it runs in, if it's a sandboxed stand-in.
+Traits = collections.namedtuple('Traits', ['move', 'interact', 'learns', 'sandbox'])
+
+# How many actions to pre-draw at a time for an INTERACT_POLICY.
+ACTION_BATCH = 256
+
+class FreeCells():
+    """
+    Every empty cell in a world, as packed x * height + y ints, so there's
+    always a free spot on hand without hunting around the grid for one.
+    cells holds them in no particular order and index[cell] says where a
+    cell sits in cells (or -1), so taking or freeing one is O(1).
+    """
+    __slots__ = ('cells', 'index')
+
+    def __init__(self, area, occupied):
+        typecode = 'i' if area < 2 ** 31 else 'q'
+        if occupied:
+            self.cells = array.array(typecode, (c for c in range(area) if c not in occupied))
+            self.index = array.array(typecode, [-1]) * area
+            for i, cell in enumerate(self.cells):
+                self.index[cell] = i
+        else:
+            self.cells = array.array(typecode, range(area))
+            self.index = array.array(typecode, range(area))
+
+    def __len__(self):
+        return len(self.cells)
+
+    def take(self, cell):
+        "Marks cell as occupied, swapping the last free cell into its place."
+        i = self.index[cell]
+        last = self.cells.pop()
+        if last != cell:
+            self.cells[i] = last
+            self.index[last] = i
+        self.index[cell] = -1
+
+    def give(self, cell):
+        "Marks cell as empty."
+        self.index[cell] = len(self.cells)
+        self.cells.append(cell)
+
+    def trade(self, taken, freed):
+        "Something moved from freed into taken."
+        i = self.index[taken]
+        self.cells[i] = freed
+        self.index[freed] = i
+        self.index[taken] = -1
+
+    def sample(self, k, rng):
+        "Takes k different free cells at random, and returns them."
+        cells = self.cells
+        picks = array.array(cells.typecode, (cells[i] for i in rng.choose(len(cells), k)))
+        for cell in picks:
+            self.take(cell)
+        return picks
+
+
+class CellPositions(collections.abc.MutableMapping):
+    """
+    The list backend's critter_positions: a map of critter to Point like
+    any other, except each critter's position lives on the critter itself,
+    packed into its _cell slot as x * height + y. That's one small int per
+    critter, where a dict of Points costs an entry, a tuple and two ints.
+
+    Points get made on the way out. Iterating goes in model.critters
+    order, and a critter can only be in one of these at a time.
+    """
+    __slots__ = ('model', 'height', 'count')
+
+    def __init__(self, model):
+        self.model = model
+        self.height = model.height
+        self.count = 0
+
+    def __getitem__(self, c):
+        cell = c._cell
+        if cell < 0:
+            raise KeyError(c)
+        return make_point(Point, divmod(cell, self.height))
+
+    def __setitem__(self, c, pos):
+        if c._cell < 0:
+            self.count += 1
+        c._cell = pos.x * self.height + pos.y
+
+    def __delitem__(self, c):
+        if c._cell < 0:
+            raise KeyError(c)
+        c._cell = -1
+        self.count -= 1
+
+    def pop(self, c, *default):
+        cell = getattr(c, '_cell', -1)
+        if cell < 0:
+            if default:
+                return default[0]
+            raise KeyError(c)
+        c._cell = -1
+        self.count -= 1
+        return make_point(Point, divmod(cell, self.height))
+
+    def __contains__(self, c):
+        return getattr(c, '_cell', -1) >= 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return (c for c in self.model.critters if c._cell >= 0)
+
 
 class CritterModel():
     """
@@ -28,57 +236,153 @@ class CritterModel():
     Critter interactions.
     """
     
-    def __init__(self, width, height, list_lock):
+    def __init__(self, width, height, list_lock, backend='list', rules=None, seed=None):
+        """
+        backend picks where the world state lives: 'list' keeps critter
+        objects in a list of lists, and 'sparse' only keeps the occupied
+        cells, for huge, mostly empty worlds (see critter_sparse). rules
+        is a critter_rules.Rules, for playing with something other than
+        the standard damage and karma. seed seeds this model's random
+        stream; the same seed gives the same run.
+        """
+        if backend not in BACKENDS:
+            raise ValueError("Unknown backend %r, pick one of %s" % (backend, ', '.join(BACKENDS)))
         self.width = width
         self.height = height
+        self.backend = backend
+        self.rules = rules if rules is not None else critter_rules.Rules()
+        # Every random decision in the model comes from here, and critters
+        # can get at it through info.random.
+        self.random = critter_random.CritterRandom(seed)
+        # This tick's pre-drawn coin flips for interactions.
+        self.rolls = []
         self.critters = []
         self.move_count = 0
         # A map of critters to (x, y) positions.
         self.critter_positions = {}
         # A map of critter classes to the number alive of that class.
         self.critter_class_states = {}
-        self.grid = [[None for x in range(height)] for y in range(width)]
+        self.grid = None
+        # Cells changed since the last take_changed_cells(), while anyone
+        # is tracking them (see track_changes).
+        self.changed_cells = None
+        self.everything_changed = False
+        # The empty cells, once somebody needs one (see free_cells).
+        self.free = None
+        self.new_world()
+        self.steps = step_tables(width, height)
+        # The one CritterInfo we keep re-pointing for every callback.
+        self.info = CritterInfo(self)
+        # A critter_profile.Profiler while profiling is on.
+        self.profiler = None
+        # A critter_history.History while recording history.
+        self.history = None
+        # A critter_replay.Recorder while recording a replay.
+        self.recorder = None
+        # Traits per critter class, and pre-drawn actions per policy.
+        self.class_traits = {}
+        self.action_buffers = {}
         # Make sure nothing bad happens due to concurrent list access.
         self.list_lock = list_lock
 
+    def new_world(self):
+        """
+        Sets up an empty grid and position map for whichever backend
+        we're using.
+        """
+        if self.backend == 'sparse':
+            import critter_sparse
+            self.grid = critter_sparse.SparseWorld(self.width, self.height).grid
+            self.critter_positions = {}
+        else:
+            self.grid = [[None for x in range(self.height)] for y in range(self.width)]
+            self.critter_positions = CellPositions(self)
+        self.free = None
+        if self.changed_cells is not None:
+            self.changed_cells = set()
+            self.everything_changed = True
+
+    def track_changes(self):
+        """
+        Starts recording which cells change, for take_changed_cells().
+        Nobody pays for the bookkeeping until someone asks for it.
+        """
+        if self.changed_cells is None:
+            self.changed_cells = set()
+            self.everything_changed = True
+
+    def take_changed_cells(self):
+        """
+        Returns the set of cells (Points) whose occupant changed since the
+        last call, or None if the whole board might have (the first call,
+        or after a reset). That covers every critter that moved or fought,
+        and every critter that picked its own move, since running its own
+        code is the only other way it can start looking different.
+        """
+        changed = self.changed_cells
+        self.changed_cells = set()
+        if self.everything_changed:
+            self.everything_changed = False
+            return None
+        return changed
+
     def add(self, critter, num):
         """
         Adds a particular critter type num times. The critter should
         be a class, not an instantiated critter.
         """
+        positions = self.place(num)
         if critter not in self.critter_class_states:
             self.critter_class_states[critter] = ClassInfo(initial_count=num)
         self.critter_class_states[critter].alive += num
-        self.critter_class_states[critter].health += num * 100
-        for i in range(num):
-            args = CritterModel.create_parameters(critter)
+        self.critter_class_states[critter].health += num * self.rules.max_health
+        for pos in positions:
+            args = CritterModel.create_parameters(critter, self.random)
             c = critter(*args)
             self.critters.append(c)
-            pos = self.random_location()
             self.critter_positions[c] = pos
             self.grid[pos.x][pos.y] = c
+            if self.changed_cells is not None:
+                self.changed_cells.add(pos)
     
-    def reset(self, num_critters):
+    def reset(self, num_critters, critter_classes=None):
         '''
         Resets the model, clearing out the whole board and
-        repopulating it with num_critters of the same Critter types.
+        repopulating it with num_critters of the same Critter types,
+        or of critter_classes instead if that's given.
         '''
-        self.grid = [[None for x in range(self.height)] for y in range(self.width)]
-        self.critter_positions = {}
+        if critter_classes is None:
+            critter_classes = list(self.critter_class_states.keys())
+        self.check_room(num_critters * len(critter_classes), self.width * self.height)
+        self.new_world()
         self.critters = []
         self.move_count = 0
         new_states = {}
-        for critter_class in self.critter_class_states.keys():
+        for critter_class in critter_classes:
+            # A class at a time, the same draws as add() makes, so a seed
+            # starts from the same board however the model got filled.
+            positions = self.place(num_critters)
             new_states[critter_class] = ClassInfo(initial_count=num_critters)
             new_states[critter_class].alive += num_critters
-            for i in range(num_critters):
-                args = CritterModel.create_parameters(critter_class)
+            new_states[critter_class].health += num_critters * self.rules.max_health
+            for pos in positions:
+                args = CritterModel.create_parameters(critter_class, self.random)
                 c = critter_class(*args)
                 self.critters.append(c)
-                pos = self.random_location()
                 self.critter_positions[c] = pos
                 self.grid[pos.x][pos.y] = c
         self.critter_class_states = new_states
+        # Only this run's classes need their traits and buffers kept.
+        # Sandboxed matches wrap their classes anew each time, so a reused
+        # model would otherwise hang on to every match's classes forever.
+        self.class_traits = {}
+        self.action_buffers = {}
+        if self.history is not None:
+            # It's a whole new run.
+            self.record_history(self.history.capacity, self.history.buckets)
+        if self.recorder is not None:
+            # So is the replay, and it's got nothing to do with this one.
+            self.stop_replay()
 
     def update(self):
         """
@@ -87,31 +391,92 @@ class CritterModel():
         critters interact.  If one runs out of health, it loses and is removed
         and the other moves into the position.
         """
+        profiler = self.profiler
+        if profiler is not None:
+            tick_start = critter_profile.clock()
         self.move_count += 1
-        random.shuffle(self.critters)
-        # Unclean while loop, because we'll be removing any losing critters
-        # as we iterate through the list.
-        i = 0
-        l = len(self.critters)
-        while i < l:
-            critter1 = self.critters[i]
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.begin(self)
+        order = self.random.permutation(len(self.critters))
+        self.critters[:] = [self.critters[i] for i in order]
+        # At most one fight per critter per tick, so this is enough flips
+        # unless somebody calls interact() on their own.
+        self.rolls = self.random.uniforms(len(self.critters))
+        if profiler is None:
+            planned = self.plan_moves()
+        else:
+            planned = self.timed('plan', None, self.plan_moves)
+        dead = self.play(self.critters, planned)
+
+        if dead:
+            if profiler is not None:
+                removal_start = critter_profile.clock()
+            # Sweep out the dead, keeping everyone else in order.
+            with self.list_lock:
+                self.critters = [c for c in self.critters if c not in dead]
+            if profiler is not None:
+                profiler.add('removal', None, critter_profile.clock() - removal_start)
+
+        if self.history is not None:
+            self.record_tick()
+        if recorder is not None:
+            recorder.end(self)
+        if profiler is not None:
+            profiler.add('tick', None, critter_profile.clock() - tick_start)
+
+    def play(self, critters, planned):
+        """
+        Gives each of critters its turn, in order: it moves (planned[i],
+        or whatever its getMove says if that's None), and fights whoever
+        is where it ends up. Returns the set of critters that died.
+        update() does this for everyone; critter_domains does it a strip
+        at a time.
+        """
+        profiler = self.profiler
+        recorder = self.recorder
+        # Dead critters stay in the list until the tick is over, so
+        # removal is constant time and nobody's index shifts; they just
+        # get skipped, and swept out by whoever called us.
+        dead = set()
+        changed = self.changed_cells
+        free = self.free
+        height = self.height
+        positions = self.critter_positions
+        # The list backend keeps positions on the critters themselves (see
+        # CellPositions), so the loop reads and writes them there directly.
+        packed = positions.__class__ is CellPositions
+        for i in range(len(critters)):
+            critter1 = critters[i]
+            if critter1 in dead:
+                # killed earlier this tick
+                continue
             # Move the critter
-            old_position = self.critter_positions[critter1]
-            direction = critter1.getMove(CritterInfo(old_position.x, old_position.y,
-                                                     self.width, self.height,
-                                                     critter1.getChar(),
-                                                     critter1.getColor(),
-                                                     self.get_neighbor_func(old_position),
-                                                     self.get_neighbor_health_func(old_position)))
-
-            CritterModel.verify_move(direction)
+            if packed:
+                old_position = make_point(Point, divmod(critter1._cell, height))
+            else:
+                old_position = positions[critter1]
+            direction = planned[i]
+            if direction is None:
+                if profiler is None:
+                    direction = critter1.getMove(self.info.point_at(old_position,
+                                                                    critter1.getChar(),
+                                                                    critter1.getColor()))
+                else:
+                    info = self.timed('info', critter1.__class__, self.info_for, old_position, critter1)
+                    direction = self.timed('getMove', critter1.__class__, critter1.getMove, info)
+
+                CritterModel.verify_move(direction)
             position = self.move(direction, old_position)
 
             # Interact, if necessary
             winner = critter1
             loser = None
+            fought = False
+            killed = None
             critter2 = self.grid[position.x][position.y]
             if critter2 and position != old_position and critter1 != critter2: # Save each stone from fighting itself
+                fought = True
                 winner = self.interact(critter1, critter2)
 
                 # NOTE: most updates happen in interact method called above
@@ -121,60 +486,124 @@ class CritterModel():
 
                 # here, we remove a critter if it no longer has health
                 if loser.health <= 0:
-                    self.critter_positions[winner] = position
+                    if profiler is not None:
+                        removal_start = critter_profile.clock()
+                    positions[winner] = position
 
                     # Get the loser out of here
                     with self.list_lock:
-                        index = self.critters.index(loser)
-                        if index <= i:
-                            # the loser was earlier in the list, so the
-                            # winner's index decreases
-                            i -= 1
-
-                           
-                        self.critter_positions.pop(loser)
-                        self.critters.remove(loser)
-                        l -= 1 # we have one fewer total critter
+                        dead.add(loser)
+                        positions.pop(loser)
 
                         # Make sure we've got an accurate wins/alive count
                         self.critter_class_states[loser.__class__].alive -= 1
                         self.critter_class_states[winner.__class__].wins += 1
 
                         # this loser no longer exists
+                        killed = loser
                         loser = None
+                    if profiler is not None:
+                        profiler.add('removal', None, critter_profile.clock() - removal_start)
                         
+            if recorder is not None:
+                recorder.turn(critter1, direction, fought, winner is critter1, killed)
             # Update positions
+            if changed is not None and (position != old_position or
+                                        self.class_traits[critter1.__class__].move is None):
+                changed.add(old_position)
+                changed.add(position)
+            if free is not None and loser is None and position != old_position:
+                if critter2 is None:
+                    free.trade(position.x * height + position.y,
+                               old_position.x * height + old_position.y)
+                else:
+                    # Somebody died, and the winner's old spot is empty
+                    free.give(old_position.x * height + old_position.y)
             self.grid[old_position.x][old_position.y] = loser
             self.grid[position.x][position.y] = winner
-            self.critter_positions[winner] = position
-            if loser is not None:
-                self.critter_positions[loser] = old_position
-                    
-            i += 1
-            
+            if packed:
+                winner._cell = position.x * height + position.y
+                if loser is not None:
+                    loser._cell = old_position.x * height + old_position.y
+            else:
+                positions[winner] = position
+                if loser is not None:
+                    positions[loser] = old_position
+        return dead
+
+    def traits(self, critter_class):
+        "Looks up (and checks, the first time) a critter class's traits."
+        traits = self.class_traits.get(critter_class)
+        if traits is None:
+            move_policy = critter.get_policy(critter_class, 'MOVE_POLICY', 'getMove')
+            interact_policy = critter.get_policy(critter_class, 'INTERACT_POLICY', 'interact')
+            # Policies get checked once here rather than on every draw.
+            if move_policy is not None:
+                for direction in move_policy.choices:
+                    CritterModel.verify_move(direction)
+            if interact_policy is not None:
+                for action in interact_policy.choices:
+                    CritterModel.verify_action(action)
+            learns = critter_class.interactionOver is not critter.Critter.interactionOver
+            traits = Traits(move_policy, interact_policy, learns, getattr(critter_class, 'SANDBOX', None))
+            self.class_traits[critter_class] = traits
+        return traits
+
+    def plan_moves(self, critters=None):
+        """
+        Draws this tick's moves for every one of critters (default: all of
+        them) whose class declares a MOVE_POLICY, in one batch per class,
+        and asks each sandbox for its critters' moves in one batch. Returns
+        a list lined up with critters, with None for critters that pick
+        their own move.
+        """
+        if critters is None:
+            critters = self.critters
+        planned = [None] * len(critters)
+        members = {}
+        sandboxed = {}
+        for i, c in enumerate(critters):
+            traits = self.traits(c.__class__)
+            if traits.move is not None:
+                members.setdefault(traits.move, array.array('q')).append(i)
+            elif traits.sandbox is not None:
+                sandboxed.setdefault(traits.sandbox, []).append(i)
+        for policy, indices in members.items():
+            for i, direction in zip(indices, policy.draw(self.random, len(indices))):
+                planned[i] = direction
+        for sandbox, indices in sandboxed.items():
+            for i, direction in zip(indices, sandbox.moves([critters[i] for i in indices], self)):
+                planned[i] = direction
+        return planned
+
+    def roll(self):
+        "Takes the next pre-drawn coin flip, a float in [0, 1)."
+        if not self.rolls:
+            self.rolls = self.random.uniforms(ACTION_BATCH)
+        return self.rolls.pop()
+
+    def reseed(self, seed):
+        "Restarts this model's random stream from seed."
+        self.random.seed(seed)
+        self.rolls = []
+        self.action_buffers = {}
+
+    def policy_action(self, policy):
+        "Takes the next pre-drawn action for an INTERACT_POLICY."
+        buffer = self.action_buffers.get(policy)
+        if not buffer:
+            buffer = self.action_buffers[policy] = policy.draw(self.random, ACTION_BATCH)
+        return buffer.pop()
+
     def move(self, direction, pos):
         """
         Returns the new position after moving in direction. This
         assumes that (0, 0) is the top-left.
         """
-        if direction == critter.NORTH:
-            return Point(pos.x, (pos.y - 1) % self.height)
-        elif direction == critter.SOUTH:
-            return Point(pos.x, (pos.y + 1) % self.height)
-        elif direction == critter.EAST:
-            return Point((pos.x + 1) % self.width, pos.y)
-        elif direction == critter.WEST:
-            return Point((pos.x - 1) % self.width, pos.y)
-        elif direction == critter.NORTHEAST:
-            return Point((pos.x + 1) % self.width, (pos.y - 1) % self.height)
-        elif direction == critter.NORTHWEST:
-            return Point((pos.x - 1) % self.width, (pos.y - 1) % self.height)
-        elif direction == critter.SOUTHWEST:
-            return Point((pos.x + 1) % self.width, (pos.y + 1) % self.height)
-        elif direction == critter.SOUTHEAST:
-            return Point((pos.x - 1) % self.width, (pos.y + 1) % self.height)
-        else:
+        step = self.steps.get(direction)
+        if step is None:
             return pos
+        return make_point(Point, (step[0][pos.x], step[1][pos.y]))
     
     def interact(self, critter1, critter2):
         """
@@ -182,162 +611,62 @@ class CritterModel():
         the entertainment of Oberlin students. Returns the glorious
         victor.
         """
-        position = self.critter_positions[critter2]
-        action1 = critter1.interact(CritterInfo(position.x, position.y,
-                                                     self.width, self.height,
-                                                     critter2.getChar(),
-                                                     critter2.getColor(),
-                                                     self.get_neighbor_func(position),
-                                                     self.get_neighbor_health_func(position)))
-        position = self.critter_positions[critter1]
-        action2 = critter2.interact(CritterInfo(position.x, position.y,
-                                                     self.width, self.height,
-                                                     critter1.getChar(),
-                                                     critter1.getColor(),
-                                                     self.get_neighbor_func(position),
-                                                     self.get_neighbor_health_func(position))) 
-        CritterModel.verify_action(action1)
-        CritterModel.verify_action(action2)
-
-        # did the first critter fight?
-        fight1 = action1 == critter.ROAR or action1 == critter.SCRATCH or action1 == critter.POUNCE
-            
-        # did the second critter fight?
-        fight2 = action2 == critter.ROAR or action2 == critter.SCRATCH or action2 == critter.POUNCE
-
-        # find the "winner"
-        critter2won = True
-
-        if (fight1 and fight2):            
-            if (action1 == critter.ROAR and action2 == critter.SCRATCH or
-                    action1 == critter.SCRATCH and action2 == critter.POUNCE or
-                    action1 == critter.POUNCE and action2 == critter.ROAR):
-                # critter 1 won
-                
-                # update critter 2's health
-                critter2.health = max(0, critter2.health - ATTACK_DAMAGE)
-                self.critter_class_states[critter2.__class__].health -= ATTACK_DAMAGE
-
-                # update critter 1's karma
-                critter1.karma += DEFEND_KARMA
-                self.critter_class_states[critter1.__class__].karma += DEFEND_KARMA
-
-                # update the winner
-                critter2won = False
-            elif action1 == action2:
-                if random.random() > .5:
-                    # critter 1 won
-                
-                    # update critter 2's health
-                    critter2.health = max(0, critter2.health - ATTACK_DAMAGE)
-                    self.critter_class_states[critter2.__class__].health -= ATTACK_DAMAGE
-                    
-                    # update critter 1's karma
-                    critter1.karma += DEFEND_KARMA
-                    self.critter_class_states[critter1.__class__].karma += DEFEND_KARMA
-
-                    # update the winner
-                    critter2won = False
-                else:
-                    # critter 2 won
-                
-                    # update critter 1's health
-                    critter1.health = max(0, critter1.health - ATTACK_DAMAGE)
-                    self.critter_class_states[critter1.__class__].health -= ATTACK_DAMAGE
-
-                    # update critter 2's karma
-                    critter2.karma += DEFEND_KARMA
-                    self.critter_class_states[critter2.__class__].karma += DEFEND_KARMA
-
-                    # update the winner
-                    critter2won = True
-            else:
-                # critter 2 won
-                
-                # update critter 1's health
-                critter1.health = max(0, critter1.health - ATTACK_DAMAGE)                
-                self.critter_class_states[critter1.__class__].health -= ATTACK_DAMAGE
-
-                # update critter 2's karma
-                critter2.karma += DEFEND_KARMA
-                self.critter_class_states[critter2.__class__].karma += DEFEND_KARMA
-
-                # update the winner
-                critter2won = True
-        elif (fight1):
-            # only critter 1 chose to fight, so they win by default
-
-            # update critter2's health
-            critter2.health = max(0, critter2.health - ATTACK_DAMAGE)
-            self.critter_class_states[critter2.__class__].health -= ATTACK_DAMAGE
-            
-            if (action2 == critter.PARTY):
-                # update critter1's karma
-                critter1.karma += ATTACK_PARTY_KARMA
-                self.critter_class_states[critter1.__class__].karma += ATTACK_PARTY_KARMA
-            elif (action2 == critter.HEAL):
-                critter1.karma += ATTACK_HEAL_KARMA
-                self.critter_class_states[critter1.__class__].karma += ATTACK_HEAL_KARMA
-
-            # update the winner
+        traits1 = self.traits(critter1.__class__)
+        traits2 = self.traits(critter2.__class__)
+        action1 = self.ask_action(critter1, critter2, traits1)
+        action2 = self.ask_action(critter2, critter1, traits2)
+        if self.recorder is not None:
+            self.recorder.fight(action1, action2)
+        profiler = self.profiler
+        if profiler is not None:
+            resolve_start = critter_profile.clock()
+
+        # Look up what happens, and flip a coin if it's up to chance.
+        outcome = self.rules.outcome(action1, action2)
+        p1 = outcome.p1
+        if p1 == 1.0:
             critter2won = False
-        elif (fight2):
-             # only critter 2 chose to fight, so they win by default
-
-            # update critter1's health
-            critter1.health = max(0, critter1.health - ATTACK_DAMAGE)
-            self.critter_class_states[critter1.__class__].health -= ATTACK_DAMAGE
-            
-            if (action1 == critter.PARTY):
-                # update critter2's karma
-                critter2.karma += ATTACK_PARTY_KARMA
-                self.critter_class_states[critter2.__class__].karma += ATTACK_PARTY_KARMA
-            elif (action1 == critter.HEAL):
-                critter2.karma += ATTACK_HEAL_KARMA
-                self.critter_class_states[critter2.__class__].karma += ATTACK_HEAL_KARMA
-
-            # update the winner
+        elif p1 == 0.0:
             critter2won = True
         else:
-            # did anyone try to heal?
-            # note: nothing happens if you try to heal a critter
-            # with perfect health
-            if (action1 == critter.HEAL and critter2.health < 100):
-                # update critter2's health
-                oldHealth = critter2.health
-                critter2.health = min(100, critter2.health + HEAL_RESTORE)
-                self.critter_class_states[critter2.__class__].health += critter2.health - oldHealth
-
-                # update critter1's karma
-                critter1.karma += HEAL_KARMA
-                self.critter_class_states[critter1.__class__].karma += HEAL_KARMA
-            elif (action1 == critter.PARTY):
-                # update critter1's karma
-                critter1.karma += PARTY_KARMA
-                self.critter_class_states[critter1.__class__].karma += PARTY_KARMA
-
-            if (action2 == critter.HEAL and critter1.health < 100):
-                # update critter1's health
-                oldHealth = critter1.health
-                critter1.health = min(100, critter1.health + HEAL_RESTORE)
-                self.critter_class_states[critter1.__class__].health += critter1.health - oldHealth
-
-                # update critter2's karma
-                critter2.karma += HEAL_KARMA
-                self.critter_class_states[critter2.__class__].karma += HEAL_KARMA
-            elif (action2 == critter.PARTY):
-                # update critter2's karma
-                critter2.karma += PARTY_KARMA
-                self.critter_class_states[critter2.__class__].karma += PARTY_KARMA
-            
-            # pick a winner at random
-            critter2won = True
-            if random.random() > .5:
-                critter2won = False
-
-        # alert the critters about the interaction
-        critter1.interactionOver(not critter2won, action2)
-        critter2.interactionOver(critter2won, action1)
+            critter2won = not self.roll() < p1
+        deltas = outcome.win2 if critter2won else outcome.win1
+
+        # Apply it to both critters and their classes in one go.
+        health1 = critter1.health
+        health2 = critter2.health
+        new_health1, new_health2, karma1, karma2 = self.rules.apply(deltas, health1, health2)
+        if new_health1 != health1:
+            critter1.health = new_health1
+        if new_health2 != health2:
+            critter2.health = new_health2
+        if karma1:
+            critter1.karma += karma1
+        if karma2:
+            critter2.karma += karma2
+        state1 = self.critter_class_states[critter1.__class__]
+        state2 = self.critter_class_states[critter2.__class__]
+        state1.health += new_health1 - health1
+        state1.karma += karma1
+        state2.health += new_health2 - health2
+        state2.karma += karma2
+
+        if profiler is not None:
+            profiler.add('resolve', None, critter_profile.clock() - resolve_start)
+
+        # alert the critters about the interaction (if they care)
+        if profiler is None:
+            if traits1.learns:
+                critter1.interactionOver(not critter2won, action2)
+            if traits2.learns:
+                critter2.interactionOver(critter2won, action1)
+        else:
+            if traits1.learns:
+                self.timed('interactionOver', critter1.__class__, critter1.interactionOver,
+                           not critter2won, action2)
+            if traits2.learns:
+                self.timed('interactionOver', critter2.__class__, critter2.interactionOver,
+                           critter2won, action1)
 
         # return the "winner"
         if (critter2won):
@@ -345,6 +674,103 @@ class CritterModel():
         else:
             return critter1
 
+    def ask_action(self, critter1, critter2, traits):
+        """
+        Asks critter1 (whose class has traits) what it wants to do to
+        critter2, and makes sure the answer is a real action.
+        """
+        if traits.interact is not None:
+            return self.policy_action(traits.interact)
+        if self.profiler is None:
+            action = critter1.interact(self.info.point_at(self.critter_positions[critter2],
+                                                          critter2.getChar(),
+                                                          critter2.getColor()))
+        else:
+            info = self.timed('info', critter1.__class__, self.info_for,
+                              self.critter_positions[critter2], critter2)
+            action = self.timed('interact', critter1.__class__, critter1.interact, info)
+        CritterModel.verify_action(action)
+        return action
+
+    def info_for(self, position, critter):
+        "Points the model's CritterInfo at critter, sitting at position."
+        return self.info.point_at(position, critter.getChar(), critter.getColor())
+
+    def enable_profiling(self):
+        """
+        Starts recording where time goes (see critter_profile). Returns
+        the Profiler, which is also model.profiler.
+        """
+        if self.profiler is None:
+            self.profiler = critter_profile.Profiler()
+        return self.profiler
+
+    def disable_profiling(self):
+        "Stops recording. Returns the Profiler with whatever it recorded."
+        profiler = self.profiler
+        self.profiler = None
+        return profiler
+
+    def record_history(self, capacity=None, buckets=None):
+        """
+        Starts keeping per-class time series of alive, wins, health and
+        karma for the classes in the model now (see critter_history).
+        Returns the History, which is also model.history. Needs numpy.
+        """
+        import critter_history
+        self.history = critter_history.History(
+            [c.__name__ for c in self.critter_class_states],
+            capacity or critter_history.DEFAULT_CAPACITY,
+            buckets or critter_history.DEFAULT_BUCKETS)
+        self.history_classes = list(self.critter_class_states)
+        self.record_tick()
+        return self.history
+
+    def stop_history(self):
+        "Stops recording. Returns the History with whatever it recorded."
+        history = self.history
+        self.history = None
+        return history
+
+    def record_replay(self, path, keyframe_every=None):
+        """
+        Starts writing everything that happens to a replay file at path
+        (see critter_replay), with a keyframe every keyframe_every ticks.
+        Returns the Recorder, which is also model.recorder. Recording
+        stops at stop_replay() or reset().
+        """
+        import critter_replay
+        self.stop_replay()
+        self.recorder = critter_replay.Recorder(self, path,
+                                                keyframe_every or critter_replay.DEFAULT_KEYFRAME_EVERY)
+        return self.recorder
+
+    def stop_replay(self):
+        "Finishes the replay file, if one is being written."
+        recorder = self.recorder
+        self.recorder = None
+        if recorder is not None:
+            recorder.close()
+
+    def record_tick(self):
+        "Adds where every class stands right now to the history."
+        states = self.critter_class_states
+        values = []
+        for critter_class in self.history_classes:
+            state = states.get(critter_class)
+            if state is None:
+                values.append((0, 0, 0, 0))
+            else:
+                values.append((state.alive, state.wins, state.health, state.karma))
+        self.history.append(self.move_count, values)
+
+    def timed(self, phase, critter_class, func, *args):
+        "Calls func(*args), charging the time it took to phase and critter_class."
+        start = critter_profile.clock()
+        result = func(*args)
+        self.profiler.add(phase, critter_class, critter_profile.clock() - start)
+        return result
+
     def verify_action(action):
         """
         Make sure students are using the right actions. If not, throws
@@ -370,20 +796,54 @@ class CritterModel():
 
     def random_location(self):
         """
-        Calculate a random location for a Critter to be placed. This
-        is not guaranteed to terminate by any means, but practically
-        we (probably) don't need to be concerned.
+        Picks a random empty location for a Critter to be placed, and
+        returns it as a Point. Raises PopulationException if there
+        isn't one.
+        """
+        return next(self.place(1))
 
-        Returns a 2-tuple of integers.
+    def place(self, num):
+        """
+        Picks num different empty locations for critters, in one go, and
+        returns an iterator over them as Points. Raises
+        PopulationException if there aren't that many.
+        """
+        area = self.width * self.height
+        self.check_room(num, area - len(self.critter_positions))
+        height = self.height
+        if self.backend == 'sparse':
+            # The world's mostly empty, so just keep guessing. These are
+            # different draws from free_cells(), so the same seed starts
+            # from a different board than on the other backends.
+            cells = []
+            picked = set()
+            grid = self.grid
+            while len(cells) < num:
+                cell = self.random.randrange(area)
+                if cell not in picked and grid[cell // height][cell % height] is None:
+                    picked.add(cell)
+                    cells.append(cell)
+        else:
+            cells = self.free_cells().sample(num, self.random)
+        return (Point(cell // height, cell % height) for cell in cells)
+
+    def check_room(self, num, room):
+        if num > room:
+            raise PopulationException("Can't fit %d more critters in a %dx%d world, there's only room for %d."
+                                      % (num, self.width, self.height, room))
+
+    def free_cells(self):
+        """
+        Returns the FreeCells for the world, working it out from where
+        everybody is if we don't have it yet. Sparse worlds don't get one.
         """
-        x = random.randint(0, self.width-1)
-        y = random.randint(0, self.height-1)
-        while self.grid[x][y] is not None:
-            x = random.randint(0, self.width-1)
-            y = random.randint(0, self.height-1)
-        return Point(x, y)
+        if self.free is None:
+            height = self.height
+            occupied = {pos.x * height + pos.y for pos in self.critter_positions.values()}
+            self.free = FreeCells(self.width * height, occupied)
+        return self.free
     
-    def create_parameters(critter):
+    def create_parameters(critter, rng):
         """
         This is a bit funky. Because not all Critters take the same
         arguments in their constructor (for example, a Mouse gets a
@@ -393,33 +853,77 @@ class CritterModel():
         information for each parameter, but c'est la vie.
         
         Return value is a tuple, which will be passed as *args to
-        the critter's constructor.
+        the critter's constructor. rng is where any random parameters
+        come from.
         """
         if critter.__name__ == 'Mouse':
-            return (color.Color(random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)),)
+            return (color.Color(rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)),)
         elif critter.__name__ == 'Elephant':
-            return (random.randint(1, 15),)
+            return (rng.randint(1, 15),)
         # No other class needs parameters
         else:
             return ()
     
     def get_neighbor_func(self, position):
         "Returns the getNeighbor function for a particular position."
-        def get_neighbor(direction):
-            neighbor_pos = self.move(direction, position)
-            neighbor = self.grid[neighbor_pos.x][neighbor_pos.y]
-            #print( neighbor, type(neighbor) )
-            return neighbor.__class__.__name__ if neighbor else '.'
-        return get_neighbor
+        return CritterInfo(self).point_at(position, None, None).getNeighbor
 
     def get_neighbor_health_func(self, position):
         "Returns the getNeighborHealth function for a particular position."
-        def get_neighbor_health(direction):
-            neighbor_pos = self.move(direction, position)
-            neighbor = self.grid[neighbor_pos.x][neighbor_pos.y]
-            #print( neighbor, type(neighbor) )
-            return neighbor.health if neighbor else 0
-        return get_neighbor_health
+        return CritterInfo(self).point_at(position, None, None).getNeighborHealth
+
+    def stats(self):
+        """
+        Returns a snapshot of where every class stands right now, as plain
+        dicts and numbers (ready for json.dumps).
+        """
+        return {'tick': self.move_count,
+                'classes': {critter_class.__name__: {'alive': state.alive, 'wins': state.wins,
+                                                     'health': state.health, 'karma': state.karma}
+                            for critter_class, state in self.critter_class_states.items()}}
+
+    def stream(self, every=1, ticks=None):
+        """
+        Runs the model, yielding stats() every `every` ticks (and after
+        the last one), for `ticks` ticks or forever if that's None. Nothing
+        is kept between yields, so this can run as long as you like.
+        """
+        done = 0
+        while ticks is None or done < ticks:
+            self.update()
+            done += 1
+            if done % every == 0 or done == ticks:
+                yield self.stats()
+
+    def memory(self):
+        """
+        Returns roughly how many bytes each part of the model takes up, as
+        a map of component name to bytes, to see where a big world's
+        memory goes. It's sys.getsizeof() on what the model holds, so
+        anything shared (small ints, classes, step tables) isn't counted,
+        and neither is whatever critters keep in their own __dict__s.
+        """
+        size = sys.getsizeof
+        critters = self.critters
+        report = {'critters': sum(size(c) for c in critters),
+                  'critter list': size(critters)}
+        positions = self.critter_positions
+        if isinstance(positions, CellPositions):
+            # Each packed cell past the small ints is an int of its own.
+            report['positions'] = size(positions) + sum(size(c._cell) for c in critters if c._cell > 256)
+        elif isinstance(positions, dict):
+            report['positions'] = size(positions) + sum(size(pos) for pos in positions.values())
+        if self.backend == 'sparse':
+            cells = self.grid.world.cells
+            report['grid'] = size(cells) + sum(size(cell) for cell in cells)
+        else:
+            report['grid'] = size(self.grid) + sum(size(column) for column in self.grid)
+        if self.free is not None:
+            report['free cells'] = size(self.free.cells) + size(self.free.index)
+        report['class states'] = (size(self.critter_class_states) +
+                                  sum(size(state) for state in self.critter_class_states.values()))
+        report['rolls'] = size(self.rolls)
+        return report
 
     def results(self):
         """
@@ -435,6 +939,8 @@ class ClassInfo():
     This would be a named tuple, but they're immutable and that's
     somewhat unwieldy for this particular case.
     """
+    __slots__ = ('wins', 'alive', 'count', 'health', 'karma')
+
     def __init__(self, wins=0, alive=0, initial_count=0, karma=0):
         self.wins = wins
         self.alive = alive
@@ -451,3 +957,6 @@ class ActionException(Exception):
 
 class LocationException(Exception):
     pass
+
+class PopulationException(Exception):
+    pass
@@ -0,0 +1,81 @@
+"""
+Where the time goes in a Critter run.
+
+A Profiler adds up wall time and call counts per phase of a tick
+(building CritterInfo, getMove and interact callbacks, removal
+bookkeeping, GUI redraws, ...) and per critter class. Turn it on with
+model.enable_profiling(); when it's off the model doesn't time anything.
+"""
+import collections
+import time
+
+# The phases the model and GUI record, in report order.
+PHASES = ('tick', 'plan', 'info', 'getMove', 'interact', 'interactionOver',
+          'resolve', 'removal', 'render')
+
+# Stand-in class name for time that doesn't belong to any one class.
+ENGINE = '(engine)'
+
+clock = time.perf_counter
+
+
+class Profiler():
+    """
+    Cumulative time and calls, keyed by (phase, class name).
+    """
+
+    def __init__(self):
+        self.stats = collections.defaultdict(lambda: [0.0, 0])
+
+    def add(self, phase, critter_class, seconds):
+        "Records one call to phase taking seconds, for critter_class (or None)."
+        key = (phase, ENGINE if critter_class is None else critter_class.__name__)
+        entry = self.stats[key]
+        entry[0] += seconds
+        entry[1] += 1
+
+    def merge(self, stats):
+        "Adds in another profiler's stats (say, from a tournament worker)."
+        for key, (seconds, calls) in stats.items():
+            entry = self.stats[key]
+            entry[0] += seconds
+            entry[1] += calls
+
+    def clear(self):
+        self.stats.clear()
+
+    def phase_totals(self):
+        "Returns a map of phase to (seconds, calls), over all classes."
+        totals = collections.defaultdict(lambda: [0.0, 0])
+        for (phase, name), (seconds, calls) in self.stats.items():
+            totals[phase][0] += seconds
+            totals[phase][1] += calls
+        return {phase: tuple(total) for phase, total in totals.items()}
+
+    def class_totals(self):
+        """
+        Returns a map of class name to seconds spent in that class's own
+        callbacks, which is what makes a species expensive.
+        """
+        totals = collections.defaultdict(float)
+        for (phase, name), (seconds, calls) in self.stats.items():
+            if name != ENGINE and phase != 'tick':
+                totals[name] += seconds
+        return dict(totals)
+
+    def report(self):
+        "Returns a table of every phase and class, slowest first within a phase."
+        lines = ['%-16s %-20s %10s %12s %10s' % ('phase', 'class', 'calls', 'seconds', 'us/call')]
+        order = {phase: i for i, phase in enumerate(PHASES)}
+        keys = sorted(self.stats, key=lambda k: (order.get(k[0], len(PHASES)), -self.stats[k][0]))
+        for phase, name in keys:
+            seconds, calls = self.stats[(phase, name)]
+            lines.append('%-16s %-20s %10d %12.4f %10.2f' % (phase, name, calls, seconds,
+                                                              1e6 * seconds / calls if calls else 0.0))
+        classes = sorted(self.class_totals().items(), key=lambda item: -item[1])
+        if classes:
+            lines.append('')
+            lines.append('Time in callbacks by class:')
+            for name, seconds in classes:
+                lines.append('%-20s %12.4f' % (name, seconds))
+        return '\n'.join(lines)
@@ -0,0 +1,111 @@
+"""
+Per-model random number streams.
+
+Each CritterModel gets its own CritterRandom instead of sharing the global
+random module, so a run only depends on its own seed: the same seed gives
+the same run whether it's alone or one of many in a tournament worker.
+
+CritterRandom is a regular random.Random (that's what critters get
+through info.random), plus a few batch helpers the model uses to draw a
+whole tick's worth of numbers at once. The batches come from a NumPy
+generator seeded the same way when NumPy is around, and from the
+random.Random itself when it isn't, so a seed reproduces a run exactly
+on any machine with the same setup, but not across with/without NumPy.
+"""
+import array
+import math
+import random
+
+# numpy takes longer to import than everything else headless put
+# together, so it waits until there's a stream to seed: None until then,
+# and False if it isn't installed.
+np = None
+
+
+def load_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = False
+    return np
+
+
+def fresh_seed():
+    "Picks a seed from the OS, for runs that weren't given one."
+    return random.SystemRandom().randrange(2 ** 63)
+
+
+class CritterRandom(random.Random):
+    """
+    A seeded random.Random with batch helpers on top.
+    """
+
+    def __init__(self, seed=None):
+        # seed defaults to None because pickle rebuilds us with no
+        # arguments (see random.Random.__reduce__) before setting the state.
+        self.batch = None
+        random.Random.__init__(self, seed)
+
+    def seed(self, a=None, version=2):
+        if a is None:
+            a = fresh_seed()
+        a = int(a)
+        random.Random.seed(self, a, version)
+        self.initial_seed = a
+        if load_numpy():
+            self.batch = np.random.default_rng(a)
+
+    def getstate(self):
+        batch = self.batch.bit_generator.state if self.batch is not None else None
+        return (random.Random.getstate(self), self.initial_seed, batch)
+
+    def setstate(self, state):
+        python_state, self.initial_seed, batch = state
+        random.Random.setstate(self, python_state)
+        if batch is not None and load_numpy():
+            self.batch = np.random.default_rng()
+            self.batch.bit_generator.state = batch
+
+    # The batches come back as arrays rather than lists, which keeps a
+    # big tick's worth at 8 bytes a number instead of a whole object each.
+
+    def uniforms(self, n):
+        "Returns n floats in [0, 1), as an array('d')."
+        if self.batch is not None:
+            return array.array('d', self.batch.random(n).tobytes())
+        return array.array('d', [self.random() for i in range(n)])
+
+    def indexes(self, bound, n):
+        "Returns n ints in [0, bound), as an array('q')."
+        if self.batch is not None:
+            return array.array('q', self.batch.integers(bound, size=n, dtype=np.int64).tobytes())
+        return array.array('q', [self.randrange(bound) for i in range(n)])
+
+    def permutation(self, n):
+        "Returns range(n) shuffled, as an array('q')."
+        if self.batch is not None:
+            return array.array('q', self.batch.permutation(n).astype(np.int64, copy=False).tobytes())
+        order = list(range(n))
+        self.shuffle(order)
+        return array.array('q', order)
+
+    def choose(self, n, k):
+        "Returns k different ints in [0, n), in random order, as an array('q')."
+        if self.batch is not None:
+            picks = self.batch.choice(n, size=k, replace=False)
+            return array.array('q', picks.astype(np.int64, copy=False).tobytes())
+        # The same draws as self.sample(range(n), k), except that when k is
+        # big enough for that to shuffle a pool of all n, the pool's an array.
+        setsize = 21 + (4 ** math.ceil(math.log(k * 3, 4)) if k > 5 else 0)
+        if n > setsize:
+            return array.array('q', self.sample(range(n), k))
+        pool = array.array('q', range(n))
+        picks = array.array('q', bytes(8 * k))
+        for i in range(k):
+            j = self._randbelow(n - i)
+            picks[i] = pool[j]
+            pool[j] = pool[n - i - 1]
+        return picks
@@ -0,0 +1,636 @@
+"""
+Recording a run once and watching it again without running any critters.
+
+model.record_replay(path) hooks a Recorder into CritterModel.update, which
+writes what happens in every tick: each critter's turn (which way it went,
+and if it fought, both actions, who won and whether the loser died), any
+critter whose char or color changed, and how the class totals moved. A
+keyframe with every critter on the board starts each chunk of the file,
+every keyframe_every ticks and whenever critters get added. A reset()
+starts a whole new run, so it ends the recording.
+
+A replay is one binary file:
+
+    magic, version, header length     (struct, 16 bytes)
+    header                            (JSON: world size, byte order, ...)
+    chunks                            (first tick, last tick and length,
+                                       then the zlib'd keyframe and ticks)
+    index                             (first tick, last tick, offset per
+                                       chunk, then its offset and INDEX_MAGIC)
+
+Everything in a chunk is fixed-width arrays, so decoding a tick is a few
+array.frombytes calls plus one pass over its turns, and stats() doesn't
+even need the pass. To get to a tick, Replay.seek only unpacks the one
+chunk it's in. A file whose run never got to stop_replay() has no index,
+and the chunk headers get scanned for one instead.
+
+Replay.frames() yields critter_runner.Frames, and Player plays those
+through CritterGUI (with a View standing in for the model); Replay.stats()
+yields what model.stats() would have.
+"""
+import array
+import color
+import critter
+import critter_model
+import critter_rules
+import critter_runner
+import json
+import mmap
+import struct
+import sys
+import time
+import zlib
+
+MAGIC = b'CRTRRPLY'
+VERSION = 1
+# magic, version, header length
+PREAMBLE = struct.Struct('<8sII')
+# first tick, last tick, compressed length
+CHUNK = struct.Struct('<qqI')
+# index offset, INDEX_MAGIC
+TRAILER = struct.Struct('<Q8s')
+INDEX_MAGIC = b'CRTRINDX'
+# tick, turns, fights, look changes, new palette bytes
+TICK = struct.Struct('<qIIII')
+# tick, critters, JSON length
+KEY = struct.Struct('<qII')
+
+DEFAULT_KEYFRAME_EVERY = 100
+
+# A turn's code: which way it went in the low bits, then flags.
+MOVES = (critter.NORTH, critter.SOUTH, critter.EAST, critter.WEST, critter.CENTER)
+MOVE_CODES = {direction: i for i, direction in enumerate(MOVES)}
+MOVE_MASK = 0x7
+FOUGHT = 0x8
+WON = 0x10
+DIED = 0x20
+
+# A fight's actions, as one byte: 5 * first + second.
+ACTIONS = critter_rules.ACTIONS
+ACTION_CODES = {action: i for i, action in enumerate(ACTIONS)}
+
+# What a class's totals are, in order.
+STATE_FIELDS = ('alive', 'wins', 'health', 'karma')
+
+
+class ReplayException(Exception):
+    pass
+
+
+def look_of(c):
+    "Returns a critter's (char, color) as something JSON can hold."
+    col = c.getColor()
+    return (c.getChar(), None if col is None else (col.r, col.g, col.b))
+
+
+def class_totals(model):
+    "Returns every class's alive, wins, health and karma, in one flat list."
+    totals = []
+    for state in model.critter_class_states.values():
+        totals += (state.alive, state.wins, state.health, state.karma)
+    return totals
+
+
+class Recorder():
+    """
+    Writes a model's run to a replay file as it goes. The model calls
+    begin, turn, fight and end from update; see critter_model.
+    """
+
+    def __init__(self, model, path, keyframe_every=DEFAULT_KEYFRAME_EVERY):
+        self.path = path
+        self.keyframe_every = keyframe_every
+        self.file = open(path, 'wb')
+        header = json.dumps({'width': model.width, 'height': model.height,
+                             'byteorder': sys.byteorder,
+                             'keyframe_every': keyframe_every}).encode('utf-8')
+        self.file.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        self.file.write(header)
+        self.index = []
+        # Critter -> replay id, for everyone alive.
+        self.ids = {}
+        self.next_id = 0
+        # Critter -> (char, color) as last written.
+        self.seen = {}
+        # This chunk's palette of looks, and its index of them.
+        self.palette = []
+        self.palette_index = {}
+        self.chunk = None
+        self.first_tick = self.tick = None
+        self.totals = None
+        # This tick's turns.
+        self.turn_ids = array.array('I')
+        self.codes = array.array('B')
+        self.actions = array.array('B')
+        self.fight_actions = None
+
+    def look_code(self, look, fresh):
+        "Returns look's place in the palette, adding it (and to fresh) if it's new."
+        code = self.palette_index.get(look)
+        if code is None:
+            code = self.palette_index[look] = len(self.palette)
+            self.palette.append(look)
+            fresh.append(look)
+        return code
+
+    def keyframe(self, model, tick):
+        "Starts a new chunk with every critter as it stands now."
+        # Whether it's just picking up where the last chunk left off, as
+        # opposed to there being new critters.
+        continues = self.chunk is not None and tick == self.tick and len(model.critters) == len(self.ids)
+        self.flush()
+        self.palette = []
+        self.palette_index = {}
+        classes = list(model.critter_class_states)
+        species = {c: i for i, c in enumerate(classes)}
+        columns = [array.array('I') for i in range(5)] + [array.array('i'), array.array('i')]
+        ids, kinds, xs, ys, looks, health, karma = columns
+        old_ids = self.ids
+        self.ids = {}
+        seen = {}
+        positions = model.critter_positions
+        for c in model.critters:
+            cid = old_ids.get(c)
+            if cid is None:
+                cid = self.next_id
+                self.next_id += 1
+            self.ids[c] = cid
+            look = self.seen.get(c) or look_of(c)
+            seen[c] = look
+            pos = positions[c]
+            ids.append(cid)
+            kinds.append(species[c.__class__])
+            xs.append(pos.x)
+            ys.append(pos.y)
+            looks.append(self.look_code(look, []))
+            health.append(c.health)
+            karma.append(c.karma)
+        self.seen = seen
+        self.totals = class_totals(model)
+        meta = json.dumps({'continues': continues,
+                           'classes': [[c.__module__, c.__qualname__] for c in classes],
+                           'counts': [s.count for s in model.critter_class_states.values()],
+                           'totals': self.totals,
+                           'palette': self.palette}).encode('utf-8')
+        self.chunk = [KEY.pack(tick, len(ids), len(meta)), meta] + [column.tobytes() for column in columns]
+        self.first_tick = self.tick = tick
+
+    def begin(self, model):
+        "A tick is starting. Starts a new chunk first if it's time to, or has to."
+        tick = model.move_count
+        if (self.chunk is None or tick != self.tick + 1 or len(model.critters) != len(self.ids) or
+                tick - self.first_tick > self.keyframe_every):
+            self.keyframe(model, tick - 1)
+        del self.turn_ids[:]
+        del self.codes[:]
+        del self.actions[:]
+
+    def fight(self, action1, action2):
+        "The two actions in the fight the current turn is having."
+        self.fight_actions = (action1, action2)
+
+    def turn(self, critter1, direction, fought, won, killed):
+        """
+        critter1 went direction, and maybe fought (and won). killed is
+        whoever died in the fight, if anybody did.
+        """
+        code = MOVE_CODES.get(direction, MOVE_CODES[critter.CENTER])
+        if fought:
+            code |= FOUGHT
+            action1, action2 = self.fight_actions
+            self.actions.append(5 * ACTION_CODES[action1] + ACTION_CODES[action2])
+            if won:
+                code |= WON
+        self.turn_ids.append(self.ids[critter1])
+        self.codes.append(code)
+        if killed is not None:
+            self.codes[-1] |= DIED
+            # Forget about them.
+            del self.ids[killed]
+            self.seen.pop(killed, None)
+
+    def end(self, model):
+        "The tick's over: writes it down, with whoever changed how they look."
+        look_ids = array.array('I')
+        look_codes = array.array('I')
+        fresh = []
+        seen = self.seen
+        ids = self.ids
+        for c in model.critters:
+            look = look_of(c)
+            if seen.get(c) != look:
+                seen[c] = look
+                look_ids.append(ids[c])
+                look_codes.append(self.look_code(look, fresh))
+        totals = class_totals(model)
+        deltas = array.array('q', [new - old for new, old in zip(totals, self.totals)])
+        self.totals = totals
+        fresh_bytes = json.dumps(fresh).encode('utf-8') if fresh else b''
+        self.tick = model.move_count
+        self.chunk += [TICK.pack(self.tick, len(self.codes), len(self.actions), len(look_ids), len(fresh_bytes)),
+                       self.turn_ids.tobytes(), self.codes.tobytes(), self.actions.tobytes(),
+                       look_ids.tobytes(), look_codes.tobytes(), fresh_bytes, deltas.tobytes()]
+
+    def flush(self):
+        "Writes out the chunk so far."
+        if self.chunk is None:
+            return
+        data = zlib.compress(b''.join(self.chunk))
+        self.index.append((self.first_tick, self.tick, self.file.tell()))
+        self.file.write(CHUNK.pack(self.first_tick, self.tick, len(data)))
+        self.file.write(data)
+        self.file.flush()
+        self.chunk = None
+
+    def close(self):
+        "Writes the last chunk and the index."
+        self.flush()
+        offset = self.file.tell()
+        index = array.array('q', [n for entry in self.index for n in entry])
+        self.file.write(index.tobytes())
+        self.file.write(TRAILER.pack(offset, INDEX_MAGIC))
+        self.file.close()
+
+
+class Board():
+    """
+    Where everything stands at some tick of a replay: every critter's
+    position, class and look, and every class's totals.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.steps = [critter_model.OFFSETS[direction] for direction in MOVES]
+        self.tick = None
+        self.positions = {}
+        self.grid = {}
+        self.species = {}
+        self.looks = {}
+        self.palette = []
+        self.names = []
+        self.classes = []
+        self.counts = []
+        self.totals = []
+
+    def glyph(self, cid):
+        char, rgb = self.palette[self.looks[cid]]
+        return (char, None if rgb is None else color.Color(*rgb))
+
+    def states(self):
+        "Returns class name -> (alive, wins, health, karma), like a Frame's."
+        totals = self.totals
+        return {name: tuple(totals[4 * i:4 * i + 4]) for i, name in enumerate(self.names)}
+
+    def stats(self):
+        "Returns what model.stats() said at this tick."
+        totals = self.totals
+        return {'tick': self.tick,
+                'classes': {name: dict(zip(STATE_FIELDS, totals[4 * i:4 * i + 4]))
+                            for i, name in enumerate(self.names)}}
+
+    def glyphs(self):
+        "Returns every critter's glyph, by (x, y)."
+        return {pos: self.glyph(cid) for pos, cid in self.grid.items()}
+
+
+class Reader():
+    "Walks through the records of one chunk."
+
+    def __init__(self, data, byteswap):
+        self.data = data
+        self.offset = 0
+        self.byteswap = byteswap
+
+    def done(self):
+        return self.offset >= len(self.data)
+
+    def unpack(self, layout):
+        values = layout.unpack_from(self.data, self.offset)
+        self.offset += layout.size
+        return values
+
+    def take(self, n):
+        value = self.data[self.offset:self.offset + n]
+        self.offset += n
+        return value
+
+    def column(self, typecode, n):
+        column = array.array(typecode)
+        column.frombytes(self.take(n * column.itemsize))
+        if self.byteswap and column.itemsize > 1:
+            column.byteswap()
+        return column
+
+    def keyframe(self, board):
+        """
+        Sets board to the chunk's keyframe. Returns whether it just picks
+        up where the last chunk left off.
+        """
+        tick, count, meta_length = self.unpack(KEY)
+        meta = json.loads(self.take(meta_length))
+        ids, kinds, xs, ys, looks = (self.column('I', count) for i in range(5))
+        self.column('i', count)
+        self.column('i', count)
+        board.tick = tick
+        board.classes = meta['classes']
+        board.names = [name for module, name in meta['classes']]
+        board.counts = meta['counts']
+        board.totals = meta['totals']
+        board.palette = [(char, rgb and tuple(rgb)) for char, rgb in meta['palette']]
+        board.positions = {cid: (x, y) for cid, x, y in zip(ids, xs, ys)}
+        board.grid = {pos: cid for cid, pos in board.positions.items()}
+        board.species = dict(zip(ids, kinds))
+        board.looks = dict(zip(ids, looks))
+        return meta['continues']
+
+    def tick(self, board, changed=None):
+        """
+        Plays the next tick onto board. Cells that changed get added to
+        changed; if that's None, only the class totals get worked out.
+        """
+        tick, turns, fights, look_changes, fresh_length = self.unpack(TICK)
+        if changed is None:
+            self.offset += 5 * turns + fights + 8 * look_changes + fresh_length
+        else:
+            ids = self.column('I', turns)
+            codes = self.take(turns)
+            self.offset += fights
+            look_ids = self.column('I', look_changes)
+            look_codes = self.column('I', look_changes)
+            fresh = self.take(fresh_length)
+            if fresh:
+                board.palette += [(char, rgb and tuple(rgb)) for char, rgb in json.loads(fresh)]
+            self.play(board, ids, codes, changed)
+            looks = board.looks
+            positions = board.positions
+            for cid, code in zip(look_ids, look_codes):
+                looks[cid] = code
+                changed.add(positions[cid])
+        deltas = self.column('q', len(board.totals))
+        board.totals = [total + delta for total, delta in zip(board.totals, deltas)]
+        board.tick = tick
+
+    def play(self, board, ids, codes, changed):
+        "Moves critters around the board the way their turns went."
+        positions = board.positions
+        grid = board.grid
+        steps = board.steps
+        width = board.width
+        height = board.height
+        for cid, code in zip(ids, codes):
+            old = positions[cid]
+            dx, dy = steps[code & MOVE_MASK]
+            new = ((old[0] + dx) % width, (old[1] + dy) % height)
+            if code & FOUGHT:
+                other = grid[new]
+                if code & WON:
+                    del grid[old]
+                    grid[new] = cid
+                    positions[cid] = new
+                    if code & DIED:
+                        del positions[other]
+                        del board.species[other]
+                        del board.looks[other]
+                    else:
+                        grid[old] = other
+                        positions[other] = old
+                elif code & DIED:
+                    del grid[old]
+                    del positions[cid]
+                    del board.species[cid]
+                    del board.looks[cid]
+                else:
+                    continue
+            elif new != old:
+                del grid[old]
+                grid[new] = cid
+                positions[cid] = new
+            else:
+                continue
+            changed.add(old)
+            changed.add(new)
+
+
+class Replay():
+    "A replay file, open for reading."
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_length = PREAMBLE.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ReplayException("That isn't a critter replay.")
+        if version != VERSION:
+            raise ReplayException("Can't read replay version %s." % version)
+        header = json.loads(self.data[PREAMBLE.size:PREAMBLE.size + header_length])
+        self.width = header['width']
+        self.height = header['height']
+        self.byteswap = header['byteorder'] != sys.byteorder
+        self.start = PREAMBLE.size + header_length
+        self.index = self.read_index()
+        if not self.index:
+            raise ReplayException("That replay doesn't have any ticks in it.")
+        self.first = self.index[0][0]
+        self.last = self.index[-1][1]
+
+    def read_index(self):
+        "Returns (first tick, last tick, offset) per chunk, from the index if there is one."
+        data = self.data
+        if len(data) >= self.start + TRAILER.size:
+            offset, magic = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+            if magic == INDEX_MAGIC:
+                index = array.array('q')
+                index.frombytes(data[offset:len(data) - TRAILER.size])
+                if self.byteswap:
+                    index.byteswap()
+                return [tuple(index[i:i + 3]) for i in range(0, len(index), 3)]
+        # No index, so the run didn't finish cleanly. Walk the chunks.
+        index = []
+        offset = self.start
+        while offset + CHUNK.size <= len(data):
+            first, last, length = CHUNK.unpack_from(data, offset)
+            if offset + CHUNK.size + length > len(data):
+                break
+            index.append((first, last, offset))
+            offset += CHUNK.size + length
+        return index
+
+    def reader(self, chunk):
+        "Returns a Reader for the chunk at position chunk in the index."
+        first, last, offset = self.index[chunk]
+        length = CHUNK.unpack_from(self.data, offset)[2]
+        start = offset + CHUNK.size
+        return Reader(zlib.decompress(self.data[start:start + length]), self.byteswap)
+
+    def chunk_for(self, tick):
+        """
+        Returns which chunk to play tick from: the last one that starts
+        before it, so a chunk starting at tick with critters added only
+        counts from the tick after.
+        """
+        lo, hi = 0, len(self.index) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.index[mid][0] < tick:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def seek(self, tick):
+        """
+        Returns a Board as of tick (clamped to the replay), and a Reader
+        and chunk number to carry on from.
+        """
+        tick = max(self.first, min(tick, self.last))
+        chunk = self.chunk_for(tick)
+        reader = self.reader(chunk)
+        board = Board(self.width, self.height)
+        reader.keyframe(board)
+        scratch = set()
+        while board.tick < tick:
+            reader.tick(board, scratch)
+        return board, reader, chunk
+
+    def boards(self, start=None, stop=None, changes=True):
+        """
+        Yields (board, changed cells) once for every tick from start to
+        stop, inclusive. The board is the same object every time, updated
+        in place, and changed is None when the whole board needs redrawing.
+        With changes off, only the class totals get kept up to date, and
+        changed is always None.
+        """
+        start = self.first if start is None else start
+        stop = self.last if stop is None else stop
+        board, reader, chunk = self.seek(start)
+        yield board, None
+        redraw = False
+        while board.tick < stop:
+            if reader.done():
+                chunk += 1
+                if chunk >= len(self.index):
+                    return
+                reader = self.reader(chunk)
+                if not reader.keyframe(board):
+                    # Critters got added between ticks. They show up
+                    # with the next tick, which gets redrawn whole, the
+                    # same way model.stats() only sees them after it.
+                    redraw = True
+                continue
+            changed = set() if changes else None
+            reader.tick(board, changed)
+            if redraw:
+                changed = None
+                redraw = False
+            yield board, changed
+
+    def frames(self, start=None, stop=None):
+        "Yields a critter_runner.Frame per tick, like a Runner would."
+        for board, changed in self.boards(start, stop):
+            if changed is None:
+                yield critter_runner.Frame(board.tick, True, board.glyphs(), board.states())
+                continue
+            grid = board.grid
+            glyphs = {pos: board.glyph(grid[pos]) if pos in grid else None for pos in changed}
+            yield critter_runner.Frame(board.tick, False, glyphs, board.states())
+
+    def stats(self, start=None, stop=None):
+        "Yields what model.stats() said, per tick. Positions don't get worked out at all."
+        for board, changed in self.boards(start, stop, changes=False):
+            yield board.stats()
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+class View():
+    """
+    What CritterGUI needs from a model, for showing a replay: the world
+    size, and the classes (stand-ins named after the real ones, so no
+    critter code gets imported) with their ClassInfos at the start.
+    """
+    profiler = None
+
+    def __init__(self, replay):
+        self.width = replay.width
+        self.height = replay.height
+        board = replay.seek(replay.first)[0]
+        self.critter_class_states = {}
+        for i, name in enumerate(board.names):
+            alive, wins, health, karma = board.totals[4 * i:4 * i + 4]
+            state = critter_model.ClassInfo(wins, alive, board.counts[i], karma)
+            state.health = health
+            self.critter_class_states[type(name, (), {})] = state
+
+
+class Player():
+    """
+    Plays a Replay with the same go, stop, step, reset, take_frame and
+    tick_rate as a critter_runner.Runner, so CritterGUI can show it. With
+    tick_rate None it plays FAST_TICKS ticks a frame.
+    """
+    FAST_TICKS = 100
+
+    def __init__(self, replay, tick_rate=None):
+        self.replay = replay
+        self.tick_rate = tick_rate
+        self.running = False
+        self.steps = 0
+        self.frames = replay.frames()
+        self.front = None
+        self.owed = 0.0
+        self.last = time.perf_counter()
+        self.advance(1)
+
+    def advance(self, n):
+        "Folds the next n frames into the front buffer."
+        for i in range(n):
+            frame = next(self.frames, None)
+            if frame is None:
+                self.running = False
+                return
+            old = self.front
+            if old is not None and not frame.full:
+                old.glyphs.update(frame.glyphs)
+                frame = frame._replace(full=old.full, glyphs=old.glyphs)
+            self.front = frame
+
+    def take_frame(self):
+        now = time.perf_counter()
+        if self.running:
+            if self.tick_rate:
+                self.owed += (now - self.last) * self.tick_rate
+                n = int(self.owed)
+                self.owed -= n
+            else:
+                n = self.FAST_TICKS
+            self.advance(n)
+        elif self.steps:
+            self.advance(self.steps)
+            self.steps = 0
+        self.last = now
+        frame, self.front = self.front, None
+        return frame
+
+    def go(self):
+        self.running = True
+        self.last = time.perf_counter()
+
+    def stop(self):
+        self.running = False
+
+    def step(self):
+        self.running = False
+        self.steps += 1
+
+    def reset(self, num_critters):
+        "Back to the start."
+        self.running = False
+        self.front = None
+        self.frames = self.replay.frames()
+        self.advance(1)
+
+    def close(self):
+        pass
@@ -0,0 +1,170 @@
+"""
+The rules of a Critter fight, compiled into a table.
+
+Every encounter comes down to a pair of actions, and there are only five
+actions, so instead of working the rules out again in every fight we work
+them out once per Rules object into a 5x5 table of Outcomes. The model
+looks up single encounters in it, and resolve_batch() does whole arrays
+of encounters at once off the same table (that one needs NumPy).
+"""
+import collections
+import critter
+
+# Default rule constants. Pass different ones to Rules to change them
+# for a particular model.
+ATTACK_DAMAGE = critter.DAMAGE_ATTACKED
+HEAL_RESTORE = 50
+DEFEND_KARMA = 1
+PARTY_KARMA = 3
+HEAL_KARMA = 5
+MAX_HEALTH = 100
+
+# Row/column order of the table.
+ACTIONS = (critter.ROAR, critter.SCRATCH, critter.POUNCE, critter.PARTY, critter.HEAL)
+ACTION_INDEX = {action: i for i, action in enumerate(ACTIONS)}
+
+FIGHTS = (critter.ROAR, critter.SCRATCH, critter.POUNCE)
+# Rock, paper, scissors: each fight beats the one it maps to.
+BEATS = {critter.ROAR: critter.SCRATCH,
+         critter.SCRATCH: critter.POUNCE,
+         critter.POUNCE: critter.ROAR}
+
+# What happens to both critters. health and karma always apply (health
+# is clamped to [0, max_health]). healed1 is health restored to critter 1
+# by critter 2, which only lands if critter 1 isn't at full health, and
+# heal_karma2 is what critter 2 earns when it does. Same the other way.
+Deltas = collections.namedtuple('Deltas', ['health1', 'health2', 'karma1', 'karma2',
+                                           'healed1', 'healed2', 'heal_karma1', 'heal_karma2'],
+                                defaults=(0,) * 8)
+
+# p1 is the chance critter 1 wins. win1 is what happens if it does,
+# win2 if critter 2 does instead.
+Outcome = collections.namedtuple('Outcome', ['p1', 'win1', 'win2'])
+
+
+class Rules():
+    """
+    One set of rule constants and the outcome table compiled from them.
+    """
+
+    def __init__(self, attack_damage=ATTACK_DAMAGE, heal_restore=HEAL_RESTORE,
+                 defend_karma=DEFEND_KARMA, party_karma=PARTY_KARMA,
+                 heal_karma=HEAL_KARMA, attack_party_karma=None,
+                 attack_heal_karma=None, max_health=MAX_HEALTH):
+        self.attack_damage = attack_damage
+        self.heal_restore = heal_restore
+        self.defend_karma = defend_karma
+        self.party_karma = party_karma
+        self.heal_karma = heal_karma
+        # Attacking someone who wanted to party or heal costs you the
+        # karma they would have made, unless told otherwise.
+        self.attack_party_karma = -party_karma if attack_party_karma is None else attack_party_karma
+        self.attack_heal_karma = -heal_karma if attack_heal_karma is None else attack_heal_karma
+        self.max_health = max_health
+        self.table = [[self.compile(a1, a2) for a2 in ACTIONS] for a1 in ACTIONS]
+        # The table as NumPy arrays, once resolve_batch needs them.
+        self.arrays = None
+
+    def compile(self, action1, action2):
+        "Works out the Outcome of critter 1 doing action1 to action2."
+        fight1 = action1 in FIGHTS
+        fight2 = action2 in FIGHTS
+        if fight1 and fight2:
+            win1 = Deltas(health2=-self.attack_damage, karma1=self.defend_karma)
+            win2 = Deltas(health1=-self.attack_damage, karma2=self.defend_karma)
+            if BEATS[action1] == action2:
+                p1 = 1.0
+            elif action1 == action2:
+                p1 = .5
+            else:
+                p1 = 0.0
+            return Outcome(p1, win1, win2)
+        elif fight1:
+            # only critter 1 chose to fight, so they win by default
+            karma = self.attack_party_karma if action2 == critter.PARTY else self.attack_heal_karma
+            deltas = Deltas(health2=-self.attack_damage, karma1=karma)
+            return Outcome(1.0, deltas, deltas)
+        elif fight2:
+            karma = self.attack_party_karma if action1 == critter.PARTY else self.attack_heal_karma
+            deltas = Deltas(health1=-self.attack_damage, karma2=karma)
+            return Outcome(0.0, deltas, deltas)
+        else:
+            # nobody fought: partiers party, healers heal, and the winner
+            # is picked at random
+            deltas = Deltas(karma1=self.party_karma if action1 == critter.PARTY else 0,
+                            karma2=self.party_karma if action2 == critter.PARTY else 0,
+                            healed1=self.heal_restore if action2 == critter.HEAL else 0,
+                            healed2=self.heal_restore if action1 == critter.HEAL else 0,
+                            heal_karma1=self.heal_karma if action1 == critter.HEAL else 0,
+                            heal_karma2=self.heal_karma if action2 == critter.HEAL else 0)
+            return Outcome(.5, deltas, deltas)
+
+    def outcome(self, action1, action2):
+        "Looks up the Outcome for a single encounter."
+        return self.table[ACTION_INDEX[action1]][ACTION_INDEX[action2]]
+
+    def apply(self, deltas, health1, health2):
+        """
+        Applies deltas to the two critters' current health. Returns
+        (health1, health2, karma1, karma2): the new health of each and
+        the karma each earned.
+        """
+        karma1 = deltas.karma1
+        karma2 = deltas.karma2
+        new1 = health1 + deltas.health1
+        new2 = health2 + deltas.health2
+        # note: nothing happens if you try to heal a critter with
+        # perfect health
+        if deltas.healed1 and health1 < self.max_health:
+            new1 += deltas.healed1
+            karma2 += deltas.heal_karma2
+        if deltas.healed2 and health2 < self.max_health:
+            new2 += deltas.healed2
+            karma1 += deltas.heal_karma1
+        return (min(self.max_health, max(0, new1)),
+                min(self.max_health, max(0, new2)),
+                karma1, karma2)
+
+    def resolve_batch(self, actions1, actions2, health1, health2, rolls):
+        """
+        Resolves a whole array of encounters at once, the same way
+        outcome() and apply() do one. actions1 and actions2 are table
+        indexes (see ACTION_INDEX), health1 and health2 are the critters'
+        current health, and critter 1 wins where its roll (a uniform [0, 1)
+        draw) is below its chance of winning, like CritterModel.interact.
+
+        Returns (won1, health1, health2, karma1, karma2) as arrays: whether
+        critter 1 won, both critters' new health, and the karma each
+        earned.
+        """
+        import numpy as np
+        if self.arrays is None:
+            self.arrays = self.compile_arrays()
+        p1, win1, win2 = self.arrays
+        actions1 = np.asarray(actions1, dtype=np.intp)
+        actions2 = np.asarray(actions2, dtype=np.intp)
+        health1 = np.asarray(health1, dtype=np.int64)
+        health2 = np.asarray(health2, dtype=np.int64)
+        won1 = np.asarray(rolls) < p1[actions1, actions2]
+        # One row of Deltas per encounter, from whichever side won.
+        d = np.where(won1[:, None], win1[actions1, actions2], win2[actions1, actions2])
+        karma1 = d[:, 2].copy()
+        karma2 = d[:, 3].copy()
+        new1 = health1 + d[:, 0]
+        new2 = health2 + d[:, 1]
+        healed1 = (d[:, 4] != 0) & (health1 < self.max_health)
+        healed2 = (d[:, 5] != 0) & (health2 < self.max_health)
+        new1 += np.where(healed1, d[:, 4], 0)
+        karma2 += np.where(healed1, d[:, 7], 0)
+        new2 += np.where(healed2, d[:, 5], 0)
+        karma1 += np.where(healed2, d[:, 6], 0)
+        return (won1, np.clip(new1, 0, self.max_health), np.clip(new2, 0, self.max_health),
+                karma1, karma2)
+
+    def compile_arrays(self):
+        "Turns the table into NumPy arrays for resolve_batch: p1, and the Deltas of win1 and win2."
+        import numpy as np
+        p1 = np.array([[o.p1 for o in row] for row in self.table])
+        win1 = np.array([[o.win1 for o in row] for row in self.table], dtype=np.int64)
+        win2 = np.array([[o.win2 for o in row] for row in self.table], dtype=np.int64)
+        return p1, win1, win2
@@ -0,0 +1,166 @@
+"""
+Runs a CritterModel on its own thread, so the simulation isn't held back
+by whoever is watching it.
+
+The Runner ticks the model as fast as its tick rate allows and publishes
+Frames: immutable snapshots of what changed on the board, plus the class
+stats. There's a single front buffer. The runner only fills it once the
+viewer has taken the last frame, and until then changes keep piling up
+in the model's changed-cell set. So a slow viewer just sees fewer,
+bigger frames and never holds up the simulation.
+
+Once a Runner is started, its thread is the only one that touches the
+model, so viewers never wait on the simulation and vice versa.
+"""
+import collections
+import threading
+import time
+
+# A snapshot for drawing. glyphs maps (x, y) to (char, color), or to None
+# for a cell that's now empty. If full is set, glyphs covers every critter
+# on the board and every other cell is empty. states maps class name to
+# (alive, wins, health, karma).
+Frame = collections.namedtuple('Frame', ['tick', 'full', 'glyphs', 'states'])
+
+
+def snapshot(model):
+    """
+    Builds a Frame from everything that changed on model since the last
+    one. Only changed cells get looked at, so a frame costs about as much
+    as what happened since the last one, not as much as the whole board.
+    """
+    changed = model.take_changed_cells()
+    full = changed is None
+    glyphs = {}
+    if full:
+        for critter, pos in model.critter_positions.items():
+            glyphs[(pos.x, pos.y)] = (critter.getChar(), critter.getColor())
+    else:
+        grid = model.grid
+        for pos in changed:
+            critter = grid[pos.x][pos.y]
+            glyphs[(pos.x, pos.y)] = (critter.getChar(), critter.getColor()) if critter else None
+    stats = model.stats()
+    states = {name: (s['alive'], s['wins'], s['health'], s['karma'])
+              for name, s in stats['classes'].items()}
+    return Frame(model.move_count, full, glyphs, states)
+
+
+class Runner():
+    """
+    Owns the thread that updates a model. tick_rate is the target number
+    of ticks per second, or None to go flat out.
+
+    go, stop, step and reset just leave the thread instructions.
+    """
+
+    def __init__(self, model, tick_rate=None):
+        self.model = model
+        self.tick_rate = tick_rate
+        self.running = False
+        self.closed = False
+        # Single ticks asked for while paused.
+        self.steps = 0
+        # Critter count for a reset that's been asked for, if any.
+        self.pending_reset = None
+        # Whether there are changes the viewer hasn't gotten a frame for.
+        self.unpublished = True
+        self.front = None
+        self.frame_lock = threading.Lock()
+        self.wake = threading.Condition()
+        model.track_changes()
+        self.thread = threading.Thread(target=self.loop, name='critter-runner', daemon=True)
+        self.thread.start()
+
+    def loop(self):
+        next_tick = time.perf_counter()
+        while True:
+            with self.wake:
+                while not (self.running or self.steps or self.closed or
+                           self.pending_reset is not None or self.unpublished):
+                    self.wake.wait()
+                    next_tick = time.perf_counter()
+                if self.closed:
+                    return
+                reset, self.pending_reset = self.pending_reset, None
+                tick = reset is None and (self.running or self.steps > 0)
+                if tick and not self.running:
+                    self.steps -= 1
+                running = self.running
+            if reset is not None:
+                self.model.reset(reset)
+                self.unpublished = True
+            elif tick:
+                self.model.update()
+                self.unpublished = True
+            if self.front is None or not running:
+                # Frames go out as fast as they're taken, and always once
+                # things go quiet.
+                self.publish()
+            rate = self.tick_rate
+            if tick and running and rate:
+                next_tick += 1.0 / rate
+                delay = next_tick - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # Running behind; don't try to catch up in a burst.
+                    next_tick = time.perf_counter()
+
+    def publish(self):
+        """
+        Fills the front buffer, folding in the frame that's already there
+        if the viewer hasn't taken it yet.
+        """
+        frame = snapshot(self.model)
+        with self.frame_lock:
+            old = self.front
+            if old is not None and not frame.full:
+                glyphs = old.glyphs
+                glyphs.update(frame.glyphs)
+                frame = frame._replace(full=old.full, glyphs=glyphs)
+            self.front = frame
+            self.unpublished = False
+
+    def take_frame(self):
+        """
+        Returns the newest Frame, or None if nothing has happened since the
+        last one. Safe to call from any thread, and never waits on the model.
+        """
+        with self.frame_lock:
+            frame, self.front = self.front, None
+        return frame
+
+    def go(self):
+        "Start ticking continuously."
+        with self.wake:
+            self.running = True
+            self.wake.notify()
+
+    def stop(self):
+        "Pause after the current tick."
+        with self.wake:
+            self.running = False
+            self.steps = 0
+
+    def step(self):
+        "Pause, then run exactly one more tick."
+        with self.wake:
+            self.running = False
+            self.steps += 1
+            self.wake.notify()
+
+    def reset(self, num_critters):
+        "Pause and reset the model."
+        with self.wake:
+            self.running = False
+            self.steps = 0
+            self.pending_reset = num_critters
+            self.wake.notify()
+
+    def close(self):
+        "Stops the thread for good."
+        with self.wake:
+            self.closed = True
+            self.wake.notify()
+        self.thread.join()
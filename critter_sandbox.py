@@ -0,0 +1,554 @@
+"""
+Runs critter classes nobody has vetted in worker processes, on a time
+budget.
+
+Wrap a class with Sandbox.wrap and use what it returns in its place. The
+model gets a stand-in class with the same name, whose critters are just
+handles: the real ones live in a worker process, one per wrapped class,
+and every getMove, interact, interactionOver, getChar and getColor runs
+over there. So a critter that loops forever only costs its own class.
+
+    sandbox = critter_sandbox.Sandbox(call_budget=0.01, tick_budget=0.2)
+    model.add(sandbox.wrap(student.Student), 25)
+    ...
+    sandbox.close()
+
+Calls go over in batches. At the start of a tick the model asks every
+worker for all its critters' moves at once (see CritterModel.plan_moves),
+so the workers think in parallel and a tick costs one round trip per
+class. Since they all decide together, getMove sees the board as it was
+when the tick started rather than as it is when the critter's turn comes
+up. interact is not batched: it has to be asked when the fight happens,
+so every fight a sandboxed critter gets into is a round trip of its own.
+interactionOver gets held back and sent along with whatever goes to the
+worker next.
+
+Budgets, and what happens when they run out:
+
+  - A call that takes longer than call_budget seconds is cut off, the
+    critter gets CENTER (for a move) or ROAR (for an action) instead,
+    and it's benched: it does the default from then on without being
+    asked. Same for a call that raises or answers with something that
+    isn't a real move or action.
+  - Each class gets tick_budget seconds a tick for everything its
+    critters do: the moves batch, every interact, getChar and getColor,
+    and the held-back creations and interactionOvers. The clock starts
+    over with the moves batch at the start of the tick. Once it's used
+    up, every call for the rest of the tick gets a default without
+    being asked.
+  - A worker that doesn't answer within its budget plus GRACE seconds
+    (stuck in C code, say) gets killed, and its whole class is benched.
+
+Every default handed out gets counted in sandbox.flags. Calls get cut
+off with SIGALRM, so the per-call budget needs a Unix; elsewhere only
+the GRACE deadline applies.
+"""
+import collections
+import critter
+import critter_model
+import critter_random
+import importlib
+import itertools
+import multiprocessing
+import signal
+import time
+import traceback
+
+# What a critter does instead, once it's over budget.
+DEFAULT_MOVE = critter.CENTER
+DEFAULT_ACTION = critter.ROAR
+
+# Extra seconds a worker gets to answer, on top of its budget, before
+# it's given up on.
+GRACE = 1.0
+
+# The directions a critter can look in, in the order their neighbors
+# get sent over.
+LOOK = tuple(critter_model.OFFSETS)
+LOOK_INDEX = {direction: i for i, direction in enumerate(LOOK)}
+
+
+class OverBudget(BaseException):
+    "Raised inside a call that ran out of time. Not an Exception, so a bare except won't eat it."
+
+
+class SandboxException(Exception):
+    pass
+
+
+def look(model, pos):
+    "Returns what's around pos, as a (class name, health) pair per direction in LOOK."
+    grid = model.grid
+    around = []
+    for xs, ys in (model.steps[direction] for direction in LOOK):
+        neighbor = grid[xs[pos.x]][ys[pos.y]]
+        around.append((neighbor.__class__.__name__, neighbor.health) if neighbor else ('.', 0))
+    return around
+
+
+class RemoteInfo():
+    """
+    A CritterInfo for the worker side: a copy of what the critter could
+    see when it was asked.
+    """
+    __slots__ = ('x', 'y', 'width', 'height', 'char', 'color', 'random', 'around')
+
+    def __init__(self, width, height, random):
+        self.width = width
+        self.height = height
+        self.random = random
+
+    def point_at(self, x, y, char, color, around):
+        self.x = x
+        self.y = y
+        self.char = char
+        self.color = color
+        self.around = around
+        return self
+
+    def getNeighbor(self, direction):
+        "Returns the class name of the neighbor that way, or '.' if empty."
+        return self.around[LOOK_INDEX.get(direction, LOOK_INDEX[critter.CENTER])][0]
+
+    def getNeighborHealth(self, direction):
+        "Returns the health of the neighbor that way, or 0 if empty."
+        return self.around[LOOK_INDEX.get(direction, LOOK_INDEX[critter.CENTER])][1]
+
+    def __repr__(self):
+        return 'CritterInfo(x=%s, y=%s, width=%s, height=%s, char=%r, color=%r)' % (
+            self.x, self.y, self.width, self.height, self.char, self.color)
+
+
+def alarm(signum, frame):
+    raise OverBudget()
+
+
+class Host():
+    """
+    The worker side: the real critters of one class, by id, and the
+    clock they run on.
+    """
+
+    def __init__(self, critter_class, width, height, seed, call_budget, tick_budget):
+        self.critter_class = critter_class
+        self.critters = {}
+        self.info = RemoteInfo(width, height, critter_random.CritterRandom(seed))
+        self.call_budget = call_budget
+        self.tick_budget = tick_budget
+        self.timer = hasattr(signal, 'setitimer')
+        if self.timer:
+            signal.signal(signal.SIGALRM, alarm)
+        # Time left in the current tick.
+        self.left = tick_budget
+        # Ids benched during the current request, with why.
+        self.faults = []
+        # Defaults handed out because the tick ran out of time.
+        self.skipped = 0
+
+    def call(self, cid, func, *args):
+        """
+        Calls func(*args) on the clock. Returns (True, result), or (False,
+        None) if it ran over or blew up, after benching cid.
+        """
+        if self.left <= 0:
+            self.skipped += 1
+            return False, None
+        budget = min(self.call_budget, self.left)
+        start = time.perf_counter()
+        if self.timer:
+            signal.setitimer(signal.ITIMER_REAL, budget)
+        try:
+            result = func(*args)
+            ok = True
+        except OverBudget:
+            ok = False
+            reason = 'timeout'
+        except Exception:
+            ok = False
+            reason = 'error'
+        finally:
+            if self.timer:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+            spent = time.perf_counter() - start
+            self.left -= spent
+        if ok and spent > budget:
+            # No timer to stop it, but it still ran over.
+            ok = False
+            reason = 'timeout'
+        if not ok:
+            self.bench(cid, reason)
+            return False, None
+        return True, result
+
+    def bench(self, cid, reason):
+        self.critters.pop(cid, None)
+        self.faults.append((cid, reason))
+
+    def checked(self, cid, ok, value, verify):
+        "Returns value if it's a real move or action (per verify), or None."
+        if not ok:
+            return None
+        try:
+            verify(value)
+        except Exception:
+            self.bench(cid, 'error')
+            return None
+        return value
+
+    def catch_up(self, pending):
+        "Applies the creations and interactionOvers the model held back, in order."
+        for op in pending:
+            if op[0] == 'new':
+                cid, args = op[1], op[2]
+                if self.left <= 0:
+                    # No time left to even build it.
+                    self.bench(cid, 'tick')
+                    continue
+                ok, c = self.call(cid, self.critter_class, *args)
+                if ok:
+                    self.critters[cid] = c
+            else:
+                cid, won, opp_fight = op[1], op[2], op[3]
+                c = self.critters.get(cid)
+                if c is not None:
+                    self.call(cid, c.interactionOver, won, opp_fight)
+
+    def looks(self, cids):
+        "Returns {id: (char, color)} for whichever of cids are still playing."
+        looks = {}
+        for cid in cids:
+            c = self.critters.get(cid)
+            if c is None:
+                continue
+            if self.left <= 0:
+                # They'll keep looking how they did.
+                break
+            ok, char = self.call(cid, c.getChar)
+            if ok:
+                ok, color = self.call(cid, c.getColor)
+            if ok:
+                looks[cid] = (char, color)
+        return looks
+
+    def moves(self, batch):
+        """
+        batch is a list of (id, health, karma, x, y, char, color, around),
+        one per live critter of the class. Returns the moves, lined up
+        with it (None for a default). Anybody not in it is dead, and gets
+        forgotten.
+        """
+        live = {item[0] for item in batch}
+        for cid in [cid for cid in self.critters if cid not in live]:
+            del self.critters[cid]
+        moves = []
+        for cid, health, karma, x, y, char, color, around in batch:
+            c = self.critters.get(cid)
+            if c is None:
+                moves.append(None)
+                continue
+            c.health = health
+            c.karma = karma
+            ok, direction = self.call(cid, c.getMove, self.info.point_at(x, y, char, color, around))
+            moves.append(self.checked(cid, ok, direction, critter_model.CritterModel.verify_move))
+        return moves
+
+    def interact(self, item):
+        "item is (id, health, karma, opponent x, y, char, color, around). Returns the action, or None."
+        cid, health, karma, x, y, char, color, around = item
+        c = self.critters.get(cid)
+        if c is None:
+            return None
+        c.health = health
+        c.karma = karma
+        ok, action = self.call(cid, c.interact, self.info.point_at(x, y, char, color, around))
+        return self.checked(cid, ok, action, critter_model.CritterModel.verify_action)
+
+    def handle(self, kind, pending, body):
+        """
+        Runs one request. Returns (answer, looks, faults, skipped). A
+        'moves' request starts a new tick, and with it a new tick_budget;
+        everything else is charged against what's left of this tick's.
+        """
+        if kind == 'moves':
+            self.left = self.tick_budget
+        self.faults = []
+        self.skipped = 0
+        self.catch_up(pending)
+        if kind == 'moves':
+            answer = self.moves(body)
+            touched = [item[0] for item in body]
+        elif kind == 'interact':
+            answer = self.interact(body)
+            touched = [body[0]]
+        else:
+            answer = None
+            touched = []
+        touched += [op[1] for op in pending]
+        return answer, self.looks(touched), self.faults, self.skipped
+
+
+def worker(conn, spec, width, height, seed, call_budget, tick_budget):
+    "Worker process main loop: handle requests until told to stop with None."
+    try:
+        module_name, name = spec
+        critter_class = getattr(importlib.import_module(module_name), name)
+        host = Host(critter_class, width, height, seed, call_budget, tick_budget)
+    except Exception:
+        conn.send((False, traceback.format_exc()))
+        return
+    conn.send((True, None))
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        conn.send((True, host.handle(*task)))
+    conn.close()
+
+
+class Remote(critter.Critter):
+    """
+    The model's handle on a critter that lives in a sandbox worker.
+    Sandbox.wrap makes a subclass of this per wrapped class.
+    """
+    DISCOVERABLE = False
+    SANDBOX = None
+    # The class this stands in for.
+    REAL = None
+
+    def __init__(self, *args):
+        critter.Critter.__init__(self)
+        self.char = None
+        self.color = None
+        # Why this critter got benched, if it has been.
+        self.benched = self.SANDBOX.create(self, args)
+
+    def getChar(self):
+        if self.char is None and self.benched is None:
+            self.SANDBOX.sync(self.__class__)
+        return self.char if self.char is not None else '?'
+
+    def getColor(self):
+        if self.char is None and self.benched is None:
+            self.SANDBOX.sync(self.__class__)
+        return self.color
+
+    def getMove(self, info):
+        return self.SANDBOX.moves([self], info.model)[0]
+
+    def interact(self, oppInfo):
+        return self.SANDBOX.interact(self, oppInfo)
+
+    def over(self, won, oppFight):
+        "Stands in for interactionOver, if the real class has one."
+        self.SANDBOX.queue_over(self, won, oppFight)
+
+
+class Lane():
+    "The model side of one worker: its process, pipe and held-back calls."
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.pending = []
+        # The critters created since the last request, by id.
+        self.created = {}
+        self.dead = False
+
+
+class Sandbox():
+    """
+    Runs wrapped critter classes in worker processes, one per class.
+    call_budget is the seconds a single call gets, and tick_budget the
+    seconds a class gets for a whole tick. flags maps class name to
+    {reason: count} of defaults handed out: 'timeout' and 'error' for
+    critters that got benched, 'tick' for calls skipped because the
+    tick ran out of time, and 'killed' when a worker had to be killed.
+    Call close() when done.
+    """
+
+    def __init__(self, call_budget=0.01, tick_budget=0.25, width=50, height=40, seed=0):
+        self.call_budget = call_budget
+        self.tick_budget = tick_budget
+        # The worker side only needs these for info.width and info.height,
+        # and to seed info.random.
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.lanes = {}
+        self.ids = {}
+        self.next_id = itertools.count()
+        self.flags = collections.defaultdict(collections.Counter)
+
+    def wrap(self, critter_class):
+        """
+        Returns the stand-in class for critter_class, starting its worker
+        the first time. critter_class has to be importable by name.
+        """
+        for stand_in in self.lanes:
+            if stand_in.REAL is critter_class:
+                return stand_in
+        attrs = {'SANDBOX': self, 'REAL': critter_class, '__module__': critter_class.__module__,
+                 '__qualname__': critter_class.__qualname__}
+        if critter_class.interactionOver is not critter.Critter.interactionOver:
+            attrs['interactionOver'] = Remote.over
+        stand_in = type(critter_class.__name__, (Remote,), attrs)
+        parent_conn, child_conn = multiprocessing.Pipe()
+        args = (child_conn, (critter_class.__module__, critter_class.__qualname__),
+                self.width, self.height, (self.seed * 1000003 + len(self.lanes)) % 2 ** 63,
+                self.call_budget, self.tick_budget)
+        process = multiprocessing.Process(target=worker, args=args, daemon=True)
+        process.start()
+        child_conn.close()
+        ok, error = parent_conn.recv()
+        if not ok:
+            process.join()
+            raise SandboxException("Couldn't load %s in a sandbox:\n%s" % (critter_class.__name__, error))
+        self.lanes[stand_in] = Lane(process, parent_conn)
+        return stand_in
+
+    def create(self, handle, args):
+        "Queues up building the real critter behind handle. Returns why it's benched, if it is."
+        lane = self.lanes[handle.__class__]
+        if lane.dead:
+            self.flags[handle.__class__.__name__]['killed'] += 1
+            return 'killed'
+        cid = next(self.next_id)
+        self.ids[handle] = cid
+        lane.pending.append(('new', cid, args))
+        lane.created[cid] = handle
+        return None
+
+    def queue_over(self, handle, won, opp_fight):
+        "Holds back an interactionOver until the worker hears from us next."
+        if handle.benched is None:
+            self.lanes[handle.__class__].pending.append(('over', self.ids[handle], won, opp_fight))
+
+    def send(self, stand_in, kind, body):
+        lane = self.lanes[stand_in]
+        pending, lane.pending = lane.pending, []
+        lane.conn.send((kind, pending, body))
+
+    def receive(self, stand_in, handles):
+        """
+        Waits (up to tick_budget plus GRACE) for a worker's answer, and
+        files away what came with it.
+        Returns the answer, or None if the worker had to be killed.
+        """
+        lane = self.lanes[stand_in]
+        created, lane.created = lane.created, {}
+        reply = None
+        if lane.conn.poll(self.tick_budget + GRACE):
+            try:
+                ok, reply = lane.conn.recv()
+            except (EOFError, OSError):
+                pass
+        if reply is None:
+            self.kill(stand_in, list(handles.values()) + list(created.values()))
+            return None
+        answer, looks, faults, skipped = reply
+        everyone = dict(created)
+        everyone.update(handles)
+        flags = self.flags[stand_in.__name__]
+        for cid, (char, color) in looks.items():
+            handle = everyone.get(cid)
+            if handle is not None:
+                handle.char = char
+                handle.color = color
+        for cid, reason in faults:
+            handle = everyone.get(cid)
+            if handle is not None and handle.benched is None:
+                handle.benched = reason
+                flags[reason] += 1
+        if skipped:
+            flags['tick'] += skipped
+        return answer
+
+    def kill(self, stand_in, handles):
+        "Gives up on a worker that stopped answering, and benches its class."
+        lane = self.lanes[stand_in]
+        lane.dead = True
+        lane.pending = []
+        if lane.process.is_alive():
+            lane.process.kill()
+        lane.process.join()
+        lane.conn.close()
+        flags = self.flags[stand_in.__name__]
+        for handle in handles:
+            if handle.benched is None:
+                handle.benched = 'killed'
+                flags['killed'] += 1
+
+    def sync(self, stand_in):
+        "Sends over anything held back for stand_in's worker, so its looks are known."
+        lane = self.lanes[stand_in]
+        if lane.dead:
+            return
+        self.send(stand_in, 'sync', None)
+        self.receive(stand_in, {})
+
+    def moves(self, handles, model):
+        """
+        Asks every worker for the moves of their critters in handles, all
+        at once. Returns the moves lined up with handles, with defaults
+        for anybody benched or over budget.
+        """
+        by_class = {}
+        for i, handle in enumerate(handles):
+            if handle.benched is None:
+                by_class.setdefault(handle.__class__, []).append(i)
+        moves = [DEFAULT_MOVE] * len(handles)
+        positions = model.critter_positions
+        asked = []
+        for stand_in, indices in by_class.items():
+            if self.lanes[stand_in].dead:
+                continue
+            batch = []
+            for i in indices:
+                handle = handles[i]
+                pos = positions[handle]
+                batch.append((self.ids[handle], handle.health, handle.karma, pos.x, pos.y,
+                              handle.char, handle.color, look(model, pos)))
+            self.send(stand_in, 'moves', batch)
+            asked.append((stand_in, indices))
+        for stand_in, indices in asked:
+            answer = self.receive(stand_in, {self.ids[handles[i]]: handles[i] for i in indices})
+            if answer is None:
+                continue
+            for i, direction in zip(indices, answer):
+                if direction is not None:
+                    moves[i] = direction
+        return moves
+
+    def interact(self, handle, info):
+        "Asks handle's worker what it does to whoever info is pointed at."
+        stand_in = handle.__class__
+        if handle.benched is not None or self.lanes[stand_in].dead:
+            return DEFAULT_ACTION
+        pos = critter_model.Point(info.x, info.y)
+        body = (self.ids[handle], handle.health, handle.karma, info.x, info.y,
+                info.char, info.color, look(info.model, pos))
+        self.send(stand_in, 'interact', body)
+        action = self.receive(stand_in, {self.ids[handle]: handle})
+        return action if action is not None else DEFAULT_ACTION
+
+    def report(self):
+        "Returns the flags as a few readable lines, or '' if nobody was flagged."
+        return '\n'.join('%s: %s' % (name, ', '.join('%d %s' % (n, reason) for reason, n in sorted(counts.items())))
+                         for name, counts in sorted(self.flags.items()) if counts)
+
+    def close(self):
+        "Stops the workers."
+        for lane in self.lanes.values():
+            if lane.dead:
+                continue
+            try:
+                lane.conn.send(None)
+            except OSError:
+                pass
+            lane.process.join(GRACE)
+            if lane.process.is_alive():
+                lane.process.kill()
+                lane.process.join()
+            lane.conn.close()
+            lane.dead = True
+
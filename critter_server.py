@@ -0,0 +1,327 @@
+"""
+Serves one running CritterModel to any number of viewers on localhost.
+
+The model runs once, on a critter_runner.Runner, and every FRAME_SECONDS
+the server takes whatever frame it's gotten to and sends everybody just
+what changed since the last one:
+
+    {"tick": 812, "cells": [[3, 7, "P", "#808080"], [3, 8]], "states": {...}}
+
+where a two-element cell means it's now empty, and states maps class
+name to [alive, wins, health, karma]. Someone who just showed up, or fell
+behind, gets a keyframe instead: the same thing with "key": true, the
+world's "width" and "height", and every critter on the board in cells.
+
+    GET /        a page that draws the board in a browser
+    GET /ws      the messages over a WebSocket, one per text frame
+    GET /stream  the messages as JSON lines, for curl and friends
+
+Viewers never hold up the simulation. Each message is encoded once and
+written to every viewer without waiting. A viewer with more than
+HIGH_WATER bytes still unsent just misses frames, and gets a keyframe
+once it's caught up.
+"""
+import asyncio
+import base64
+import critter_runner
+import hashlib
+import json
+import struct
+
+# Seconds between frames.
+FRAME_SECONDS = 1 / 20
+
+# Bytes a viewer can have waiting before it starts missing frames.
+HIGH_WATER = 256 * 1024
+
+# Longest request head we'll read.
+MAX_HEAD = 16 * 1024
+
+# From RFC 6455, for the handshake.
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# WebSocket opcodes we care about.
+TEXT = 0x1
+CLOSE = 0x8
+PING = 0x9
+PONG = 0xA
+
+
+def color_to_hex(color):
+    "Converts an RGB color to a #rrggbb string, or None for no color."
+    if color is None:
+        return None
+    return '#%02x%02x%02x' % (color.r, color.g, color.b)
+
+
+class Board():
+    """
+    What every viewer should be seeing by now: a map of (x, y) to
+    [x, y, char, hex color] for every critter on the board.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.cells = {}
+        self.tick = 0
+        self.states = {}
+
+    def apply(self, frame):
+        "Folds a critter_runner.Frame in. Returns the cells that changed, as a list."
+        old = self.cells
+        if frame.full:
+            self.cells = {}
+            changed = [[x, y] for (x, y) in old if (x, y) not in frame.glyphs]
+        else:
+            changed = []
+        for (x, y), glyph in frame.glyphs.items():
+            if glyph is None:
+                if self.cells.pop((x, y), None) is not None:
+                    changed.append([x, y])
+                continue
+            cell = [x, y, glyph[0], color_to_hex(glyph[1])]
+            if old.get((x, y)) != cell:
+                changed.append(cell)
+            self.cells[(x, y)] = cell
+        self.tick = frame.tick
+        self.states = {name: list(state) for name, state in frame.states.items()}
+        return changed
+
+    def delta(self, changed):
+        return json.dumps({'tick': self.tick, 'cells': changed, 'states': self.states},
+                          separators=(',', ':'))
+
+    def keyframe(self):
+        return json.dumps({'tick': self.tick, 'key': True, 'width': self.width, 'height': self.height,
+                           'cells': list(self.cells.values()), 'states': self.states},
+                          separators=(',', ':'))
+
+
+def ws_frame(opcode, payload):
+    "Encodes one unmasked, unfragmented WebSocket frame."
+    n = len(payload)
+    if n < 126:
+        head = struct.pack('!BB', 0x80 | opcode, n)
+    elif n < 1 << 16:
+        head = struct.pack('!BBH', 0x80 | opcode, 126, n)
+    else:
+        head = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+    return head + payload
+
+
+async def read_ws_frame(reader):
+    "Reads one WebSocket frame from a client. Returns (opcode, payload)."
+    first, second = await reader.readexactly(2)
+    n = second & 0x7f
+    if n == 126:
+        n, = struct.unpack('!H', await reader.readexactly(2))
+    elif n == 127:
+        n, = struct.unpack('!Q', await reader.readexactly(8))
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(n)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return first & 0x0f, payload
+
+
+class Viewer():
+    "One connected viewer, and how its messages get framed."
+
+    def __init__(self, writer, websocket):
+        self.writer = writer
+        self.websocket = websocket
+        # Whether its next message has to be a keyframe.
+        self.needs_key = True
+        self.dropped = 0
+
+    def behind(self):
+        return self.writer.transport.get_write_buffer_size() > HIGH_WATER
+
+    def send(self, encoded):
+        "encoded is a message as (websocket frame, JSON line)."
+        self.writer.write(encoded[0] if self.websocket else encoded[1])
+
+
+def encode(message):
+    "Returns a message ready for both kinds of viewer."
+    data = message.encode()
+    return (ws_frame(TEXT, data), data + b'\n')
+
+
+class Server():
+    """
+    Runs model on a Runner at tick_rate ticks per second (None for flat
+    out), and serves it on host:port. Call run() to go until interrupted.
+    """
+
+    def __init__(self, model, host='127.0.0.1', port=8364, tick_rate=10):
+        self.model = model
+        self.host = host
+        self.port = port
+        self.tick_rate = tick_rate
+        self.board = Board(model.width, model.height)
+        self.viewers = set()
+        self.runner = None
+
+    def run(self):
+        "Serves until interrupted."
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.runner = critter_runner.Runner(self.model, self.tick_rate)
+        self.runner.go()
+        try:
+            async with server:
+                await self.broadcast_forever()
+        finally:
+            self.runner.close()
+
+    async def broadcast_forever(self):
+        while True:
+            frame = self.runner.take_frame()
+            if frame is not None:
+                self.broadcast(self.board.apply(frame))
+            await asyncio.sleep(FRAME_SECONDS)
+
+    def join(self, viewer):
+        "Starts sending to viewer, with a keyframe of where things stand."
+        viewer.send(encode(self.board.keyframe()))
+        viewer.needs_key = False
+        self.viewers.add(viewer)
+
+    def broadcast(self, changed):
+        "Sends changed to everybody who's keeping up, and a keyframe to whoever needs one."
+        delta = None
+        keyframe = None
+        for viewer in list(self.viewers):
+            if viewer.writer.is_closing():
+                self.viewers.discard(viewer)
+                continue
+            if viewer.behind():
+                viewer.needs_key = True
+                viewer.dropped += 1
+                continue
+            if viewer.needs_key:
+                if keyframe is None:
+                    keyframe = encode(self.board.keyframe())
+                viewer.send(keyframe)
+                viewer.needs_key = False
+            else:
+                if delta is None:
+                    delta = encode(self.board.delta(changed))
+                viewer.send(delta)
+
+    async def handle(self, reader, writer):
+        "Handles one connection, from its request to when it goes away."
+        try:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            if len(head) > MAX_HEAD:
+                return
+            lines = head.decode('latin-1').split('\r\n')
+            method, path = (lines[0].split(' ') + ['', ''])[:2]
+            headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    name, value = line.split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+            if method != 'GET':
+                self.respond(writer, '405 Method Not Allowed', 'text/plain', b'GET only\n')
+            elif path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                await self.serve_websocket(reader, writer, headers)
+            elif path == '/stream':
+                await self.serve_stream(reader, writer)
+            elif path == '/':
+                self.respond(writer, '200 OK', 'text/html; charset=utf-8', PAGE.encode())
+            else:
+                self.respond(writer, '404 Not Found', 'text/plain', b'Not found\n')
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, writer, status, content_type, body):
+        writer.write(('HTTP/1.1 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\n'
+                      'Connection: close\r\n\r\n' % (status, content_type, len(body))).encode() + body)
+
+    async def serve_websocket(self, reader, writer, headers):
+        key = headers.get('sec-websocket-key', '')
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n'
+                      'Connection: Upgrade\r\nSec-WebSocket-Accept: %s\r\n\r\n' % accept).encode())
+        viewer = Viewer(writer, True)
+        self.join(viewer)
+        try:
+            # Viewers have nothing to say, but a WebSocket still needs
+            # answering when it pings or closes.
+            while True:
+                opcode, payload = await read_ws_frame(reader)
+                if opcode == PING:
+                    writer.write(ws_frame(PONG, payload))
+                elif opcode == CLOSE:
+                    writer.write(ws_frame(CLOSE, payload[:2]))
+                    break
+        finally:
+            self.viewers.discard(viewer)
+
+    async def serve_stream(self, reader, writer):
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n'
+                     b'Cache-Control: no-cache\r\nConnection: close\r\n\r\n')
+        viewer = Viewer(writer, False)
+        self.join(viewer)
+        try:
+            # Nothing more should come; this just notices the viewer leaving.
+            while await reader.read(4096):
+                pass
+        finally:
+            self.viewers.discard(viewer)
+
+
+PAGE = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Critters</title>
+<style>body{font-family:monospace;margin:1em}canvas{border:1px solid #ccc}</style></head>
+<body><canvas id="board"></canvas><pre id="info">connecting...</pre>
+<script>
+const CELL = 12;
+const canvas = document.getElementById('board');
+const ctx = canvas.getContext('2d');
+const info = document.getElementById('info');
+const cells = new Map();
+function draw(cell) {
+  const [x, y, ch, color] = cell;
+  ctx.fillStyle = '#fff';
+  ctx.fillRect(x * CELL, y * CELL, CELL, CELL);
+  if (ch !== undefined) {
+    ctx.fillStyle = color || '#000';
+    ctx.fillText(ch, x * CELL + CELL / 2, y * CELL + CELL / 2);
+  }
+}
+const ws = new WebSocket('ws://' + location.host + '/ws');
+ws.onmessage = (event) => {
+  const msg = JSON.parse(event.data);
+  if (msg.key) {
+    canvas.width = msg.width * CELL;
+    canvas.height = msg.height * CELL;
+    ctx.font = CELL + 'px monospace';
+    ctx.textAlign = 'center';
+    ctx.textBaseline = 'middle';
+    ctx.fillStyle = '#fff';
+    ctx.fillRect(0, 0, canvas.width, canvas.height);
+  }
+  msg.cells.forEach(draw);
+  const lines = ['tick ' + msg.tick];
+  for (const [name, s] of Object.entries(msg.states)) {
+    lines.push(name + ': ' + s[0] + ' alive, ' + s[1] + ' wins, ' + s[2] + ' health, ' + s[3] + ' karma');
+  }
+  info.textContent = lines.join('\\n');
+};
+ws.onclose = () => { info.textContent += '\\ndisconnected'; };
+</script></body></html>
+'''
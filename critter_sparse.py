@@ -0,0 +1,78 @@
+"""
+Sparse storage for CritterModel, used when the model is created with
+backend='sparse'.
+
+The list backend keeps a width x height list of lists, so memory and
+reset() cost go with the area of the world. That's hopeless for a huge,
+mostly empty world. Here occupied cells live in a dict keyed by (x, y)
+and empty cells just aren't in it, so everything costs about as much as
+the critters that are alive.
+
+The model still reads and writes grid[x][y]; SparseGrid hands out
+throwaway Column views that look the cell up in the dict.
+
+Starting spots get picked by guessing random cells until they're empty
+(see CritterModel.place) rather than from a free-cell index, which would
+cost as much as the area. So a seed starts from a different board here
+than on the list backend. From the same board and random state, though,
+the two run exactly the same.
+"""
+
+
+class SparseWorld():
+    """
+    The occupied cells of one model, keyed by (x, y).
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.cells = {}
+        self.grid = SparseGrid(self)
+
+    def clear(self):
+        self.cells.clear()
+
+
+class SparseGrid():
+    "Lets the model keep writing grid[x][y] against the cell dict."
+    __slots__ = ('world',)
+
+    def __init__(self, world):
+        self.world = world
+
+    def __getitem__(self, x):
+        return Column(self.world.cells, x, self.world.height)
+
+    def __len__(self):
+        return self.world.width
+
+    def __iter__(self):
+        for x in range(self.world.width):
+            yield self[x]
+
+
+class Column():
+    "A single grid[x] column. Setting a cell to None empties it."
+    __slots__ = ('cells', 'x', 'height')
+
+    def __init__(self, cells, x, height):
+        self.cells = cells
+        self.x = x
+        self.height = height
+
+    def __getitem__(self, y):
+        return self.cells.get((self.x, y))
+
+    def __setitem__(self, y, critter):
+        if critter is None:
+            self.cells.pop((self.x, y), None)
+        else:
+            self.cells[(self.x, y)] = critter
+
+    def __len__(self):
+        return self.height
+
+    def __iter__(self):
+        for y in range(self.height):
+            yield self[y]
@@ -0,0 +1,28 @@
+"""
+Ways of looking at a model's board that the tests share.
+"""
+
+
+def board(model):
+    "Every critter's class name and position, in turn order."
+    return [(c.__class__.__name__, model.critter_positions[c]) for c in model.critters]
+
+
+def glyphs(model):
+    "What the board looks like: each critter's (char, color) by (x, y)."
+    return {(pos.x, pos.y): (c.getChar(), c.getColor()) for c, pos in model.critter_positions.items()}
+
+
+def draw(drawn, frame):
+    """
+    Folds a runner or replay frame into drawn, the glyphs the frames
+    before it added up to, and returns what they add up to now.
+    """
+    if frame.full:
+        drawn = {}
+    for cell, glyph in frame.glyphs.items():
+        if glyph is None:
+            drawn.pop(cell, None)
+        else:
+            drawn[cell] = glyph
+    return drawn
@@ -0,0 +1,266 @@
+"""
+Round-robin Critter tournaments, spread over a pool of worker processes.
+
+Every pair of critter classes fights a quickfight-style match once per
+seed. Each worker imports the critter modules once, keeps one model
+around, and plays whatever match it's handed next. Workers are plain
+processes talking over pipes rather than a multiprocessing.Pool, so when
+one dies we know exactly which match killed it: that match gets recorded
+as an error, a fresh worker takes its place, and the rest of the
+tournament carries on.
+
+With a call budget set, the two contenders of every match run in a
+critter_sandbox instead, so one that loops forever only loses its own
+turns rather than the whole worker.
+"""
+import collections
+import critter_model
+import critter_profile
+import critter_sandbox
+import importlib
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import os
+import threading
+import traceback
+
+# One match: two critter class names and the seed to play them with.
+Match = collections.namedtuple('Match', ['critter1', 'critter2', 'seed'])
+
+# How a match went. states maps class name to (wins, alive, health, karma),
+# or is None if the match blew up, in which case error says why. profile
+# is the match's Profiler stats, if the tournament was profiled. flags is
+# the sandbox's flags (class name to {reason: count}), if it had one.
+MatchResult = collections.namedtuple('MatchResult', ['match', 'states', 'error', 'profile', 'flags'],
+                                     defaults=(None, None))
+
+# One cell of the standings: how the row class did against the column
+# class over all their matches. A match counts as a win if the row class
+# finished with more karma.
+PairStats = collections.namedtuple('PairStats', ['matches', 'wins', 'karma', 'alive'])
+
+
+class Settings():
+    "How each match gets played."
+    def __init__(self, iterations=1000, width=50, height=40, count=25, standards=(), profile=False,
+                 call_budget=None, tick_budget=0.25):
+        self.iterations = iterations
+        self.width = width
+        self.height = height
+        self.count = count
+        # Classes added to every match, like critter_main.STANDARD_CRITTERS.
+        self.standards = tuple(standards)
+        # Whether to profile every match (see critter_profile).
+        self.profile = profile
+        # Seconds per call and per tick for the contenders, who then run
+        # sandboxed (see critter_sandbox). None runs them in-process.
+        self.call_budget = call_budget
+        self.tick_budget = tick_budget
+
+
+def class_spec(critter_class):
+    "How a worker finds a class again: (module name, class name)."
+    return (critter_class.__module__, critter_class.__qualname__)
+
+
+def load_classes(specs):
+    "Imports each (module, name) spec. Returns a map of name to class."
+    classes = {}
+    for module_name, name in specs:
+        module = importlib.import_module(module_name)
+        classes[name] = getattr(module, name)
+    return classes
+
+
+def play(model, classes, match, settings):
+    """
+    Plays a single match on model, reusing it. Returns the states and
+    flags parts of a MatchResult.
+    """
+    model.reseed(match.seed)
+    contenders = [classes[match.critter1], classes[match.critter2]]
+    sandbox = None
+    if settings.call_budget is not None:
+        sandbox = critter_sandbox.Sandbox(settings.call_budget, settings.tick_budget,
+                                          settings.width, settings.height, match.seed)
+    try:
+        if sandbox is not None:
+            contenders = [sandbox.wrap(c) for c in contenders]
+        critter_classes = [classes[c.__name__] for c in settings.standards] + contenders
+        model.reset(settings.count, critter_classes)
+        for i in range(settings.iterations):
+            model.update()
+    finally:
+        if sandbox is not None:
+            sandbox.close()
+    states = {c.__name__: (state.wins, state.alive, state.health, state.karma)
+              for c, state in model.results()}
+    flags = None
+    if sandbox is not None:
+        flags = {name: dict(counts) for name, counts in sandbox.flags.items() if counts}
+    return states, flags
+
+
+def worker(conn, specs, settings):
+    "Worker process main loop: play matches until told to stop with None."
+    classes = load_classes(specs)
+    model = None
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        index, match = task
+        if model is None:
+            model = critter_model.CritterModel(settings.width, settings.height, threading.Lock())
+        profiler = None
+        if settings.profile:
+            profiler = model.enable_profiling()
+            profiler.clear()
+        try:
+            states, flags = play(model, classes, match, settings)
+            result = MatchResult(match, states, None, dict(profiler.stats) if profiler else None, flags)
+        except Exception:
+            result = MatchResult(match, None, traceback.format_exc())
+            # Who knows what state a blown-up match left it in.
+            model = None
+        conn.send((index, result))
+    conn.close()
+
+
+def schedule(critter_classes, seeds, first_seed=0):
+    "Every pairing of critter_classes, once per seed."
+    return [Match(a.__name__, b.__name__, seed)
+            for a, b in itertools.combinations(critter_classes, 2)
+            for seed in range(first_seed, first_seed + seeds)]
+
+
+def run_tournament(critter_classes, seeds=5, processes=None, settings=None, first_seed=0):
+    """
+    Plays every pairing of critter_classes once per seed (first_seed,
+    first_seed + 1, ...), across processes workers (one per core by
+    default). Every match seeds its own model, so results don't depend on
+    which worker played what. Returns the list of MatchResults, in
+    schedule order.
+    """
+    settings = settings or Settings()
+    matches = schedule(critter_classes, seeds, first_seed)
+    specs = [class_spec(c) for c in list(critter_classes) + list(settings.standards)]
+    processes = min(processes or os.cpu_count() or 1, len(matches)) or 1
+    results = [None] * len(matches)
+    pending = collections.deque(enumerate(matches))
+    # connection -> (process, index of the match it's playing or None)
+    workers = {}
+
+    def spawn():
+        parent_conn, child_conn = multiprocessing.Pipe()
+        # Daemon processes can't start sandbox workers of their own.
+        process = multiprocessing.Process(target=worker, args=(child_conn, specs, settings),
+                                          daemon=settings.call_budget is None)
+        process.start()
+        child_conn.close()
+        workers[parent_conn] = (process, None)
+        hand_out(parent_conn)
+
+    def hand_out(conn):
+        process, _ = workers[conn]
+        if pending:
+            index, match = pending.popleft()
+            conn.send((index, match))
+            workers[conn] = (process, index)
+        else:
+            conn.send(None)
+            workers[conn] = (process, None)
+
+    for i in range(processes):
+        spawn()
+    while any(index is not None for process, index in workers.values()):
+        for conn in multiprocessing.connection.wait(list(workers)):
+            process, index = workers[conn]
+            try:
+                done, result = conn.recv()
+            except (EOFError, OSError):
+                # The worker died mid-match. Blame the match, replace the worker.
+                process.join()
+                del workers[conn]
+                conn.close()
+                if index is not None:
+                    results[index] = MatchResult(matches[index], None,
+                                                 'worker died (exit code %s)' % process.exitcode)
+                if pending:
+                    spawn()
+                continue
+            results[done] = result
+            hand_out(conn)
+    for conn, (process, index) in workers.items():
+        process.join()
+        conn.close()
+    return results
+
+
+def standings(results):
+    """
+    Adds up a list of MatchResults into a map of (row name, column name)
+    to PairStats. Matches that errored are left out.
+    """
+    totals = collections.defaultdict(lambda: [0, 0, 0, 0])
+    for result in results:
+        if result.states is None:
+            continue
+        match = result.match
+        for row, col in ((match.critter1, match.critter2), (match.critter2, match.critter1)):
+            wins, alive, health, karma = result.states[row]
+            cell = totals[(row, col)]
+            cell[0] += 1
+            cell[1] += karma > result.states[col][3]
+            cell[2] += karma
+            cell[3] += alive
+    return {pair: PairStats(*cell) for pair, cell in totals.items()}
+
+
+def merged_profile(results):
+    "Adds up the profiles of every match into one Profiler."
+    profiler = critter_profile.Profiler()
+    for result in results:
+        if result.profile:
+            profiler.merge(result.profile)
+    return profiler
+
+
+def format_standings(table, names):
+    """
+    Returns the standings as three matrices (match wins, mean karma and
+    mean survivors), rows against columns.
+    """
+    width = max([len(name) for name in names] + [8])
+    lines = []
+    for title, value in (('Match wins', lambda s: s.wins),
+                         ('Mean karma', lambda s: s.karma / s.matches),
+                         ('Mean alive', lambda s: s.alive / s.matches)):
+        lines.append('%s:' % title)
+        lines.append(' ' * width + ''.join(' %*s' % (width, name) for name in names))
+        for row in names:
+            cells = []
+            for col in names:
+                stats = table.get((row, col))
+                cells.append(' %*s' % (width, '-' if not stats else '%.1f' % value(stats)))
+            lines.append('%*s' % (width, row) + ''.join(cells))
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def format_errors(results):
+    "Returns a description of every match that errored, if any did."
+    return '\n'.join('%s vs %s (seed %s): %s' % (r.match.critter1, r.match.critter2, r.match.seed, r.error)
+                     for r in results if r.error is not None)
+
+
+def format_flags(results):
+    "Returns a description of every match where a sandboxed critter went over budget, if any did."
+    lines = []
+    for r in results:
+        for name, counts in sorted((r.flags or {}).items()):
+            lines.append('%s vs %s (seed %s): %s %s' % (
+                r.match.critter1, r.match.critter2, r.match.seed, name,
+                ', '.join('%d %s' % (n, reason) for reason, n in sorted(counts.items()))))
+    return '\n'.join(lines)
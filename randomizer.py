@@ -1,11 +1,15 @@
 import critter
 import color
-import random
 
 class Randomizer(critter.Critter):
+	__slots__ = ()
+
+	MOVE_POLICY = critter.UniformPolicy(critter.NORTH, critter.SOUTH, critter.EAST, critter.WEST)
+	INTERACT_POLICY = critter.UniformPolicy(critter.POUNCE, critter.SCRATCH, critter.ROAR, critter.PARTY, critter.HEAL)
+
 	def interact(self, oppInfo):
 		actions = [critter.POUNCE, critter.SCRATCH, critter.ROAR, critter.PARTY, critter.HEAL]
-		rand = random.randint(0, len(actions)-1)
+		rand = oppInfo.random.randint(0, len(actions)-1)
 		return actions[rand]
 
 
@@ -14,7 +18,7 @@ class Randomizer(critter.Critter):
 
 	def getMove(self, info):
 		moves = [critter.NORTH, critter.SOUTH, critter.EAST, critter.WEST]
-		rand = random.randint(0, len(moves)-1)
+		rand = info.random.randint(0, len(moves)-1)
 		return moves[rand]
 
 	def getChar(self):
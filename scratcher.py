@@ -1,8 +1,12 @@
 import critter
 import color
-import random
 
 class Scratcher(critter.Critter):
+	__slots__ = ()
+
+	MOVE_POLICY = critter.UniformPolicy(critter.NORTH, critter.SOUTH, critter.EAST, critter.WEST)
+	INTERACT_POLICY = critter.ConstantPolicy(critter.SCRATCH)
+
 	def interact(self, oppInfo):
 		return critter.SCRATCH
 
@@ -11,7 +15,7 @@ class Scratcher(critter.Critter):
 
 	def getMove(self, info):
 		moves = [critter.NORTH, critter.SOUTH, critter.EAST, critter.WEST]
-		rand = random.randint(0, len(moves)-1)
+		rand = info.random.randint(0, len(moves)-1)
 		return moves[rand]
 
 	def getChar(self):
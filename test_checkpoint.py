@@ -0,0 +1,99 @@
+import color
+import critter
+import critter_checkpoint
+import critter_model
+import critter_testing
+import pouncer
+import pytest
+import randomizer
+import threading
+
+
+class Counter(critter.Critter):
+    "Keeps its own state in __dict__."
+    DISCOVERABLE = False
+
+    def __init__(self):
+        critter.Critter.__init__(self)
+        self.moves = 0
+
+    def getMove(self, info):
+        self.moves += 1
+        return critter.NORTH if self.moves % 2 else critter.EAST
+
+    def interact(self, oppInfo):
+        return critter.SCRATCH
+
+    def getColor(self):
+        return color.RED
+
+    def getChar(self):
+        return 'C'
+
+
+class Tight(critter.Critter):
+    "Keeps its own state in slots, one of them private."
+    DISCOVERABLE = False
+    __slots__ = ('__last', 'steps')
+
+    def __init__(self):
+        critter.Critter.__init__(self)
+        self.steps = 0
+
+    def getMove(self, info):
+        self.steps += 1
+        self.__last = info.getNeighbor(critter.NORTH)
+        return critter.SOUTH if self.__last == '.' else critter.WEST
+
+    def interact(self, oppInfo):
+        return critter.ROAR
+
+    def getColor(self):
+        return color.GREEN
+
+    def getChar(self):
+        return 'T'
+
+
+CLASSES = [Counter, Tight, pouncer.Pouncer, randomizer.Randomizer]
+
+
+@pytest.mark.parametrize('backend', critter_model.BACKENDS)
+def test_a_loaded_checkpoint_runs_the_same(tmp_path, backend):
+    model = critter_model.CritterModel(50, 40, threading.Lock(), backend=backend, seed=4)
+    model.reset(25, CLASSES)
+    for i in range(40):
+        model.update()
+    path = str(tmp_path / 'model.ckpt')
+    critter_checkpoint.save(model, path)
+    loaded = critter_checkpoint.load(path, threading.Lock())
+
+    assert loaded.move_count == model.move_count
+    assert critter_testing.board(loaded) == critter_testing.board(model)
+    assert loaded.stats() == model.stats()
+    for c, d in zip(model.critters, loaded.critters):
+        assert (d.health, d.karma) == (c.health, c.karma)
+    tight = [(c, d) for c, d in zip(model.critters, loaded.critters) if isinstance(c, Tight)]
+    assert tight
+    for c, d in tight:
+        assert (d.steps, d._Tight__last) == (c.steps, c._Tight__last)
+
+    for i in range(40):
+        model.update()
+        loaded.update()
+    assert critter_testing.board(loaded) == critter_testing.board(model)
+    assert loaded.stats() == model.stats()
+
+
+def test_an_unknown_backend_is_refused(tmp_path):
+    model = critter_model.CritterModel(20, 20, threading.Lock(), seed=4)
+    model.reset(5, [pouncer.Pouncer])
+    path = str(tmp_path / 'model.ckpt')
+    critter_checkpoint.save(model, path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        # Same length, so the header still parses.
+        f.write(data.replace(b'"list"', b'"nope"', 1))
+    with pytest.raises(critter_checkpoint.CheckpointException):
+        critter_checkpoint.load(path, threading.Lock())
@@ -0,0 +1,44 @@
+import critter_discovery
+
+
+def test_discovery_skips_classes_marked_undiscoverable(tmp_path):
+    (tmp_path / 'bases.py').write_text(
+        "import critter\n"
+        "class Base(critter.Critter):\n"
+        "    DISCOVERABLE = False\n"
+        "class Plain(critter.Critter):\n"
+        "    pass\n")
+    (tmp_path / 'kids.py').write_text(
+        "from bases import Base\n"
+        "class Kid(Base):\n"
+        "    pass\n"
+        "class NotACritter():\n"
+        "    DISCOVERABLE = True\n")
+    found = critter_discovery.find_critters(str(tmp_path))
+    assert found == [critter_discovery.CritterSpec('bases', 'Plain'),
+                     critter_discovery.CritterSpec('kids', 'Kid')]
+    # Same again from the cache.
+    assert critter_discovery.find_critters(str(tmp_path)) == found
+
+
+def test_discovery_follows_star_imports(tmp_path):
+    (tmp_path / 'starry.py').write_text(
+        "from critter import *\n"
+        "class Star(Critter):\n"
+        "    pass\n")
+    (tmp_path / 'fan.py').write_text(
+        "from starry import *\n"
+        "from os import *\n"
+        "class Fan(Star):\n"
+        "    pass\n"
+        "class Loner(Unknown):\n"
+        "    pass\n")
+    assert critter_discovery.find_critters(str(tmp_path)) == [
+        critter_discovery.CritterSpec('fan', 'Fan'),
+        critter_discovery.CritterSpec('starry', 'Star')]
+
+
+def test_the_sandbox_stand_in_is_not_a_critter():
+    found = critter_discovery.find_critters('.')
+    assert critter_discovery.CritterSpec('critter_sandbox', 'Remote') not in found
+    assert critter_discovery.CritterSpec('pouncer', 'Pouncer') in found
@@ -0,0 +1,125 @@
+import collections
+import color
+import critter
+import critter_domains
+import critter_model
+import healer
+import pouncer
+import pytest
+import roarer
+import scratcher
+import threading
+
+
+CLASSES = [pouncer.Pouncer, roarer.Roarer, healer.Healer, scratcher.Scratcher]
+
+
+def collect(domains):
+    "Every critter the workers hold, as (x, y, critter). Leaves them empty."
+    found = []
+    for x in range(domains.width):
+        for items in domains.call('lend', [(x,)] * domains.processes):
+            found.extend((x, y, c) for y, c, moved in items)
+    return found
+
+
+@pytest.mark.parametrize('processes', [1, 2, 3])
+def test_domains_lose_and_copy_nobody(processes):
+    model = critter_model.CritterModel(100, 80, threading.Lock(), seed=3)
+    model.reset(60, CLASSES)
+    domains = critter_domains.DomainModel(model, processes)
+    try:
+        assert domains.processes == processes
+        for i in range(40):
+            domains.update()
+        states = domains.critter_class_states
+        # Every critter that's gone was beaten by some other one.
+        assert (len(CLASSES) * 60 - sum(s.alive for s in states.values())
+                == sum(s.wins for s in states.values()))
+
+        found = collect(domains)
+        assert len({(x, y) for x, y, c in found}) == len(found)
+        assert len({id(c) for x, y, c in found}) == len(found)
+        alive = collections.Counter(c.__class__ for x, y, c in found)
+        health = collections.Counter()
+        for x, y, c in found:
+            health[c.__class__] += c.health
+        for critter_class in CLASSES:
+            assert states[critter_class].alive == alive[critter_class]
+            assert states[critter_class].health == health[critter_class]
+    finally:
+        domains.close()
+
+
+class Post(critter.Critter):
+    "Stays put and parties with whoever shows up."
+    DISCOVERABLE = False
+    MOVE_POLICY = critter.ConstantPolicy(critter.CENTER)
+    INTERACT_POLICY = critter.ConstantPolicy(critter.PARTY)
+
+    def getColor(self):
+        return color.GRAY
+
+    def getChar(self):
+        return 'o'
+
+
+class Marker(Post):
+    "A Post to look for."
+    DISCOVERABLE = False
+
+
+class Prober(critter.Critter):
+    "Walks one way into a fight, and writes down what it saw around the other critter."
+    DISCOVERABLE = False
+
+    def __init__(self, way):
+        critter.Critter.__init__(self)
+        self.way = way
+        self.seen = None
+
+    def getMove(self, info):
+        return self.way
+
+    def interact(self, oppInfo):
+        self.seen = oppInfo.getNeighbor(self.way), oppInfo.getNeighborHealth(self.way)
+        return critter.PARTY
+
+    def getColor(self):
+        return color.RED
+
+    def getChar(self):
+        return '>'
+
+
+def put(model, c, x, y):
+    model.critters.append(c)
+    model.critter_positions[c] = critter_model.Point(x, y)
+    model.grid[x][y] = c
+    state = model.critter_class_states.setdefault(c.__class__, critter_model.ClassInfo())
+    state.alive += 1
+    state.count += 1
+    state.health += c.health
+
+
+def test_fights_at_a_strip_edge_see_past_the_halo():
+    # Two workers cut a 12-wide world into strips at 0, 3, 6 and 9.
+    model = critter_model.CritterModel(12, 6, threading.Lock(), seed=1)
+    # Worker 1's even strip steps into column 5, and looks at column 4,
+    # both worker 0's.
+    put(model, Prober(critter.WEST), 6, 1)
+    put(model, Post(), 5, 1)
+    put(model, Marker(), 4, 1)
+    # Worker 1's odd strip steps into column 0, and looks at column 1,
+    # both worker 0's, around the wrap.
+    put(model, Prober(critter.EAST), 11, 3)
+    put(model, Post(), 0, 3)
+    put(model, Marker(), 1, 3)
+    domains = critter_domains.DomainModel(model, 2)
+    try:
+        assert domains.processes == 2
+        domains.update()
+        probers = [c for x, y, c in collect(domains) if isinstance(c, Prober)]
+        assert [p.seen for p in probers] == [('Marker', 100), ('Marker', 100)]
+    finally:
+        domains.close()
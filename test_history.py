@@ -0,0 +1,45 @@
+import critter_history
+import numpy as np
+import pytest
+
+
+def sample(tick):
+    "Some values for two classes that go up and down from tick to tick."
+    return [[(tick * 7 + c + f) % 11 + 100 * c for f in range(len(critter_history.FIELDS))]
+            for c in range(2)]
+
+
+def fill(history, ticks):
+    for tick in ticks:
+        history.append(tick, sample(tick))
+
+
+@pytest.mark.parametrize('count', [0, 5, 8, 9, 20, 64])
+def test_recent_keeps_the_last_capacity_ticks_in_order(count):
+    history = critter_history.History(['A', 'B'], capacity=8, buckets=4)
+    fill(history, range(count))
+    ticks, values = history.recent()
+    kept = list(range(max(0, count - 8), count))
+    assert list(ticks) == kept
+    assert values.tolist() == [sample(tick) for tick in kept]
+    ticks, karma = history.series('B', 'karma')
+    assert karma.tolist() == [sample(tick)[1][3] for tick in kept]
+
+
+@pytest.mark.parametrize('count', [1, 4, 5, 7, 8, 9, 31, 33, 100])
+def test_the_summary_covers_the_whole_run_however_long(count):
+    history = critter_history.History(['A', 'B'], capacity=8, buckets=4)
+    fill(history, range(count))
+    # Merging doubles the span until the run fits in the buckets.
+    span = 1
+    while -(-count // span) > 4:
+        span *= 2
+    groups = [range(start, min(start + span, count)) for start in range(0, count, span)]
+
+    summary = history.summary()
+    assert list(summary.ticks) == [group[0] for group in groups]
+    for b, group in enumerate(groups):
+        values = np.array([sample(tick) for tick in group])
+        assert summary.min[b].tolist() == values.min(axis=0).tolist()
+        assert summary.max[b].tolist() == values.max(axis=0).tolist()
+        assert np.allclose(summary.mean[b], values.mean(axis=0))
@@ -0,0 +1,9 @@
+import critter_bench
+import pytest
+
+
+@pytest.mark.parametrize('module', critter_bench.HEADLESS_MODULES)
+def test_headless_modules_import_in_budget_without_the_gui(module):
+    seconds, loaded = critter_bench.import_cost(module)
+    assert loaded == []
+    assert seconds <= critter_bench.IMPORT_BUDGET
@@ -0,0 +1,20 @@
+import argparse
+import critter_main
+import pytest
+import sys
+
+
+def test_positive_int_takes_counts_only():
+    assert critter_main.positive_int('3') == 3
+    for text in ('0', '-2', 'many', '1.5'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            critter_main.positive_int(text)
+
+
+@pytest.mark.parametrize('every', ['0', '-1'])
+def test_stream_rejects_ticks_below_one(monkeypatch, capsys, every):
+    monkeypatch.setattr(sys, 'argv', ['critter_main.py', '--stream', every, '--ticks', '5'])
+    with pytest.raises(SystemExit) as exit:
+        critter_main.main()
+    assert exit.value.code == 2
+    assert '--stream' in capsys.readouterr().err
@@ -0,0 +1,31 @@
+import critter_model
+import critter_testing
+import pouncer
+import randomizer
+import threading
+
+
+def test_add_and_reset_start_from_the_same_board():
+    for seed in range(8):
+        added = critter_model.CritterModel(50, 40, threading.Lock(), seed=seed)
+        added.add(pouncer.Pouncer, 25)
+        added.add(randomizer.Randomizer, 25)
+        reset = critter_model.CritterModel(50, 40, threading.Lock(), seed=seed)
+        reset.reset(25, [pouncer.Pouncer, randomizer.Randomizer])
+        assert critter_testing.board(added) == critter_testing.board(reset)
+        for i in range(50):
+            added.update()
+            reset.update()
+        assert added.stats() == reset.stats()
+
+
+def test_reset_forgets_the_last_run_s_classes():
+    model = critter_model.CritterModel(30, 20, threading.Lock(), seed=1)
+    for i in range(20):
+        # A fresh class per run, the way a sandbox wraps them.
+        wrapped = type('Wrapped', (pouncer.Pouncer,), {'__slots__': ()})
+        model.reset(10, [wrapped, randomizer.Randomizer])
+        for tick in range(5):
+            model.update()
+        assert set(model.class_traits) <= {wrapped, randomizer.Randomizer}
+        assert len(model.action_buffers) <= 2
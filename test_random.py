@@ -0,0 +1,107 @@
+import color
+import critter
+import critter_checkpoint
+import critter_model
+import critter_random
+import critter_testing
+import partier
+import pickle
+import pouncer
+import random
+import randomizer
+import scratcher
+import threading
+
+
+CLASSES = [pouncer.Pouncer, randomizer.Randomizer, partier.Partier, scratcher.Scratcher]
+
+
+def new_model(seed):
+    model = critter_model.CritterModel(50, 40, threading.Lock(), seed=seed)
+    model.reset(25, CLASSES)
+    return model
+
+
+def run_alone(seed, ticks):
+    model = new_model(seed)
+    for i in range(ticks):
+        model.update()
+    return critter_testing.board(model), model.stats()
+
+
+def test_a_seed_runs_the_same_alone_or_among_others():
+    alone = run_alone(11, 60)
+    # Same seed again, this time taking turns with another model and with
+    # other code pulling from the global random module in between.
+    model = new_model(11)
+    other = new_model(12)
+    random.seed(0)
+    for i in range(60):
+        random.random()
+        model.update()
+        other.update()
+        random.shuffle(list(range(10)))
+    assert (critter_testing.board(model), model.stats()) == alone
+
+
+def test_a_reused_model_runs_the_same_as_a_new_one():
+    # What a tournament worker does between matches.
+    model = new_model(5)
+    for i in range(30):
+        model.update()
+    model.reseed(11)
+    model.reset(25, CLASSES)
+    for i in range(60):
+        model.update()
+    assert (critter_testing.board(model), model.stats()) == run_alone(11, 60)
+
+
+def test_different_seeds_give_different_runs():
+    assert run_alone(11, 60) != run_alone(12, 60)
+
+
+def test_a_random_stream_pickles_and_picks_up_where_it_was():
+    rng = critter_random.CritterRandom(8)
+    rng.random()
+    rng.indexes(4, 10)
+    copy = pickle.loads(pickle.dumps(rng))
+    assert copy.initial_seed == 8
+    assert [copy.random() for i in range(5)] == [rng.random() for i in range(5)]
+    assert list(copy.indexes(4, 10)) == list(rng.indexes(4, 10))
+    assert list(copy.uniforms(3)) == list(rng.uniforms(3))
+
+
+class Hoarder(critter.Critter):
+    "Hangs on to info.random, the way a student critter might."
+    DISCOVERABLE = False
+
+    def __init__(self):
+        critter.Critter.__init__(self)
+        self.rng = None
+
+    def getMove(self, info):
+        self.rng = info.random
+        return self.rng.choice((critter.NORTH, critter.SOUTH, critter.EAST, critter.WEST))
+
+    def interact(self, oppInfo):
+        return critter.ROAR
+
+    def getColor(self):
+        return color.GREEN
+
+    def getChar(self):
+        return 'H'
+
+
+def test_a_critter_holding_info_random_survives_a_checkpoint(tmp_path):
+    model = critter_model.CritterModel(30, 20, threading.Lock(), seed=3)
+    model.reset(10, [Hoarder, pouncer.Pouncer])
+    for i in range(5):
+        model.update()
+    path = str(tmp_path / 'model.ckpt')
+    critter_checkpoint.save(model, path)
+    loaded = critter_checkpoint.load(path, threading.Lock())
+    hoarders = [c for c in loaded.critters if isinstance(c, Hoarder)]
+    assert hoarders and all(isinstance(c.rng, critter_random.CritterRandom) for c in hoarders)
+    for i in range(5):
+        loaded.update()
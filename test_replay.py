@@ -0,0 +1,55 @@
+import critter_model
+import critter_replay
+import critter_testing
+import healer
+import pouncer
+import roarer
+import scratcher
+import threading
+
+
+def record(path, ticks, added_at=()):
+    """
+    Runs and records a model, adding critters at each tick in added_at.
+    Returns what stats() said before the first tick and after every one.
+    """
+    model = critter_model.CritterModel(40, 30, threading.Lock(), seed=6)
+    model.reset(20, [pouncer.Pouncer, roarer.Roarer, scratcher.Scratcher])
+    model.record_replay(path, keyframe_every=25)
+    live = [model.stats()]
+    for i in range(ticks):
+        if model.move_count in added_at:
+            model.add(healer.Healer, 10)
+        model.update()
+        live.append(model.stats())
+    model.stop_replay()
+    return model, live
+
+
+def test_replayed_stats_match_the_run(tmp_path):
+    path = str(tmp_path / 'run.replay')
+    model, live = record(path, 120)
+    replay = critter_replay.Replay(path)
+    try:
+        assert list(replay.stats()) == live
+        assert list(replay.stats(start=30, stop=90)) == live[30:91]
+    finally:
+        replay.close()
+
+
+def test_added_critters_do_not_repeat_a_tick(tmp_path):
+    path = str(tmp_path / 'run.replay')
+    model, live = record(path, 120, added_at=(40, 41, 75))
+    replay = critter_replay.Replay(path)
+    try:
+        assert list(replay.stats()) == live
+        assert list(replay.stats(start=41)) == live[41:]
+        ticks = [frame.tick for frame in replay.frames()]
+        assert ticks == list(range(121))
+        # Folding every frame together gives the board the run ended on.
+        drawn = {}
+        for frame in replay.frames():
+            drawn = critter_testing.draw(drawn, frame)
+        assert drawn == critter_testing.glyphs(model)
+    finally:
+        replay.close()
@@ -0,0 +1,39 @@
+import critter
+import critter_rules
+import random
+
+
+def resolve_one(rules, a1, a2, h1, h2, roll):
+    "One encounter the way CritterModel.interact resolves it."
+    outcome = rules.table[a1][a2]
+    won1 = roll < outcome.p1
+    return (won1,) + rules.apply(outcome.win1 if won1 else outcome.win2, h1, h2)
+
+
+def check_batch(rules, n, seed):
+    rng = random.Random(seed)
+    size = len(critter_rules.ACTIONS)
+    actions1 = [rng.randrange(size) for i in range(n)]
+    actions2 = [rng.randrange(size) for i in range(n)]
+    health1 = [rng.choice((1, 25, 60, rules.max_health)) for i in range(n)]
+    health2 = [rng.choice((1, 25, 60, rules.max_health)) for i in range(n)]
+    rolls = [rng.random() for i in range(n)]
+    batch = rules.resolve_batch(actions1, actions2, health1, health2, rolls)
+    for i in range(n):
+        expected = resolve_one(rules, actions1[i], actions2[i], health1[i], health2[i], rolls[i])
+        assert tuple(column[i].item() for column in batch) == expected
+
+
+def test_a_batch_resolves_like_one_encounter_at_a_time():
+    check_batch(critter_rules.Rules(), 2000, 1)
+
+
+def test_a_batch_uses_the_rules_it_was_compiled_from():
+    rules = critter_rules.Rules(attack_damage=40, heal_restore=30, party_karma=7, max_health=150)
+    check_batch(rules, 2000, 2)
+    # The arrays come from this Rules' table, not the defaults.
+    p1, win1, win2 = rules.arrays
+    roar = critter_rules.ACTION_INDEX[critter.ROAR]
+    scratch = critter_rules.ACTION_INDEX[critter.SCRATCH]
+    assert p1[roar][scratch] == 1.0
+    assert win1[roar][scratch][1] == -40
@@ -0,0 +1,69 @@
+import color
+import critter
+import critter_model
+import critter_runner
+import critter_testing
+import pouncer
+import roarer
+import threading
+
+
+class Blinker(critter.Critter):
+    "Stays put, and changes how it looks every turn."
+    DISCOVERABLE = False
+
+    def __init__(self):
+        critter.Critter.__init__(self)
+        self.on = False
+
+    def getMove(self, info):
+        self.on = not self.on
+        return critter.CENTER
+
+    def interact(self, oppInfo):
+        return critter.ROAR
+
+    def getColor(self):
+        return color.RED if self.on else color.BLUE
+
+    def getChar(self):
+        return 'B' if self.on else 'b'
+
+
+def test_frames_add_up_to_the_board():
+    model = critter_model.CritterModel(30, 20, threading.Lock(), seed=2)
+    model.reset(20, [pouncer.Pouncer, roarer.Roarer, Blinker])
+    model.track_changes()
+    frame = critter_runner.snapshot(model)
+    assert frame.full
+    drawn = dict(frame.glyphs)
+    for i in range(30):
+        model.update()
+        frame = critter_runner.snapshot(model)
+        assert not frame.full
+        drawn = critter_testing.draw(drawn, frame)
+        assert drawn == critter_testing.glyphs(model)
+
+
+class Rock(critter.Critter):
+    "Never moves, and never has to be asked."
+    DISCOVERABLE = False
+    MOVE_POLICY = critter.ConstantPolicy(critter.CENTER)
+    INTERACT_POLICY = critter.ConstantPolicy(critter.ROAR)
+
+    def getColor(self):
+        return color.GRAY
+
+    def getChar(self):
+        return 'o'
+
+
+def test_frames_only_cover_critters_that_might_have_changed():
+    model = critter_model.CritterModel(30, 20, threading.Lock(), seed=2)
+    model.reset(20, [Rock, Blinker])
+    model.track_changes()
+    critter_runner.snapshot(model)
+    model.update()
+    frame = critter_runner.snapshot(model)
+    blinkers = {(pos.x, pos.y) for c, pos in model.critter_positions.items() if isinstance(c, Blinker)}
+    assert set(frame.glyphs) == blinkers
@@ -0,0 +1,43 @@
+import color
+import critter
+import critter_model
+import critter_sandbox
+import threading
+import time
+
+
+class Dawdler(critter.Critter):
+    "Takes its time over every fight."
+    DISCOVERABLE = False
+
+    def getMove(self, info):
+        return info.random.choice((critter.NORTH, critter.SOUTH, critter.EAST, critter.WEST))
+
+    def interact(self, oppInfo):
+        time.sleep(0.008)
+        return critter.SCRATCH
+
+    def getColor(self):
+        return color.BLUE
+
+    def getChar(self):
+        return 'D'
+
+
+def test_the_tick_budget_covers_every_fight_in_the_tick():
+    tick_budget = 0.02
+    sandbox = critter_sandbox.Sandbox(call_budget=0.01, tick_budget=tick_budget, width=20, height=20, seed=1)
+    try:
+        model = critter_model.CritterModel(20, 20, threading.Lock(), seed=1)
+        model.reset(150, [sandbox.wrap(Dawdler)])
+        worst = 0
+        for i in range(10):
+            start = time.perf_counter()
+            model.update()
+            worst = max(worst, time.perf_counter() - start)
+        # A tick gets tick_budget, plus one call running over the end of
+        # it and the round trips; never fights x call_budget.
+        assert worst < 0.3
+        assert sandbox.flags['Dawdler']['tick'] > 0
+    finally:
+        sandbox.close()
@@ -0,0 +1,49 @@
+import critter_model
+import critter_testing
+import pouncer
+import randomizer
+import scratcher
+import threading
+
+CLASSES = (pouncer.Pouncer, randomizer.Randomizer, scratcher.Scratcher)
+
+
+def copy_onto(source, backend):
+    "Makes a model on backend with the same critters, board and random state as source."
+    model = critter_model.CritterModel(source.width, source.height, threading.Lock(), backend=backend)
+    for c in source.critters:
+        pos = source.critter_positions[c]
+        twin = c.__class__()
+        model.critters.append(twin)
+        model.critter_positions[twin] = pos
+        model.grid[pos.x][pos.y] = twin
+    for critter_class, state in source.critter_class_states.items():
+        twin = critter_model.ClassInfo(state.wins, state.alive, state.count, state.karma)
+        twin.health = state.health
+        model.critter_class_states[critter_class] = twin
+    model.random.setstate(source.random.getstate())
+    return model
+
+
+def test_sparse_runs_the_same_as_list_from_the_same_board():
+    for seed in range(4):
+        listed = critter_model.CritterModel(40, 30, threading.Lock(), seed=seed)
+        listed.reset(40, list(CLASSES))
+        sparse = copy_onto(listed, 'sparse')
+        for i in range(100):
+            listed.update()
+            sparse.update()
+        assert critter_testing.board(listed) == critter_testing.board(sparse)
+        assert listed.stats() == sparse.stats()
+
+
+def test_sparse_placement_is_reproducible_but_its_own():
+    boards = []
+    for attempt in range(2):
+        model = critter_model.CritterModel(40, 30, threading.Lock(), backend='sparse', seed=7)
+        model.reset(40, list(CLASSES))
+        boards.append(critter_testing.board(model))
+    assert boards[0] == boards[1]
+    listed = critter_model.CritterModel(40, 30, threading.Lock(), seed=7)
+    listed.reset(40, list(CLASSES))
+    assert critter_testing.board(listed) != boards[0]